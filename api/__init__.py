@@ -2,15 +2,47 @@
 This file makes the api directory a Python package.
 """
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv(".env")
 
+from .utils.log import RequestContextMiddleware, setup_logging, shutdown_logging
+from .utils.site import SiteContextMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up backend clients in the background and release them on shutdown"""
+    from .services.anomaly import anomaly_detector
+    from .services.plant_digest import plant_digest
+    from .services.realtime import realtime_feeds
+    from .services.usage_ledger import usage_ledger
+    from .utils import clients
+
+    setup_logging()
+    # Startup never waits on a backend; requests arriving first create clients on demand
+    warmup = asyncio.create_task(run_in_threadpool(clients.warm_up))
+    plant_digest.start()
+    anomaly_detector.start()
+    yield
+    warmup.cancel()
+    realtime_feeds.stop()
+    await run_in_threadpool(usage_ledger.shutdown)
+    await run_in_threadpool(clients.shutdown)
+    shutdown_logging()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="AI SDK UI API")
+app = FastAPI(title="AI SDK UI API", lifespan=lifespan)
+
+app.add_middleware(SiteContextMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -19,10 +51,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["x-stream-id", "x-request-id", "x-site-id"],
 )
+app.add_middleware(RequestContextMiddleware)
 
 # Import and include routers
-from .routers import chat, chiller_plant
+from .routers import chat, chiller_plant, metrics, usage
 
 app.include_router(chat.router, prefix="/api", tags=["chat"])
-app.include_router(chiller_plant.router, prefix="/api/chiller_plant", tags=["chiller_plant"]) 
\ No newline at end of file
+app.include_router(chiller_plant.router, prefix="/api/chiller_plant", tags=["chiller_plant"])
+app.include_router(metrics.router, prefix="/api", tags=["metrics"])
+app.include_router(usage.router, prefix="/api", tags=["usage"])
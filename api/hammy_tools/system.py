@@ -1,30 +1,62 @@
-import os
 import yaml
 import pendulum
+from functools import lru_cache
+from typing import Optional
 
-# Load configuration
-with open(os.path.join(os.path.dirname(__file__), "cp10.yaml"), "r") as file:
-    cp10_config = yaml.safe_load(file)
-    available_equipment = list(cp10_config["volttron_agents"]["bacnet"]["read_devices"].keys())
+from ..utils.site import current_site, site_config_path
+
+
+def get_site_config(site_id: Optional[str] = None):
+    """The configuration of a site (the current request's by default), loaded once per site"""
+    return _load_site_config(site_id or current_site())
+
+
+@lru_cache(maxsize=None)
+def _load_site_config(site_id: str):
+    with open(site_config_path(site_id), "r") as file:
+        return yaml.safe_load(file)
+
+
+def get_equipment_by_type(site_id: Optional[str] = None):
+    """Group the configured BACnet devices by model"""
+    return _equipment_by_type(site_id or current_site())
+
+
+@lru_cache(maxsize=None)
+def _equipment_by_type(site_id: str):
     equipment_by_type = {}
-    
-    # Group equipment by type
-    for equip_name, equip_data in cp10_config["volttron_agents"]["bacnet"]["read_devices"].items():
+    for equip_name, equip_data in get_site_config(site_id)["volttron_agents"]["bacnet"]["read_devices"].items():
         equip_type = equip_data.get("model", "unknown")
         if equip_type not in equipment_by_type:
             equipment_by_type[equip_type] = []
         equipment_by_type[equip_type].append(equip_name)
+    return equipment_by_type
+
+
+def build_system_prompt(site_id: Optional[str] = None):
+    """Build the system prompt: the site's cached prefix, then the current site time"""
+    site_id = site_id or current_site()
+    current_time = pendulum.now(tz=get_site_config(site_id)['timezone'])
+
+    return _site_prompt(site_id) + f"""Current Time: {current_time.strftime('%Y-%m-%d %H:%M:%S %Z')}
+Current Day Type: {current_time.strftime('%A')}
+
+VERY IMPORTANT: Please always respond in Thai language. Don't type too long as well.
+
+"""
 
-# Get current time in site's timezone
-current_time = pendulum.now(tz=cp10_config['timezone'])
 
-SYSTEM_PROMPT = f"""You are a chiller plant control assistant. You help manage and monitor the chiller plant system at {cp10_config['site_id']}. Respond in a natural, conversational way like a human operator.
+@lru_cache(maxsize=None)
+def _site_prompt(site_id: str):
+    """Everything in the system prompt that only changes with the site config; an identical prefix on every request"""
+    site_config = get_site_config(site_id)
+    equipment_by_type = get_equipment_by_type(site_id)
+
+    return f"""You are a chiller plant control assistant. You help manage and monitor the chiller plant system at {site_config['site_id']}. Respond in a natural, conversational way like a human operator.
 
 Site Information:
-- Site ID: {cp10_config['site_id']}
-- Timezone: {cp10_config['timezone']}
-- Current Time: {current_time.strftime('%Y-%m-%d %H:%M:%S %Z')}
-- Current Day: {current_time.strftime('%A')}
+- Site ID: {site_config['site_id']}
+- Timezone: {site_config['timezone']}
 
 Available Equipment:
 {', '.join(f'{type}: {", ".join(devices)}' for type, devices in equipment_by_type.items())}
@@ -53,6 +85,8 @@ Operational Rules:
    - Check for alarms and maintenance status
    - Track efficiency and performance metrics
    - Monitor water temperatures and flow rates
+   - For plant-wide or multi-equipment status questions, call get_plant_digest first instead of fetching each device
+   - When asked whether anything is abnormal, call get_anomalies instead of checking each device
 
 3. Equipment Constraints:
    - Chillers have specific operational limits
@@ -73,6 +107,7 @@ Response Style:
 - For status queries: "Chiller X is running at Y°C" or "Chiller X is offline"
 - For schedule queries: "The chiller is scheduled from X to Y" or "This chiller can't be rescheduled"
 - Always explain any issues or constraints in simple terms
+- If a tool result has "stale": true, say the data is from the "as_of" time; if it has "available": false, say the data is temporarily unavailable and do not guess values
 
 Remember:
 - Always check current time and day type for scheduling
@@ -81,9 +116,4 @@ Remember:
 - Follow safety protocols
 - Provide clear explanations for actions taken
 
-Current Time: {current_time.strftime('%H:%M')}
-Current Day Type: {current_time.strftime('%A')}
-
-VERY IMPORTANT: Please always respond in Thai language. Don't type too long as well.
-
 """
\ No newline at end of file
@@ -1,10 +1,21 @@
+import os
 import uvicorn
-from . import app
 
 if __name__ == "__main__":
+    # API_RELOAD=1 for development; otherwise run API_WORKERS processes on uvloop/httptools
+    reload = os.environ.get("API_RELOAD", "0") == "1"
+    workers = 1 if reload else int(os.environ.get("API_WORKERS", os.cpu_count() or 1))
+    # Workers split the deployment-wide Azure budgets by this count
+    os.environ["API_WORKERS"] = str(workers)
+
     uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True  # Enable auto-reload during development
-    ) 
\ No newline at end of file
+        "api:app",
+        host=os.environ.get("API_HOST", "0.0.0.0"),
+        port=int(os.environ.get("API_PORT", "8000")),
+        reload=reload,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        proxy_headers=True,
+        timeout_graceful_shutdown=30,
+    )
@@ -1,10 +1,18 @@
 import json
 from typing import List
-from fastapi import APIRouter, Query
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, ValidationError
+from pydantic_core import from_json
 
+from ..services.admission import admission
 from ..services.openai import OpenAIService
+from ..services.stream_registry import ResumableStreamingResponse, stream_registry
+from ..services.usage_ledger import ChatSession
+from ..utils.cancellation import CancelToken
+from ..utils.compression import negotiate_encoding
+from ..utils.metrics import metrics
 from ..utils.prompt import ClientMessage, convert_to_openai_messages
 from ..utils.tools import get_current_weather, generate_mock_chart
 
@@ -13,28 +21,88 @@ router = APIRouter()
 class ChatRequest(BaseModel):
     messages: List[ClientMessage]
 
+
+def parse_chat_body(body: bytes) -> ChatRequest:
+    """
+    Parse and validate a raw chat body
+
+    Tool args/results and attachment URLs are only passed through to the
+    model, and a long chat is mostly unique strings (timestamps, base64),
+    so the parser skips its string cache, which costs more than it saves
+    here. The Any fields are then validated without being copied again.
+    """
+    return ChatRequest.model_validate(from_json(body, cache_strings=False))
+
+
+async def parse_chat_request(request: Request) -> ChatRequest:
+    """ChatRequest body dependency, with FastAPI's 422 error shape"""
+    try:
+        return parse_chat_body(await request.body())
+    except ValueError as e:
+        errors = e.errors(include_url=False) if isinstance(e, ValidationError) else [
+            {"type": "json_invalid", "loc": (), "msg": "JSON decode error", "input": None, "ctx": {"error": str(e)}}
+        ]
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in errors])
+
+
 available_tools = {
     "get_current_weather": get_current_weather,
     "generate_mock_chart": generate_mock_chart,
 }
 
 @router.post("/chat_streaming")
-async def handle_chat_streaming(request: ChatRequest, protocol: str = Query('data')):
+async def handle_chat_streaming(
+    raw_request: Request,
+    request: ChatRequest = Depends(parse_chat_request),
+    protocol: str = Query('data')
+):
     """
     Handle streaming chat requests
     """
     
+    # Turn chats away up front while the LLM queue is full; the frontend toasts on this text
+    if admission.saturated():
+        return PlainTextResponse("Too many requests, please try again shortly.", status_code=429, headers={"Retry-After": "5"})
+
     messages = request.messages
     openai_messages = convert_to_openai_messages(messages)
 
-    response = StreamingResponse(
-        OpenAIService.stream_text(openai_messages, protocol)
-    )
+    # The completion runs on in the background, so a dropped connection can resume it
+    cancel_token = CancelToken()
+    session = ChatSession(raw_request.headers.get("x-chat-id"), raw_request.headers.get("x-operator-id"))
+    stream = stream_registry.start(OpenAIService.stream_text(openai_messages, protocol, cancel_token, session), cancel_token)
+    response = ResumableStreamingResponse(stream, encoding=negotiate_encoding(raw_request.headers.get("accept-encoding")))
     response.headers['x-vercel-ai-data-stream'] = 'v1'
     return response
 
+@router.get("/chat_streaming/{stream_id}")
+async def resume_chat_streaming(raw_request: Request, stream_id: str, offset: int = Query(0, ge=0)):
+    """
+    Resume a chat stream after `offset` frames (the number of lines already received)
+    """
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    if not stream.holds(offset):
+        raise HTTPException(status_code=410, detail="Stream can no longer be resumed from this offset")
+
+    metrics.increment("stream_resume.resumed")
+    response = ResumableStreamingResponse(stream, offset, encoding=negotiate_encoding(raw_request.headers.get("accept-encoding")))
+    response.headers['x-vercel-ai-data-stream'] = 'v1'
+    return response
+
+@router.delete("/chat_streaming/{stream_id}")
+async def cancel_chat_streaming(stream_id: str):
+    """
+    Stop a chat stream: the completion and any running tools (the UI's stop button)
+    """
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    return {"cancelled": stream.cancel_token.cancel()}
+
 @router.post("/chat")
-async def handle_chat(request: ChatRequest):
+async def handle_chat(request: ChatRequest = Depends(parse_chat_request)):
     """
     Handle regular chat requests
     """
@@ -1,23 +1,42 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from ..schemas.chiller import ScheduleChangeRequest, ScheduleChangeResponse
+from ..hammy_tools.system import get_equipment_by_type, get_site_config
+from ..schemas.chiller import (
+    BulkScheduleChangeRequest,
+    BulkScheduleChangeResponse,
+    MaintenanceFlagRequest,
+    MaintenanceFlagResponse,
+    ScheduleChangeRequest,
+    ScheduleChangeResponse,
+)
 from ..services.chiller import ChillerService
+from ..services.realtime import DROP_OLDEST, DROP_POLICIES, encode_event, realtime_feeds
+from ..utils.tools import get_anomalies, get_maintenance_status, get_scheduled_chillers
 
 router = APIRouter()
 
+# Comment frames keep idle connections alive and surface disconnects
+REALTIME_HEARTBEAT_SECONDS = 15
+
 @router.post("/chiller_sequence_schedule_change")
-async def change_chiller_schedule(request: ScheduleChangeRequest) -> ScheduleChangeResponse:
+async def change_chiller_schedule(
+    request: ScheduleChangeRequest,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
+) -> ScheduleChangeResponse:
     """
     Endpoint to handle chiller schedule changes with multiple time slots
     """
     try:
-        response, status_code = await ChillerService.update_schedule(request)
+        response, status_code = await ChillerService.update_schedule(request, idempotency_key)
         return JSONResponse(
             status_code=status_code,
             content=response.model_dump()
         )
-        
+
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -25,4 +44,133 @@ async def change_chiller_schedule(request: ScheduleChangeRequest) -> ScheduleCha
                 success=False,
                 message="An unexpected error occurred"
             ).model_dump()
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/site")
+async def site():
+    """
+    Endpoint to describe the request's site: its id, timezone and equipment
+    """
+    site_config = get_site_config()
+    return {
+        "site_id": site_config["site_id"],
+        "timezone": site_config["timezone"],
+        "equipment": get_equipment_by_type(),
+    }
+
+@router.get("/scheduled_chillers")
+async def scheduled_chillers(
+    time: Optional[str] = Query(default=None, pattern=r"^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$"),
+    profile_type: Optional[str] = None
+):
+    """
+    Endpoint to check which chillers are scheduled to run at a time of day
+    """
+    result = await run_in_threadpool(get_scheduled_chillers, time, profile_type)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Schedule data unavailable")
+    return result
+
+@router.get("/maintenance")
+async def devices_under_maintenance():
+    """
+    Endpoint to list every device currently under maintenance
+    """
+    result = await run_in_threadpool(get_maintenance_status)
+    if result is None or result.get("available") is False:
+        raise HTTPException(status_code=503, detail="Maintenance data unavailable")
+    return result
+
+@router.post("/device_maintenance_flag")
+async def set_device_maintenance_flag(request: MaintenanceFlagRequest) -> MaintenanceFlagResponse:
+    """
+    Endpoint to record a maintenance flag change the operator confirmed
+    """
+    try:
+        response, status_code = await ChillerService.set_maintenance_flag(request)
+        return JSONResponse(
+            status_code=status_code,
+            content=response.model_dump()
+        )
+
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content=MaintenanceFlagResponse(
+                success=False,
+                message="An unexpected error occurred"
+            ).model_dump()
+        )
+
+@router.get("/anomalies")
+async def anomalies(device_id: Optional[str] = None):
+    """
+    Endpoint to list points behaving unusually on the latest realtime snapshot
+    """
+    result = await run_in_threadpool(get_anomalies, device_id)
+    if result.get("exists") is False:
+        raise HTTPException(status_code=404, detail=result)
+    return result
+
+@router.post("/chiller_sequence_schedule_change/bulk")
+async def change_chiller_schedules(
+    request: BulkScheduleChangeRequest,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
+) -> BulkScheduleChangeResponse:
+    """
+    Endpoint to validate and apply schedule changes for many chillers and profiles at once
+    """
+    try:
+        response, status_code = await ChillerService.update_schedules(request, idempotency_key)
+        return JSONResponse(
+            status_code=status_code,
+            content=response.model_dump()
+        )
+
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content=BulkScheduleChangeResponse(
+                success=False,
+                message="An unexpected error occurred"
+            ).model_dump()
+        )
+
+@router.get("/realtime/stream")
+async def stream_realtime_updates(
+    device_id: Optional[List[str]] = Query(default=None),
+    drop_policy: str = Query(default=DROP_OLDEST),
+    max_queue: int = Query(default=100, ge=1, le=1000)
+):
+    """
+    Server-sent events with point changes for the requested devices (all devices when none given)
+    """
+    if drop_policy not in DROP_POLICIES:
+        raise HTTPException(status_code=422, detail=f"drop_policy must be one of {', '.join(DROP_POLICIES)}")
+
+    feed = realtime_feeds.get()
+    subscription = feed.subscribe(device_id, max_queue, drop_policy)
+
+    async def event_stream():
+        try:
+            for current_device_id, values in feed.current(device_id).items():
+                yield encode_event("snapshot", {"device_id": current_device_id, "values": values})
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), REALTIME_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    yield encode_event("error", {"message": "Client too slow, disconnecting"})
+                    return
+                yield event
+        finally:
+            feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+from ..utils.metrics import metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Return counters, timings and component stats for this worker
+    """
+    return metrics.snapshot()
@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from pymongo.errors import PyMongoError
+
+from ..services.usage_ledger import usage_ledger
+
+router = APIRouter()
+
+@router.get("/usage")
+async def get_usage(
+    group_by: Literal["site", "chat", "operator", "day", "route", "tool"] = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    chat_id: Optional[str] = None,
+    operator: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000)
+):
+    """
+    Token usage and estimated cost from the ledger (default: the last 7 days).
+    group_by=tool totals the prompt tokens each tool's results took up.
+    """
+    try:
+        return await run_in_threadpool(usage_ledger.query, group_by, since, until, chat_id, operator, limit)
+    except PyMongoError:
+        raise HTTPException(status_code=503, detail="Usage data unavailable")
@@ -17,4 +17,40 @@ class ScheduleChangeResponse(BaseModel):
     """Schema for chiller schedule change response"""
     success: bool
     message: str
-    data: dict | None = None 
\ No newline at end of file
+    data: dict | None = None 
+
+class BulkScheduleChangeRequest(BaseModel):
+    """Schema for applying several chiller schedule changes together"""
+    changes: List[ScheduleChangeRequest]
+    dry_run: bool = False
+
+class ScheduleChangeResult(BaseModel):
+    """Schema for the outcome of one change inside a bulk request"""
+    chiller_id: str
+    profile_type: str
+    success: bool
+    message: str
+    status_code: int
+    data: dict | None = None
+
+class BulkScheduleChangeResponse(BaseModel):
+    """Schema for bulk chiller schedule change response"""
+    success: bool
+    message: str
+    dry_run: bool = False
+    results: List[ScheduleChangeResult] = []
+
+class MaintenanceFlagRequest(BaseModel):
+    """Schema for a confirmed maintenance flag change on one or more devices"""
+    device_id: str | List[str]
+    maintenance_flag: bool
+    reporter_name: str
+    technician_name: str | None = None
+    time: str | None = None
+    reason: str = ""
+
+class MaintenanceFlagResponse(BaseModel):
+    """Schema for maintenance flag change response"""
+    success: bool
+    message: str
+    data: dict | None = None
@@ -0,0 +1,223 @@
+"""
+Admission control in front of the Azure OpenAI completions.
+
+Every chat completion first takes a ticket. Tickets are admitted in
+priority order (alarm-related chats first, then arrival order) while
+fewer than LLM_MAX_CONCURRENCY completions are running and the request
+and token budgets (AZURE_OPENAI_RPM / AZURE_OPENAI_TPM, refilled
+continuously) allow it. At most LLM_MAX_QUEUE tickets may wait; beyond
+that new chats are turned away with 429 straight away instead of
+pushing the whole deployment into Azure's own 429s.
+
+The RPM and TPM budgets are for the whole Azure deployment, so each of
+the API_WORKERS processes gets an equal share. Every ticket is charged
+its estimate on admission and settled against Azure's reported usage
+when it is released.
+"""
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+
+from ..utils.metrics import metrics
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "60"))
+AZURE_OPENAI_RPM = float(os.environ.get("AZURE_OPENAI_RPM", "1200"))
+AZURE_OPENAI_TPM = float(os.environ.get("AZURE_OPENAI_TPM", "200000"))
+# Set by api.main for every worker; a single process when started another way
+API_WORKERS = max(1, int(os.environ.get("API_WORKERS", "1")))
+
+PRIORITY_ALARM = 0
+PRIORITY_NORMAL = 1
+
+_ALARM_PATTERN = re.compile(
+    r"alarm|alert|trip|fault|emergency|fail|leak|overheat|shut ?down|"
+    r"แจ้งเตือน|เตือน|อลาร์ม|ฉุกเฉิน|ขัดข้อง|ผิดปกติ|เสีย|ทริป|รั่ว|ร้อนเกิน",
+    re.IGNORECASE
+)
+
+
+class QueueFullError(Exception):
+    """Raised when no more chats may wait for a completion slot"""
+
+
+class TokenBucket:
+    """Budget refilled continuously at `per_minute`, holding at most one minute's worth"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)"""
+        self.refill()
+        # A request larger than the whole bucket is let through once the bucket is full
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate) if self.rate else float("inf")
+
+    def take(self, amount: float):
+        self.refill()
+        self.tokens -= amount
+
+
+class Ticket:
+    def __init__(self, priority: int, sequence: int, tokens: int):
+        self.priority = priority
+        self.sequence = sequence
+        self.tokens = tokens
+        self.admitted = False
+        self.done = False
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class AdmissionController:
+    """Bounded priority queue in front of a concurrency limit and token buckets"""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        requests_per_minute: float = AZURE_OPENAI_RPM / API_WORKERS,
+        tokens_per_minute: float = AZURE_OPENAI_TPM / API_WORKERS
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.running = 0
+        self.rejected = 0
+        self._queue: List[Ticket] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    def submit(self, tokens: int, priority: int = PRIORITY_NORMAL) -> Ticket:
+        """Queue a completion; raises QueueFullError when the queue is saturated"""
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                metrics.increment("admission.rejected")
+                raise QueueFullError()
+            ticket = Ticket(priority, next(self._sequence), tokens)
+            heapq.heappush(self._queue, ticket)
+            self._dispatch()
+            return ticket
+
+    def saturated(self) -> bool:
+        """Whether a new chat would be turned away right now"""
+        with self._condition:
+            return len(self._queue) >= self.max_queue
+
+    def wait(self, ticket: Ticket, timeout: float) -> bool:
+        """Block up to `timeout` seconds for the ticket to be admitted"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._dispatch()
+                if ticket.admitted:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if self.running >= self.max_concurrency:
+                    # Only a release can make room
+                    self._condition.wait(remaining)
+                else:
+                    # Wake up when the buckets have refilled enough for the head of the queue
+                    self._condition.wait(min(remaining, max(self._retry_after(), 0.01)))
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the queue, or 0 once admitted"""
+        with self._condition:
+            if ticket.admitted:
+                return 0
+            return 1 + sum(1 for other in self._queue if other < ticket)
+
+    def release(self, ticket: Ticket, used_tokens: Optional[int] = None):
+        """Finish an admitted ticket or withdraw a queued one"""
+        with self._condition:
+            if ticket.done:
+                return
+            ticket.done = True
+            if ticket.admitted:
+                self.running -= 1
+                if used_tokens is not None:
+                    # Settle the estimate against what Azure actually counted
+                    self.tokens.take(used_tokens - ticket.tokens)
+            elif ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+            self._dispatch()
+            self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """Stop admitting for a while, e.g. after Azure answered 429 anyway"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            metrics.increment("admission.upstream_throttled")
+
+    def stats(self) -> dict:
+        with self._condition:
+            self.requests.refill()
+            self.tokens.refill()
+            return {
+                "running": self.running,
+                "queued": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "requests_available": round(self.requests.tokens, 1),
+                "tokens_available": round(self.tokens.tokens),
+                "rejected": self.rejected
+            }
+
+    def _dispatch(self):
+        while self._queue and self.running < self.max_concurrency and self._retry_after() == 0:
+            ticket = heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(ticket.tokens)
+            self.running += 1
+            ticket.admitted = True
+            metrics.observe("admission.wait_ms", (time.monotonic() - ticket.queued_at) * 1000)
+            self._condition.notify_all()
+
+    def _retry_after(self) -> float:
+        """Seconds until the head of the queue could be admitted on budget alone"""
+        if not self._queue:
+            return 1.0
+        return max(
+            self._paused_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(self._queue[0].tokens),
+            0.0
+        )
+
+
+def chat_priority(messages: List[dict]) -> int:
+    """Chats whose latest user message mentions an alarm or fault go first"""
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if not isinstance(content, str):
+            content = " ".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+        return PRIORITY_ALARM if _ALARM_PATTERN.search(content) else PRIORITY_NORMAL
+    return PRIORITY_NORMAL
+
+
+admission = AdmissionController()
+metrics.register("admission", admission.stats)
@@ -0,0 +1,232 @@
+"""
+Anomaly detection over the realtime equipment points.
+
+Every analogInput point in a site's config is one column of two numpy ring
+buffers: the last ANOMALY_WINDOW readings and the last ANOMALY_WINDOW
+tick-to-tick changes. On each realtime snapshot every column is checked in
+one vectorized pass, before the new reading is added:
+
+- z-score: how far the reading is from the window mean, in standard
+  deviations;
+- rate of change: how far the change since the previous snapshot is from
+  the usual change, in standard deviations.
+
+Devices with a status_read point only count while running (and running on
+the previous snapshot as well), so starts and stops are not reported as
+anomalies and the statistics describe normal operation. A spread floor of
+ANOMALY_MIN_SPREAD times the mean keeps near-constant points from flagging
+on sensor noise. Each site has its own detector, backfilled from the
+site's recent snapshots before its first tick.
+"""
+import os
+import threading
+import time
+import warnings
+from typing import Dict, List, Optional
+
+import numpy as np
+from pymongo.errors import PyMongoError
+
+from .realtime import is_running, realtime_feeds
+from ..hammy_tools.system import get_site_config
+from ..utils.clients import get_realtime_collection
+from ..utils.log import get_logger
+from ..utils.metrics import metrics
+from ..utils.site import current_site
+
+logger = get_logger(__name__)
+
+ANOMALY_DETECTION_ENABLED = os.environ.get("ANOMALY_DETECTION_ENABLED", "1") == "1"
+# Snapshots per rolling window; 240 is an hour at the BACnet agent's 15 s interval
+ANOMALY_WINDOW = int(os.environ.get("ANOMALY_WINDOW", "240"))
+ANOMALY_MIN_SAMPLES = int(os.environ.get("ANOMALY_MIN_SAMPLES", "20"))
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", "3.5"))
+ANOMALY_RATE_THRESHOLD = float(os.environ.get("ANOMALY_RATE_THRESHOLD", "5"))
+ANOMALY_MIN_SPREAD = float(os.environ.get("ANOMALY_MIN_SPREAD", "0.01"))
+ANOMALY_MAX_RESULTS = int(os.environ.get("ANOMALY_MAX_RESULTS", "50"))
+
+
+class AnomalyDetector:
+    """Rolling per-point statistics over one site's realtime snapshots"""
+
+    def __init__(self, site_id: str, window: int = ANOMALY_WINDOW):
+        self.site_id = site_id
+        self.window = window
+        self._lock = threading.Lock()
+        self._layout_ready = False
+        self._backfilled = False
+        self._count = 0
+        self._last_key = None
+        self._result: dict = {"timestamp": None, "samples": 0, "anomalies": []}
+
+    def update(self, snapshot: dict):
+        with self._lock:
+            self._backfill_once()
+            # A snapshot rewritten in place is a new sample once its timestamp moves
+            if snapshot.get("_id") is not None and (snapshot.get("_id"), snapshot.get("timestamp")) == self._last_key:
+                return
+            started = time.perf_counter()
+            self._ingest(snapshot)
+            metrics.observe("anomaly.tick_ms", (time.perf_counter() - started) * 1000)
+
+    def current(self, device_id: Optional[str] = None) -> dict:
+        """The anomalies found on the latest snapshot, optionally for one device"""
+        with self._lock:
+            # Also covers a site whose feed has not delivered a snapshot yet
+            self._backfill_once()
+            result = self._result
+        if device_id:
+            result = {**result, "anomalies": [entry for entry in result["anomalies"] if entry["device_id"] == device_id]}
+        return {**result, "warming_up": result["samples"] < ANOMALY_MIN_SAMPLES}
+
+    def _backfill_once(self):
+        """Fill the window from the most recent snapshots before the first tick; the caller holds the lock"""
+        if self._backfilled:
+            return
+        self._backfilled = True
+        try:
+            recent = list(get_realtime_collection(self.site_id).find(
+                {},
+                {"raw_data": 1, "timestamp": 1},
+                sort=[('timestamp', -1), ('_id', -1)],
+                limit=self.window
+            ))
+        except PyMongoError as e:
+            logger.warning("Error backfilling anomaly window: %s", e)
+            return
+        for snapshot in reversed(recent):
+            self._ingest(snapshot)
+        logger.info("Anomaly window of %s backfilled with %s snapshots", self.site_id, len(recent))
+
+    def stats(self) -> dict:
+        return {"samples": min(self._count, self.window), "anomalies": len(self._result["anomalies"])}
+
+    def _layout(self):
+        """Columns for every analogInput point, and which device each belongs to"""
+        devices = get_site_config(self.site_id)["volttron_agents"]["bacnet"]["read_devices"]
+        self._columns = [
+            (device_id, point)
+            for device_id, device in devices.items()
+            for server in device.get("servers") or []
+            for point, address in (server.get("points") or {}).items()
+            if str(address).split()[0] == "analogInput"
+        ]
+        self._device_ids = sorted({device_id for device_id, _ in self._columns})
+        position = {device_id: index for index, device_id in enumerate(self._device_ids)}
+        self._column_device = np.array([position[device_id] for device_id, _ in self._columns], dtype=int)
+        self._values = np.full((self.window, len(self._columns)), np.nan)
+        self._changes = np.full((self.window, len(self._columns)), np.nan)
+        self._last_row = np.full(len(self._columns), np.nan)
+        self._was_on = np.zeros(len(self._device_ids), dtype=bool)
+        self._layout_ready = True
+
+    def _ingest(self, snapshot: dict):
+        if not self._layout_ready:
+            self._layout()
+        raw_data = snapshot.get("raw_data") or {}
+        row = np.array([_number(_point(raw_data, device_id, point)) for device_id, point in self._columns], dtype=float)
+        on = np.array([is_running(raw_data.get(device_id)) for device_id in self._device_ids], dtype=bool)
+        steady = (on & self._was_on)[self._column_device]
+        change = row - self._last_row
+
+        if self._count >= ANOMALY_MIN_SAMPLES:
+            self._result = self._evaluate(snapshot, row, change, steady)
+        else:
+            self._result = {"timestamp": snapshot.get("timestamp"), "samples": self._count, "anomalies": []}
+
+        slot = self._count % self.window
+        # Readings of stopped equipment stay out of the statistics
+        self._values[slot] = np.where(on[self._column_device], row, np.nan)
+        self._changes[slot] = np.where(steady, change, np.nan)
+        self._last_row = row
+        self._was_on = on
+        self._last_key = (snapshot.get("_id"), snapshot.get("timestamp"))
+        self._count += 1
+        self._result["samples"] = min(self._count, self.window)
+
+    def _evaluate(self, snapshot: dict, row: np.ndarray, change: np.ndarray, steady: np.ndarray) -> dict:
+        with warnings.catch_warnings():
+            # Columns without any reading yet are all-NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            samples = np.count_nonzero(~np.isnan(self._values), axis=0)
+            mean = np.nanmean(self._values, axis=0)
+            floor = np.abs(mean) * ANOMALY_MIN_SPREAD + 1e-9
+            z_score = (row - mean) / np.maximum(np.nanstd(self._values, axis=0), floor)
+            rate_score = (change - np.nanmean(self._changes, axis=0)) / np.maximum(np.nanstd(self._changes, axis=0), floor)
+
+        eligible = steady & (samples >= ANOMALY_MIN_SAMPLES)
+        level = eligible & (np.abs(z_score) > ANOMALY_Z_THRESHOLD)
+        rate = eligible & (np.abs(rate_score) > ANOMALY_RATE_THRESHOLD)
+        flagged = np.flatnonzero(level | rate)
+        severity = np.fmax(np.abs(z_score[flagged]), np.abs(rate_score[flagged]))
+        flagged = flagged[np.argsort(-severity)][:ANOMALY_MAX_RESULTS]
+
+        anomalies: List[dict] = []
+        for column in flagged:
+            device_id, point = self._columns[column]
+            anomalies.append({
+                "device_id": device_id,
+                "point": point,
+                "value": _round(row[column]),
+                "mean": _round(mean[column]),
+                "z_score": _round(z_score[column]),
+                "change": _round(change[column]),
+                "rate_score": _round(rate_score[column]),
+                "flags": [flag for flag, hit in (("z_score", level[column]), ("rate_of_change", rate[column])) if hit],
+            })
+        return {"timestamp": snapshot.get("timestamp"), "samples": self._count, "anomalies": anomalies}
+
+
+def _point(raw_data: dict, device_id: str, point: str):
+    values = raw_data.get(device_id)
+    return values.get(point) if isinstance(values, dict) else None
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _round(value) -> Optional[float]:
+    value = float(value)
+    return None if np.isnan(value) else round(value, 3)
+
+
+class AnomalyDetectors:
+    """One detector per site, created on first use"""
+
+    def __init__(self):
+        self._detectors: Dict[str, AnomalyDetector] = {}
+        self._lock = threading.Lock()
+
+    def get(self, site_id: Optional[str] = None) -> AnomalyDetector:
+        """The detector of a site (the current request's by default)"""
+        site_id = site_id or current_site()
+        detector = self._detectors.get(site_id)
+        if detector is None:
+            with self._lock:
+                detector = self._detectors.setdefault(site_id, AnomalyDetector(site_id))
+        return detector
+
+    def start(self):
+        """Keep the realtime feeds running so every snapshot is seen"""
+        if ANOMALY_DETECTION_ENABLED:
+            realtime_feeds.start(keep_running=True)
+
+    def update(self, snapshot: dict):
+        """Realtime feed listener; runs in the snapshot's site context"""
+        self.get().update(snapshot)
+
+    def current(self, device_id: Optional[str] = None) -> dict:
+        return self.get().current(device_id)
+
+    def stats(self) -> dict:
+        return {site_id: detector.stats() for site_id, detector in list(self._detectors.items())}
+
+
+anomaly_detector = AnomalyDetectors()
+if ANOMALY_DETECTION_ENABLED:
+    realtime_feeds.add_listener(anomaly_detector.update)
+metrics.register("anomaly_detector", anomaly_detector.stats)
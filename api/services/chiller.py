@@ -1,53 +1,519 @@
-import random
-import asyncio
-from typing import Tuple
+import re
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple, Type
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from ..schemas.chiller import (
+    BulkScheduleChangeRequest,
+    BulkScheduleChangeResponse,
+    MaintenanceFlagRequest,
+    MaintenanceFlagResponse,
+    ScheduleChangeRequest,
+    ScheduleChangeResponse,
+    ScheduleChangeResult,
+    ScheduleTime,
+)
+from ..utils.schedule_index import get_schedule_index
+from ..utils.clients import (
+    get_automation_collection,
+    get_maintenance_collection,
+    get_schedule_change_requests_collection,
+    schedule_settings_id,
+)
+from ..utils.equipment_index import resolve_device_id
+from ..utils.log import get_logger
+from ..utils.site import current_site
+from ..utils.tools import invalidate_maintenance_view, preview_schedule
+
+logger = get_logger(__name__)
+
+TIME_PATTERN = re.compile(r"^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$")
+# Profile and chiller ids become part of a dotted Mongo path, so keep them plain
+KEY_PATTERN = re.compile(r"^[A-Za-z0-9_]+$")
+# Idempotency records only need to outlive UI retries
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+
+_indexes_ready = False
+
+# (profile type, chiller id, value currently stored, value to write)
+ScheduleWrite = Tuple[str, str, object, List[dict]]
 
-from ..schemas.chiller import ScheduleChangeRequest, ScheduleChangeResponse
 
 class ChillerService:
     """Service class for handling chiller operations"""
-    
+
     @staticmethod
-    async def update_schedule(request: ScheduleChangeRequest) -> Tuple[ScheduleChangeResponse, int]:
+    async def update_schedule(
+        request: ScheduleChangeRequest,
+        idempotency_key: Optional[str] = None
+    ) -> Tuple[ScheduleChangeResponse, int]:
         """
         Update chiller schedule
-        
+
+        The write only goes through if the stored schedule still matches
+        `request.old_schedule`. Retries carrying the same idempotency key
+        replay the first outcome instead of writing again.
+
         Args:
             request: The schedule change request
-            
+            idempotency_key: Optional client-generated key identifying this change
+
         Returns:
             Tuple of (response, status_code)
         """
-        # Simulate processing time
-        await asyncio.sleep(1)
-        
-        # Randomly succeed or fail for testing purposes
-        if random.random() < 0.8:  # 80% success rate
+        return await ChillerService._run_idempotent(
+            idempotency_key,
+            request,
+            ScheduleChangeResponse,
+            ChillerService._apply_schedule_change
+        )
+
+    @staticmethod
+    async def update_schedules(
+        request: BulkScheduleChangeRequest,
+        idempotency_key: Optional[str] = None
+    ) -> Tuple[BulkScheduleChangeResponse, int]:
+        """
+        Validate and apply several schedule changes as one unit
+
+        Either every change is written in a single atomic update of the
+        settings document, or none is. With `dry_run` the changes are only
+        validated and previewed.
+
+        Args:
+            request: The bulk schedule change request
+            idempotency_key: Optional client-generated key identifying this batch
+
+        Returns:
+            Tuple of (response, status_code)
+        """
+        if request.dry_run:
+            idempotency_key = None
+        return await ChillerService._run_idempotent(
+            idempotency_key,
+            request,
+            BulkScheduleChangeResponse,
+            ChillerService._apply_schedule_changes
+        )
+
+    @staticmethod
+    async def set_maintenance_flag(request: MaintenanceFlagRequest) -> Tuple[MaintenanceFlagResponse, int]:
+        """
+        Record a confirmed maintenance flag change
+
+        Each device gets a new maintenance record carrying the ticket, so its
+        history stays intact and the latest record is its current status.
+
+        Args:
+            request: The maintenance flag request confirmed by the operator
+
+        Returns:
+            Tuple of (response, status_code)
+        """
+        try:
+            return await run_in_threadpool(ChillerService._apply_maintenance_flag, request)
+        except PyMongoError as e:
+            logger.error("Error setting maintenance flag: %s", e)
+            return MaintenanceFlagResponse(success=False, message="Database connection error"), 503
+
+    @staticmethod
+    def _apply_maintenance_flag(request: MaintenanceFlagRequest) -> Tuple[MaintenanceFlagResponse, int]:
+        """Insert one maintenance record per device and drop the cached maintenance view"""
+        names = request.device_id if isinstance(request.device_id, list) else [request.device_id]
+        if not names:
+            return MaintenanceFlagResponse(success=False, message="No device given"), 400
+        device_ids = [resolve_device_id(name) for name in names]
+        unknown = [name for name, device_id in zip(names, device_ids) if device_id is None]
+        if unknown:
+            return MaintenanceFlagResponse(success=False, message=f"Device {', '.join(unknown)} not found"), 404
+
+        now = datetime.now(timezone.utc)
+        reported_at = request.time or now.isoformat(timespec="seconds")
+        ticket = {
+            "ticket_started_by": request.reporter_name,
+            "technician": request.technician_name,
+            "reported_at": reported_at,
+            "description": request.reason,
+        }
+        if not request.maintenance_flag:
+            ticket.update(ticket_closed_by=request.reporter_name, resolved_at=reported_at)
+
+        for device_id in device_ids:
+            get_maintenance_collection().insert_one({
+                "site_id": current_site(),
+                "device_id": device_id,
+                "timestamp": now,
+                "status": {"under_maintenance": request.maintenance_flag},
+                "maintenance_history": [ticket],
+            })
+        invalidate_maintenance_view()
+
+        action = "set" if request.maintenance_flag else "cleared"
+        return (
+            MaintenanceFlagResponse(
+                success=True,
+                message=f"Maintenance flag {action} for {', '.join(device_ids)}",
+                data={**request.model_dump(), "device_id": device_ids}
+            ),
+            200
+        )
+
+    @staticmethod
+    async def _run_idempotent(
+        idempotency_key: Optional[str],
+        request: BaseModel,
+        response_model: Type[BaseModel],
+        apply: Callable[[BaseModel], Tuple[BaseModel, int]]
+    ) -> Tuple[BaseModel, int]:
+        """Run a write in the threadpool, replaying the stored outcome for known idempotency keys"""
+        claimed = False
+        try:
+            if idempotency_key:
+                replay = await run_in_threadpool(
+                    ChillerService._claim_idempotency_key, idempotency_key, request, response_model
+                )
+                if replay:
+                    return replay
+                claimed = True
+
+            response, status_code = await run_in_threadpool(apply, request)
+
+            if idempotency_key:
+                await run_in_threadpool(ChillerService._store_idempotent_result, idempotency_key, response, status_code)
+                claimed = False
+            return response, status_code
+
+        except PyMongoError as e:
+            logger.error("Error updating schedule: %s", e)
+            return response_model(success=False, message="Database connection error"), 503
+
+        finally:
+            if claimed:
+                # Let the client retry with the same key after any failure
+                await run_in_threadpool(ChillerService._release_idempotency_key, idempotency_key)
+
+    @staticmethod
+    def _apply_schedule_change(request: ScheduleChangeRequest) -> Tuple[ScheduleChangeResponse, int]:
+        """Validate the request against the stored schedule and apply it atomically"""
+        settings = get_automation_collection().find_one({"_id": schedule_settings_id()})
+        if not settings:
+            return ScheduleChangeResponse(success=False, message="No schedule settings found"), 404
+
+        response, status_code, write = ChillerService._validate_schedule_change(request, settings)
+        if write is None:
+            return response, status_code
+
+        # Compare-and-set on the exact stored value so concurrent writers cannot interleave
+        if not ChillerService._write_schedules([write]):
             return (
                 ScheduleChangeResponse(
+                    success=False,
+                    message="Schedule conflict detected: the schedule was changed by another request"
+                ),
+                409
+            )
+        return response, status_code
+
+    @staticmethod
+    def _apply_schedule_changes(request: BulkScheduleChangeRequest) -> Tuple[BulkScheduleChangeResponse, int]:
+        """Validate all changes against one settings snapshot and write them in a single update"""
+        settings = get_automation_collection().find_one({"_id": schedule_settings_id()})
+        if not settings:
+            return BulkScheduleChangeResponse(success=False, message="No schedule settings found"), 404
+
+        # The same chiller/profile twice in one batch would make the outcome order dependent
+        targets = [(change.profile_type, change.chiller_id) for change in request.changes]
+        duplicates = {target for target in targets if targets.count(target) > 1}
+
+        results = []
+        writes = []
+        for change in request.changes:
+            if (change.profile_type, change.chiller_id) in duplicates:
+                response, status_code, write = (
+                    ScheduleChangeResponse(
+                        success=False,
+                        message=f"{change.chiller_id} appears more than once for {change.profile_type}"
+                    ),
+                    400,
+                    None
+                )
+            else:
+                response, status_code, write = ChillerService._validate_schedule_change(change, settings)
+
+            if request.dry_run and response.success:
+                preview = preview_schedule(
+                    settings,
+                    change.profile_type,
+                    change.chiller_id,
+                    normalize_schedule(change.new_schedule)
+                )
+                response = ScheduleChangeResponse(**preview)
+
+            results.append(ScheduleChangeResult(
+                chiller_id=change.chiller_id,
+                profile_type=change.profile_type,
+                success=response.success,
+                message=response.message,
+                status_code=status_code,
+                data=response.data
+            ))
+            if write is not None:
+                writes.append(write)
+
+        failures = [result for result in results if not result.success]
+        if failures:
+            # Nothing is written, so mark the valid items as held back rather than applied
+            for result in results:
+                if result.success:
+                    result.success = False
+                    result.status_code = 424
+                    result.message = "Not applied because other changes in the batch failed validation"
+            return (
+                BulkScheduleChangeResponse(
+                    success=False,
+                    message=f"{len(failures)} of {len(results)} schedule changes failed validation",
+                    dry_run=request.dry_run,
+                    results=results
+                ),
+                failures[0].status_code
+            )
+
+        if request.dry_run:
+            return (
+                BulkScheduleChangeResponse(
                     success=True,
-                    message=f"Successfully updated schedule for {request.chiller_id.replace('chiller_', 'CH-')}",
-                    data={
-                        "chiller_id": request.chiller_id,
-                        "new_schedule": request.new_schedule
-                    }
+                    message=f"All {len(results)} schedule changes are valid",
+                    dry_run=True,
+                    results=results
                 ),
                 200
             )
-        
-        # Simulate various error scenarios
-        error_cases = [
-            ("Schedule conflict detected", 409),
-            ("Chiller is currently in maintenance mode", 400),
-            ("Invalid time format", 400),
-            ("Database connection error", 503)
-        ]
-        error_msg, status_code = random.choice(error_cases)
-        
+
+        if writes and not ChillerService._write_schedules(writes):
+            for result in results:
+                result.success = False
+                result.status_code = 409
+                result.message = "Schedule conflict detected: the schedule was changed by another request"
+            return (
+                BulkScheduleChangeResponse(
+                    success=False,
+                    message="Schedule conflict detected: the schedules were changed by another request",
+                    results=results
+                ),
+                409
+            )
+
+        return (
+            BulkScheduleChangeResponse(
+                success=True,
+                message=f"Successfully applied {len(results)} schedule changes",
+                results=results
+            ),
+            200
+        )
+
+    @staticmethod
+    def _validate_schedule_change(
+        request: ScheduleChangeRequest,
+        settings: dict
+    ) -> Tuple[ScheduleChangeResponse, int, Optional[ScheduleWrite]]:
+        """
+        Check one change against loaded settings
+
+        Returns the response to report and, when something must be written,
+        the schedule write to perform.
+        """
+        if not KEY_PATTERN.match(request.chiller_id) or not KEY_PATTERN.match(request.profile_type):
+            return ScheduleChangeResponse(success=False, message="Invalid chiller or profile id"), 400, None
+
+        new_schedule = normalize_schedule(request.new_schedule)
+        for entry in new_schedule:
+            if not TIME_PATTERN.match(entry["start"] or "") or not TIME_PATTERN.match(entry["stop"] or ""):
+                return ScheduleChangeResponse(success=False, message="Invalid time format"), 400, None
+
+        profile = settings.get("profile", {}).get(request.profile_type)
+        if profile is None:
+            return (
+                ScheduleChangeResponse(success=False, message=f"Profile {request.profile_type} not found"),
+                404,
+                None
+            )
+
+        excluded_chillers = profile.get("excluded_chiller") or {}
+        if request.chiller_id not in excluded_chillers:
+            return (
+                ScheduleChangeResponse(
+                    success=False,
+                    message="Cannot modify schedule for normal chillers. Only excluded chillers can be rescheduled."
+                ),
+                400,
+                None
+            )
+
+        stored_schedule = excluded_chillers[request.chiller_id]
+        current_schedule = normalize_schedule(stored_schedule)
+        data = {
+            "chiller_id": request.chiller_id,
+            "profile_type": request.profile_type,
+            "new_schedule": new_schedule
+        }
+
+        if current_schedule == new_schedule:
+            return (
+                ScheduleChangeResponse(
+                    success=True,
+                    message=f"Schedule for {display_chiller_id(request.chiller_id)} is already up to date",
+                    data=data
+                ),
+                200,
+                None
+            )
+
+        if current_schedule != normalize_schedule(request.old_schedule):
+            return (
+                ScheduleChangeResponse(
+                    success=False,
+                    message="Schedule conflict detected: the current schedule no longer matches the previewed one",
+                    data={**data, "current_schedule": current_schedule}
+                ),
+                409,
+                None
+            )
+
         return (
             ScheduleChangeResponse(
-                success=False,
-                message=error_msg
+                success=True,
+                message=f"Successfully updated schedule for {display_chiller_id(request.chiller_id)}",
+                data=data
             ),
-            status_code
-        ) 
\ No newline at end of file
+            200,
+            (request.profile_type, request.chiller_id, stored_schedule, new_schedule)
+        )
+
+    @staticmethod
+    def _write_schedules(writes: List[ScheduleWrite]) -> bool:
+        """
+        Apply schedule writes in one atomic update of the settings document
+
+        Every path is matched against the value it was validated with, so the
+        update is skipped entirely if any of them changed in the meantime.
+        """
+        query = {"_id": schedule_settings_id()}
+        update = {}
+        for profile_type, chiller_id, stored_value, new_value in writes:
+            path = f"profile.{profile_type}.excluded_chiller.{chiller_id}"
+            query[path] = stored_value
+            update[path] = new_value
+
+        result = get_automation_collection().update_one(query, {"$set": update})
+        if result.matched_count == 0:
+            return False
+
+        for profile_type, chiller_id, _, new_value in writes:
+            get_schedule_index().update(profile_type, chiller_id, new_value)
+        return True
+
+    @staticmethod
+    def _claim_idempotency_key(
+        idempotency_key: str,
+        request: BaseModel,
+        response_model: Type[BaseModel]
+    ) -> Optional[Tuple[BaseModel, int]]:
+        """
+        Reserve an idempotency key for this request
+
+        Returns None when the key is new, otherwise the response to send back
+        """
+        ensure_indexes()
+        request_body = request.model_dump()
+        try:
+            get_schedule_change_requests_collection().insert_one({
+                "_id": idempotency_record_id(idempotency_key),
+                "site_id": current_site(),
+                "request": request_body,
+                "created_at": datetime.now(timezone.utc)
+            })
+            return None
+        except DuplicateKeyError:
+            record = get_schedule_change_requests_collection().find_one({"_id": idempotency_record_id(idempotency_key)})
+
+        if not record:
+            # Expired between the insert and the lookup; treat as a fresh claim
+            return ChillerService._claim_idempotency_key(idempotency_key, request, response_model)
+
+        if record.get("request") != request_body:
+            return (
+                response_model(
+                    success=False,
+                    message="Idempotency key was already used for a different schedule change"
+                ),
+                422
+            )
+
+        if "response" not in record:
+            return (
+                response_model(
+                    success=False,
+                    message="Schedule change with this idempotency key is still in progress"
+                ),
+                409
+            )
+
+        return response_model(**record["response"]), record["status_code"]
+
+    @staticmethod
+    def _store_idempotent_result(idempotency_key: str, response: BaseModel, status_code: int):
+        """Remember the outcome so retries with the same key replay it"""
+        get_schedule_change_requests_collection().update_one(
+            {"_id": idempotency_record_id(idempotency_key)},
+            {"$set": {"response": response.model_dump(), "status_code": status_code}}
+        )
+
+    @staticmethod
+    def _release_idempotency_key(idempotency_key: str):
+        """Forget an unfinished claim so the client can retry"""
+        try:
+            get_schedule_change_requests_collection().delete_one(
+                {"_id": idempotency_record_id(idempotency_key), "response": {"$exists": False}}
+            )
+        except PyMongoError as e:
+            logger.error("Error releasing idempotency key: %s", e)
+
+
+def normalize_schedule(entries: List[ScheduleTime] | List[dict] | None) -> List[dict]:
+    """Convert schedule entries to plain start/stop dicts, dropping empty placeholders"""
+    normalized = []
+    for entry in entries or []:
+        if isinstance(entry, ScheduleTime):
+            entry = entry.model_dump()
+        start, stop = entry.get("start"), entry.get("stop")
+        if start is None and stop is None:
+            continue
+        normalized.append({"start": start, "stop": stop})
+    return normalized
+
+
+def idempotency_record_id(idempotency_key: str) -> str:
+    """Idempotency records are per site: the same key sent for two sites is two different changes"""
+    return f"{current_site()}:{idempotency_key}"
+
+
+def display_chiller_id(chiller_id: str) -> str:
+    """Format a chiller id the way operators read it, e.g. chiller_1 -> CH-1"""
+    return chiller_id.replace('chiller_', 'CH-')
+
+
+def ensure_indexes():
+    """Create the TTL index that expires old idempotency records"""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    get_schedule_change_requests_collection().create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS
+    )
+    _indexes_ready = True
@@ -0,0 +1,201 @@
+"""
+Answer simple status and maintenance questions without the LLM.
+
+Questions like "status of chiller_1" or "CDP-2 อยู่ระหว่างซ่อมไหม" otherwise
+cost two model round-trips, one for the tool call and one for the answer.
+Here the intent matcher recognises exactly one device id known in the
+site config plus exactly one intent, calls the tool directly and streams
+a templated Thai answer in the normal data-stream format. Anything less
+certain (several devices, leftover words we do not understand, a
+question the model router would escalate, missing data) falls back to
+the LLM.
+"""
+import json
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+import pendulum
+
+from .model_router import complexity_reasons
+from ..hammy_tools.system import get_site_config
+from ..utils.circuit_breaker import is_degraded
+from ..utils.equipment_index import PREFIX_ALIASES, resolve_device_id
+from ..utils.metrics import metrics
+
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH_ENABLED", "1") == "1"
+# Characters a question may contain beyond the device, intent and filler words
+FAST_PATH_MAX_UNKNOWN_CHARS = int(os.environ.get("FAST_PATH_MAX_UNKNOWN_CHARS", "6"))
+
+_DEVICE = re.compile(
+    r"(?<![a-z])(" + "|".join(sorted(map(re.escape, PREFIX_ALIASES), key=len, reverse=True)) + r")"
+    r"[\s_\-]*(\d+)(?:[\s_\-](\d+))?(?!\d)",
+    re.IGNORECASE
+)
+_INTENTS = {
+    "maintenance": re.compile(r"maintenance|under repair|ซ่อมบำรุง|ซ่อม|บำรุงรักษา|ปิดซ่อม|\bpm\b", re.IGNORECASE),
+    "status": re.compile(
+        r"status|running|working|\bon\b|\boff\b|สถานะ|ทำงาน|เปิด|ปิด|เดินอยู่|เป็นยังไง|เป็นอย่างไร",
+        re.IGNORECASE
+    ),
+}
+# Orders, not questions: the LLM and its confirmation flow handle these
+_COMMAND = re.compile(
+    r"\b(?:turn|switch|start|stop|shut|restart|reset|enable|disable|set|power)\b|"
+    r"สั่ง|สตาร์ท|หยุด|ช่วยเปิด|ช่วยปิด|กรุณาเปิด|กรุณาปิด|เปิดเครื่อง|ปิดเครื่อง",
+    re.IGNORECASE
+)
+# On/off words only ask about the state in a question ("CH1 เปิดอยู่ไหม", "is CH1 on?"); "เปิด CH1" is an order
+_ON_OFF = re.compile(r"\bon\b|\boff\b|เปิด|ปิด", re.IGNORECASE)
+_QUESTION = re.compile(r"\?|\b(?:is|are|whether)\b|ไหม|มั้ย|หรือเปล่า|รึเปล่า|หรือไม่|หรือยัง|อยู่", re.IGNORECASE)
+_FILLER = re.compile(
+    r"\b(?:what(?:'s)?|how(?:'s)?|is|are|the|of|check|show|me|please|now|current(?:ly)?|right|it)\b|"
+    r"ตอนนี้|ขณะนี้|ของ|ขอ|ดู|เช็ค|เช็ก|ตรวจสอบ|หน่อย|ครับ|ค่ะ|คะ|นะ|ไหม|มั้ย|หรือเปล่า|รึเปล่า|อยู่|"
+    r"หรือ|ไม่|ระหว่าง|การ|ให้|ที่|[\s\?\!\.,:;/]",
+    re.IGNORECASE
+)
+
+_RUNNING_VALUES = {"1", "on", "active", "running", "true"}
+
+
+def answer(messages: List[dict], available_tools: Dict[str, Callable]) -> Optional[List[str]]:
+    """Return the frames of a templated answer, or None to let the LLM answer"""
+    if not FAST_PATH_ENABLED or not messages or messages[-1].get("role") != "user":
+        return None
+    started = time.perf_counter()
+
+    intent, device_id = match_intent(_text_of(messages[-1]))
+    if not intent:
+        metrics.increment("fast_path.fallback.no_match")
+        return None
+    # Anything the model router would escalate is not a simple lookup
+    if complexity_reasons(messages):
+        metrics.increment("fast_path.fallback.complex")
+        return None
+
+    if intent == "maintenance":
+        text = _maintenance_answer(device_id, available_tools["get_maintenance_status"](device_id=device_id))
+    else:
+        tool = "get_chiller_status" if device_id.startswith("chiller_") else "get_equipment_status"
+        argument = "chiller_id" if tool == "get_chiller_status" else "equipment_id"
+        text = _status_answer(device_id, available_tools[tool](**{argument: device_id}))
+    if text is None:
+        metrics.increment("fast_path.fallback.no_data")
+        return None
+
+    metrics.increment(f"fast_path.answered.{intent}")
+    metrics.observe("fast_path.ms", (time.perf_counter() - started) * 1000)
+    return [
+        '0:{text}\n'.format(text=json.dumps(text)),
+        'e:{"finishReason":"stop","usage":{"promptTokens":0,"completionTokens":0},"isContinued":false}\n'
+    ]
+
+
+def match_intent(text: str):
+    """(intent, device_id) when the text is confidently a single-device lookup, else (None, None)"""
+    if _COMMAND.search(text) or (_ON_OFF.search(text) and not _QUESTION.search(text)):
+        return None, None
+    devices = {_device_id(match) for match in _DEVICE.finditer(text)}
+    intents = [name for name, pattern in _INTENTS.items() if pattern.search(text)]
+    if len(devices) != 1 or None in devices or not intents:
+        return None, None
+    # "maintenance" wins over the generic status words it often comes with ("ปิดซ่อม")
+    intent = intents[0]
+
+    leftover = _DEVICE.sub("", text)
+    for pattern in _INTENTS.values():
+        leftover = pattern.sub("", leftover)
+    leftover = _FILLER.sub("", leftover)
+    if len(leftover) > FAST_PATH_MAX_UNKNOWN_CHARS:
+        return None, None
+    return intent, devices.pop()
+
+
+def display_device_id(device_id: str) -> str:
+    """Format a device id the way operators read it, e.g. chiller_1 -> CH-1, ct_1_2 -> CT-1-2"""
+    prefix, *numbers = device_id.split("_")
+    return "-".join(["CH" if prefix == "chiller" else prefix.upper(), *numbers])
+
+
+def _device_id(match: re.Match) -> Optional[str]:
+    return resolve_device_id(match.group(0))
+
+
+def _status_answer(device_id: str, status) -> Optional[str]:
+    name = display_device_id(device_id)
+    if isinstance(status, dict) and status.get("available") is False:
+        return f"ขณะนี้ไม่สามารถดึงข้อมูลของ {name} ได้ชั่วคราว กรุณาลองใหม่อีกครั้งครับ"
+    prefix = _as_of_prefix(status)
+    if is_degraded(status):
+        status = status["data"]
+    if not isinstance(status, dict) or "status_read" not in status:
+        return None
+
+    if _is_on(status["status_read"]):
+        details = []
+        if _number(status.get("power")) is not None:
+            details.append(f"ใช้กำลังไฟ {_number(status['power']):.1f} kW")
+        if _number(status.get("evap_leaving_water_temperature")) is not None:
+            details.append(f"น้ำเย็นขาออก {_number(status['evap_leaving_water_temperature']):.1f}°C")
+        if _number(status.get("percentage_rla")) is not None:
+            details.append(f"โหลด {_number(status['percentage_rla']):.0f}% RLA")
+        text = f"{name} กำลังทำงานอยู่" + (" " + " ".join(details) if details else "")
+    else:
+        text = f"{name} ไม่ได้ทำงานอยู่ในขณะนี้"
+    if _is_on(status.get("alarm")):
+        text += " ⚠️ มีสัญญาณเตือน (alarm) ค้างอยู่ ควรตรวจสอบ"
+    return prefix + text + " ครับ"
+
+
+def _maintenance_answer(device_id: str, status) -> Optional[str]:
+    name = display_device_id(device_id)
+    if isinstance(status, dict) and status.get("available") is False:
+        return f"ขณะนี้ไม่สามารถดึงข้อมูลการซ่อมบำรุงของ {name} ได้ชั่วคราว กรุณาลองใหม่อีกครั้งครับ"
+    prefix = _as_of_prefix(status)
+    if is_degraded(status):
+        status = status["data"]
+    if not isinstance(status, dict) or "under_maintenance" not in status:
+        return None
+
+    if not status["under_maintenance"]:
+        return prefix + f"{name} ไม่ได้อยู่ระหว่างการซ่อมบำรุงครับ"
+    text = f"{name} อยู่ระหว่างการซ่อมบำรุง"
+    if status.get("ticket_started_by"):
+        text += f" แจ้งโดย {status['ticket_started_by']}"
+    if status.get("technician"):
+        text += f" ช่างผู้รับผิดชอบ {status['technician']}"
+    return prefix + text + " ครับ"
+
+
+def _as_of_prefix(status) -> str:
+    """Label a stale fallback result with the time it was fetched"""
+    if not is_degraded(status):
+        return ""
+    as_of = pendulum.parse(status["as_of"]).in_tz(get_site_config()["timezone"])
+    return f"(ข้อมูลล่าสุด ณ เวลา {as_of.format('HH:mm')} น.) "
+
+
+def _is_on(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in _RUNNING_VALUES
+    if isinstance(value, (int, float)):
+        return value > 0
+    return False
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text_of(message: dict) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    parts = content or []
+    if any(part.get("type") != "text" for part in parts):
+        return ""
+    return " ".join(part.get("text", "") for part in parts)
@@ -0,0 +1,131 @@
+"""
+Route each chat to the mini or the full Azure OpenAI deployment.
+
+Cheap heuristics on the conversation decide: status lookups and other
+short questions stay on AZURE_OPENAI_MINI_MODEL, while schedule changes,
+troubleshooting, image attachments, multi-equipment comparisons and long
+conversations escalate to AZURE_OPENAI_FULL_MODEL. Without a full
+deployment configured everything stays on mini. The decision only looks
+at the latest user message and the history size, so every step of a
+tool-calling turn lands on the same deployment.
+
+Per-route request counts, latency, tokens and estimated cost are recorded
+in the metrics so the thresholds can be tuned.
+"""
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+from ..utils.metrics import metrics
+
+AZURE_OPENAI_MINI_MODEL = os.environ.get("AZURE_OPENAI_MINI_MODEL")
+AZURE_OPENAI_FULL_MODEL = os.environ.get("AZURE_OPENAI_FULL_MODEL")
+# auto, or mini/full to pin every chat to one deployment
+MODEL_ROUTER_MODE = os.environ.get("MODEL_ROUTER_MODE", "auto")
+MODEL_ROUTER_MAX_USER_TURNS = int(os.environ.get("MODEL_ROUTER_MAX_USER_TURNS", "8"))
+MODEL_ROUTER_MAX_HISTORY_CHARS = int(os.environ.get("MODEL_ROUTER_MAX_HISTORY_CHARS", "8000"))
+
+# USD per million tokens (input, output), used for the cost estimate only
+MODEL_PRICES = {
+    "mini": (
+        float(os.environ.get("AZURE_OPENAI_MINI_INPUT_PRICE", "0.15")),
+        float(os.environ.get("AZURE_OPENAI_MINI_OUTPUT_PRICE", "0.60"))
+    ),
+    "full": (
+        float(os.environ.get("AZURE_OPENAI_FULL_INPUT_PRICE", "2.50")),
+        float(os.environ.get("AZURE_OPENAI_FULL_OUTPUT_PRICE", "10.00"))
+    ),
+}
+
+_SCHEDULE_WRITE = re.compile(
+    r"(change|set|move|shift|reschedule|update|add|extend|เปลี่ยน|ตั้ง|เลื่อน|แก้|เพิ่ม|ขยาย)"
+    r".*(schedule|start|stop|time|ตาราง|เวลา|เปิด|ปิด)",
+    re.IGNORECASE
+)
+_TROUBLESHOOTING = re.compile(
+    r"why|diagnos|troubleshoot|root cause|investigat|analy[sz]|compar|recommend|optimi[sz]|"
+    r"ทำไม|สาเหตุ|วิเคราะห์|แก้ปัญหา|เปรียบเทียบ|แนะนำ|ปรับปรุง",
+    re.IGNORECASE
+)
+_EQUIPMENT_ID = re.compile(r"\b(?:chiller|pchp|cdp|ct)_\d+(?:_\d+)?\b", re.IGNORECASE)
+
+
+class Route(NamedTuple):
+    name: str
+    model: Optional[str]
+    reasons: List[str]
+
+
+def route_chat(messages: List[dict]) -> Route:
+    """Pick the deployment for a conversation"""
+    if MODEL_ROUTER_MODE in MODEL_PRICES:
+        return _route(MODEL_ROUTER_MODE, ["pinned"])
+    reasons = complexity_reasons(messages)
+    return _route("full" if reasons else "mini", reasons or ["simple"])
+
+
+def complexity_reasons(messages: List[dict]) -> List[str]:
+    """Why a conversation needs more than a simple lookup; empty if it does not"""
+    text, has_image = _latest_user_message(messages)
+    user_turns = sum(1 for message in messages if message.get("role") == "user")
+    history_chars = sum(len(str(message.get("content") or "")) for message in messages)
+
+    reasons = []
+    if has_image:
+        reasons.append("attachment")
+    if _SCHEDULE_WRITE.search(text):
+        reasons.append("schedule_write")
+    if _TROUBLESHOOTING.search(text):
+        reasons.append("troubleshooting")
+    if len(set(match.lower() for match in _EQUIPMENT_ID.findall(text))) >= 3:
+        reasons.append("multi_equipment")
+    if user_turns > MODEL_ROUTER_MAX_USER_TURNS or history_chars > MODEL_ROUTER_MAX_HISTORY_CHARS:
+        reasons.append("long_history")
+    return reasons
+
+
+def record_completion(route: Route, first_frame_ms: Optional[float], total_ms: float, usage=None):
+    """Add one finished completion to the per-route latency and cost metrics"""
+    metrics.increment(f"model_router.{route.name}.requests")
+    for reason in route.reasons:
+        metrics.increment(f"model_router.reason.{reason}")
+    if first_frame_ms is not None:
+        metrics.observe(f"model_router.{route.name}.first_frame_ms", first_frame_ms)
+    metrics.observe(f"model_router.{route.name}.total_ms", total_ms)
+
+    if usage:
+        metrics.increment(f"model_router.{route.name}.prompt_tokens", usage.prompt_tokens)
+        metrics.increment(f"model_router.{route.name}.completion_tokens", usage.completion_tokens)
+        metrics.increment(f"model_router.{route.name}.cost_usd", completion_cost(route, usage))
+
+
+def completion_cost(route: Route, usage) -> float:
+    """Estimated USD cost of a completion's reported usage"""
+    input_price, output_price = MODEL_PRICES[route.name]
+    return (usage.prompt_tokens * input_price + usage.completion_tokens * output_price) / 1_000_000
+
+
+def _route(name: str, reasons: List[str]) -> Route:
+    if name == "full" and AZURE_OPENAI_FULL_MODEL:
+        return Route("full", AZURE_OPENAI_FULL_MODEL, reasons)
+    return Route("mini", AZURE_OPENAI_MINI_MODEL, reasons)
+
+
+def _latest_user_message(messages: List[dict]):
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            return content, False
+        parts = content or []
+        text = " ".join(part.get("text", "") for part in parts if part.get("type") == "text")
+        return text, any(part.get("type") == "image_url" for part in parts)
+    return "", False
+
+
+metrics.register("model_router", lambda: {
+    "mode": MODEL_ROUTER_MODE,
+    "mini_model": AZURE_OPENAI_MINI_MODEL,
+    "full_model": AZURE_OPENAI_FULL_MODEL
+})
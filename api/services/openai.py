@@ -1,18 +1,36 @@
 import os
 import json
-from typing import List, Any, Generator
-from openai import AzureOpenAI
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+import logging
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Any, Callable, Dict, Generator, Optional
 
+from . import fast_path
+from .admission import LLM_QUEUE_TIMEOUT_SECONDS, QueueFullError, admission, chat_priority
+from .model_router import Route, record_completion, route_chat
+from .response_cache import ResponseRecording, cache_key, response_cache
+from .tool_prefetch import ToolPrefetcher
+from .usage_ledger import ChatSession, usage_ledger
+from ..utils.cancellation import CancelToken, StreamCancelled
+from ..utils.clients import get_openai_client
+from ..utils.log import get_logger
+from ..utils.metrics import metrics
+from ..utils.site import current_site
 from ..utils.tools import get_tools
+from ..utils.tracing import Trace, start_trace
 # from ..config.prompts import SYSTEM_PROMPT, DEFAULT_TEMPERATURE, MAX_TOKENS
-from ..hammy_tools.system import SYSTEM_PROMPT
+from ..hammy_tools.system import build_system_prompt
 
-client = AzureOpenAI(
-    api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
-    api_version=os.environ.get("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
-)
+logger = get_logger(__name__)
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+# Rough upper bound for the answer, charged against the TPM budget up front
+COMPLETION_TOKENS_ESTIMATE = int(os.environ.get("COMPLETION_TOKENS_ESTIMATE", "800"))
+# Ask Azure for token usage at the end of each stream (API version 2024-09-01-preview or later)
+AZURE_OPENAI_STREAM_USAGE = os.environ.get("AZURE_OPENAI_STREAM_USAGE", "1") == "1"
+TOO_MANY_REQUESTS_FRAME = '3:"Too many requests, please try again shortly."\n'
 
 class OpenAIService:
     """Service for handling OpenAI operations"""
@@ -153,20 +171,46 @@ class OpenAIService:
                 }
             }
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "get_plant_digest",
+                "description": "Get a plant-wide summary: running equipment, total load and power, delta-T and kW/ton per running chiller, alarms and points outside operating limits",
+                "parameters": {
+                    "type": "object",
+                    "properties": {}
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "get_anomalies",
+                "description": "Find equipment readings that are abnormal compared to the last hour (z-score) or changing unusually fast (rate of change)",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "device_id": {
+                            "type": "string",
+                            "description": "Optional: Only report anomalies of this equipment"
+                        }
+                    }
+                }
+            }
+        },
         {
             "type": "function",
             "function": {
                 "name": "get_maintenance_status", 
-                "description": "Get maintenance status for equipment",
+                "description": "Get maintenance status for equipment. Omit device_id to list every device currently under maintenance",
                 "parameters": {
                     "type": "object",
                     "properties": {
                         "device_id": {
                             "type": "string",
-                            "description": "The ID of the equipment to check maintenance for"
+                            "description": "Optional: The ID of the equipment to check maintenance for"
                         }
-                    },
-                    "required": ["device_id"]
+                    }
                 }
             }
         },
@@ -215,6 +259,29 @@ class OpenAIService:
                 }
             }
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "get_scheduled_chillers",
+                "description": "Get which chillers are scheduled to run at a given time (default now), including overlapping schedules and gaps with no chiller scheduled",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "time": {
+                            "type": "string",
+                            "pattern": "^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$",
+                            "description": "Optional: Time of day in HH:MM format, defaults to the current site time"
+                        },
+                        "profile_type": {
+                            "type": "string",
+                            "enum": ["weekday_profile", "weekend_profile", "holiday_profile"],
+                            "description": "Optional: Schedule profile to check, defaults to today's weekday/weekend profile"
+                        }
+                    },
+                    "required": []
+                }
+            }
+        },
         {
             "type": "function",
             "function": {
@@ -290,35 +357,161 @@ class OpenAIService:
     ]
 
     @staticmethod
-    def stream_text(messages: List[ChatCompletionMessageParam], protocol: str = 'data') -> Generator[str, None, None]:
+    def stream_text(
+        messages: List['ChatCompletionMessageParam'],
+        protocol: str = 'data',
+        cancel_token: Optional[CancelToken] = None,
+        session: Optional[ChatSession] = None
+    ) -> Generator[str, None, None]:
         """
         Stream text responses from OpenAI
         
+        Simple single-device status and maintenance questions are answered
+        from templates without the model. Repeated conversations are answered
+        from the response cache when the tool data behind the cached answer is
+        unchanged. Everything else waits for admission, reporting its queue
+        position in data frames meanwhile.
+        Once the cancel token fires, the generator gives up its queue slot,
+        closes the Azure stream and stops waiting for tools.
+        
         Args:
             messages: List of messages to send to OpenAI
             protocol: Protocol to use for streaming
+            cancel_token: Fired when the client disconnects
             
         Yields:
             Streamed responses
         """
+        cancel_token = cancel_token or CancelToken()
+        available_tools = get_tools()
+        fast_frames = fast_path.answer(messages, available_tools)
+        if fast_frames is not None:
+            yield from fast_frames
+            usage_ledger.record(session, "fast_path", messages)
+            return
+
+        key = cache_key(messages)
+        cached_frames = response_cache.lookup(key, available_tools)
+        if cached_frames is not None:
+            yield from cached_frames
+            usage_ledger.record(session, "cache", messages)
+            return
+
+        try:
+            ticket = admission.submit(OpenAIService.estimate_tokens(messages), chat_priority(messages))
+        except QueueFullError:
+            yield TOO_MANY_REQUESTS_FRAME
+            return
+
+        recording = ResponseRecording()
+        route = None
+        status = "error"
+        try:
+            started = time.monotonic()
+            last_position = None
+            while not admission.wait(ticket, 0.25):
+                if cancel_token.cancelled:
+                    metrics.increment("cancellation.admission_withdrawn")
+                    status = "cancelled"
+                    return
+                if time.monotonic() - started > LLM_QUEUE_TIMEOUT_SECONDS:
+                    metrics.increment("admission.timed_out")
+                    status = "timed_out"
+                    yield TOO_MANY_REQUESTS_FRAME
+                    return
+                position = admission.position(ticket)
+                if position != last_position:
+                    yield '2:{data}\n'.format(data=json.dumps([{"type": "queue", "position": position}]))
+                    last_position = position
+            if last_position is not None:
+                yield '2:{data}\n'.format(data=json.dumps([{"type": "queue", "position": 0}]))
+
+            route = route_chat(messages)
+            trace = start_trace(messages)
+            started = time.monotonic()
+            first_frame_ms = None
+            try:
+                for frame in OpenAIService._stream_completion(messages, protocol, available_tools, recording, cancel_token, route, trace):
+                    # Nobody is reading any more; end here instead of holding the frame
+                    cancel_token.check()
+                    if first_frame_ms is None:
+                        first_frame_ms = (time.monotonic() - started) * 1000
+                    recording.frames.append(frame)
+                    yield frame
+            except Exception:
+                # Cancellation, or the upstream read failing because we closed it
+                if cancel_token.cancelled:
+                    status = "cancelled"
+                    return
+                raise
+            status = "completed"
+            record_completion(route, first_frame_ms, (time.monotonic() - started) * 1000, recording.usage)
+            response_cache.store(key, recording)
+            if trace:
+                trace.save(recording)
+        except GeneratorExit:
+            # The consumer closed the stream early
+            status = "cancelled"
+            raise
+        finally:
+            admission.release(ticket, recording.usage.total_tokens if recording.usage else None)
+            # Tokens spent on a cancelled or failed answer are billed all the same
+            usage_ledger.record(session, "llm", messages, route, recording, status)
+
+    @staticmethod
+    def estimate_tokens(messages: List['ChatCompletionMessageParam']) -> int:
+        """Rough prompt plus completion token count, charged against the TPM budget"""
+        # About three characters per token across the English, Thai and JSON we send
+        characters = len(json.dumps(messages, ensure_ascii=False, default=str)) + _prompt_overhead_characters()
+        return characters // 3 + COMPLETION_TOKENS_ESTIMATE
+
+    @staticmethod
+    def _stream_completion(
+        messages: List['ChatCompletionMessageParam'],
+        protocol: str,
+        available_tools: Dict[str, Callable],
+        recording: ResponseRecording,
+        cancel_token: CancelToken,
+        route: Route,
+        trace: Optional[Trace] = None
+    ) -> Generator[str, None, None]:
+        """Stream one completion from the routed Azure OpenAI deployment, running requested tools"""
         # Add system prompt to the beginning of the messages
-        system_message = {"role": "system", "content": SYSTEM_PROMPT}
+        system_message = {"role": "system", "content": build_system_prompt()}
         full_messages = [system_message, *messages]
 
         draft_tool_calls = []
         draft_tool_calls_index = -1
 
-        stream = client.chat.completions.create(
-            messages=full_messages,
-            model=os.environ.get("AZURE_OPENAI_MINI_MODEL"),
-            stream=True,
-            tools=OpenAIService.get_tools_config()
-        )
+        from openai import RateLimitError
+
+        usage_options = {"stream_options": {"include_usage": True}} if AZURE_OPENAI_STREAM_USAGE else {}
+
+        try:
+            stream = get_openai_client().chat.completions.create(
+                messages=full_messages,
+                model=route.model,
+                stream=True,
+                tools=OpenAIService.get_tools_config(),
+                **usage_options
+            )
+        except RateLimitError as e:
+            # Our budgets were too generous; hold everyone back for as long as Azure asks
+            retry_after = e.response.headers.get("retry-after")
+            admission.pause(float(retry_after) if retry_after and retry_after.isdigit() else 10.0)
+            yield TOO_MANY_REQUESTS_FRAME
+            return
+
+        cancel_token.add_callback(lambda: _close_upstream(stream))
+        prefetcher = ToolPrefetcher(available_tools, cancel_token)
+        chunks = stream
+        if trace:
+            request_chars = len(json.dumps(messages, ensure_ascii=False, default=str)) + _prompt_overhead_characters()
+            chunks = trace.record_stream(stream, route.model, request_chars)
 
-        available_tools = get_tools()
         tool_results = []  # Store results to pass to next tool call if needed
 
-        for chunk in stream:
+        for chunk in chunks:
             for choice in chunk.choices:
                 if choice.finish_reason == "stop":
                     continue
@@ -331,18 +524,27 @@ class OpenAIService:
                             args=tool_call["arguments"]
                         )
 
-                    for tool_call in draft_tool_calls:
+                    for index, tool_call in enumerate(draft_tool_calls):
                         if tool_call["name"] in available_tools:
-                            print(f"✅ Calling tool: {tool_call['name']}")
-                            print(f"🔍 Arguments: {tool_call['arguments']}")
-                            tool_result = available_tools[tool_call["name"]](
-                                **json.loads(tool_call["arguments"]))
+                            tool_started = time.perf_counter()
+                            try:
+                                tool_result = prefetcher.run(tool_call["id"], tool_call["name"], tool_call["arguments"])
+                            except StreamCancelled:
+                                metrics.increment("cancellation.tools_skipped", len(draft_tool_calls) - index - 1)
+                                raise
+                            if logger.isEnabledFor(logging.INFO):
+                                logger.info("tool call", extra={
+                                    "tool": tool_call["name"],
+                                    "args_bytes": len(tool_call["arguments"]),
+                                    "duration_ms": round((time.perf_counter() - tool_started) * 1000, 1)
+                                })
                             
                             # Store result for potential next tool call
                             tool_results.append({
                                 "name": tool_call["name"],
                                 "result": tool_result
                             })
+                            recording.add_tool_call(tool_call["name"], tool_call["arguments"], tool_result)
 
                             yield 'a:{{"toolCallId":"{id}","toolName":"{name}","args":{args},"result":{result}}}\n'.format(
                                 id=tool_call["id"],
@@ -365,15 +567,21 @@ class OpenAIService:
                         if (id is not None):
                             draft_tool_calls_index += 1
                             draft_tool_calls.append(
-                                {"id": id, "name": name, "arguments": ""})
+                                {"id": id, "name": name, "arguments": arguments or ""})
                         else:
                             draft_tool_calls[draft_tool_calls_index]["arguments"] += arguments
 
+                        # Start read-only tools as soon as their arguments are complete
+                        draft = draft_tool_calls[draft_tool_calls_index]
+                        prefetcher.feed(draft["id"], draft["name"], arguments or "")
+
                 else:
                     yield '0:{text}\n'.format(text=json.dumps(choice.delta.content))
 
             if chunk.choices == []:
                 usage = chunk.usage
+                if usage:
+                    recording.usage = usage
                 prompt_tokens = usage.prompt_tokens if usage else 0
                 completion_tokens = usage.completion_tokens if usage else 0
 
@@ -381,4 +589,19 @@ class OpenAIService:
                     reason="tool-calls" if len(draft_tool_calls) > 0 else "stop",
                     prompt=prompt_tokens,
                     completion=completion_tokens
-                ) 
\ No newline at end of file
+                ) 
+
+def _close_upstream(stream):
+    """Close a cancelled Azure stream so its connection and token budget are freed"""
+    stream.close()
+    metrics.increment("cancellation.upstream_closed")
+
+
+def _prompt_overhead_characters() -> int:
+    """Size of the system prompt and tool definitions sent with every completion"""
+    return _site_prompt_overhead_characters(current_site())
+
+
+@lru_cache(maxsize=None)
+def _site_prompt_overhead_characters(site_id: str) -> int:
+    return len(build_system_prompt(site_id)) + len(json.dumps(OpenAIService.get_tools_config()))
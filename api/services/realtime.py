@@ -0,0 +1,306 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from pymongo import DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+from ..utils.metrics import metrics
+from ..utils.clients import get_realtime_collection, register_warmup
+from ..utils.log import get_logger
+from ..utils.site import current_site, for_each_site, known_sites, site_context
+
+logger = get_logger(__name__)
+
+# How often to look for a new snapshot when change streams are unavailable
+POLL_INTERVAL_SECONDS = float(os.environ.get("REALTIME_POLL_INTERVAL_SECONDS", "5"))
+# Upper bound for one change stream wait, so the feed notices when it should stop
+CHANGE_STREAM_WAIT_MS = 1000
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+# Readings of a binary status or alarm point that mean "on"
+RUNNING_VALUES = {"1", "on", "active", "running", "true"}
+
+
+class Subscription:
+    """One connected client with its own bounded queue of pre-encoded events"""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        device_ids: Optional[Set[str]],
+        max_queue: int,
+        drop_policy: str
+    ):
+        self.loop = loop
+        self.device_ids = device_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, event: str):
+        """Queue an event, applying the drop policy when the client is too slow"""
+        if self.closed:
+            return
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+            return
+
+        self.dropped += 1
+        if self.drop_policy == DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.put_nowait(event)
+        elif self.drop_policy == DISCONNECT:
+            self.closed = True
+            # Wake the reader so it can end the response
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class RealtimeFeed:
+    """
+    Shared watcher on one site's realtime collection
+
+    A single background thread follows new snapshots, through a change
+    stream when the deployment supports it and by polling otherwise. Each
+    snapshot is diffed against the previous one and every changed device is
+    encoded once, then handed to the subscribers of that device. A snapshot
+    document rewritten in place counts as new when its timestamp or any
+    value changed. Listeners run on that thread in the site's context.
+    """
+
+    def __init__(self, site_id: str, listeners: Optional[List[Callable[[dict], None]]] = None):
+        self.site_id = site_id
+        self._subscriptions: Dict[Optional[str], Set[Subscription]] = {}
+        self._listeners: List[Callable[[dict], None]] = listeners if listeners is not None else []
+        self._last_values: Dict[str, dict] = {}
+        self._snapshot_id = None
+        self._snapshot_timestamp = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._keep_running = False
+        self.published = 0
+
+    def start(self, keep_running: bool = False):
+        """Start the watcher thread; keep_running keeps it alive without subscribers"""
+        with self._lock:
+            self._keep_running = self._keep_running or keep_running
+            # A thread that was asked to stop but is still running sees this under the lock and carries on
+            self._stop.clear()
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=f"realtime-feed-{self.site_id}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._keep_running = False
+            self._stop.set()
+
+    def subscribe(
+        self,
+        device_ids: Optional[Iterable[str]] = None,
+        max_queue: int = 100,
+        drop_policy: str = DROP_OLDEST
+    ) -> Subscription:
+        """Register a client for some devices (all devices when none given)"""
+        device_ids = set(device_ids) if device_ids else None
+        subscription = Subscription(asyncio.get_running_loop(), device_ids, max_queue, drop_policy)
+        with self._lock:
+            for key in device_ids or [None]:
+                self._subscriptions.setdefault(key, set()).add(subscription)
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.closed = True
+        with self._lock:
+            for key in subscription.device_ids or [None]:
+                subscribers = self._subscriptions.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[key]
+            if not self._subscriptions and not self._keep_running:
+                self._stop.set()
+
+    def current(self, device_ids: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """Last known values for some devices (all devices when none given)"""
+        values = self._last_values
+        if device_ids:
+            return {device_id: values[device_id] for device_id in device_ids if device_id in values}
+        return dict(values)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscriptions = {sub for subs in self._subscriptions.values() for sub in subs}
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "subscribers": len(subscriptions),
+            "events_published": self.published,
+            "events_dropped": sum(sub.dropped for sub in subscriptions),
+            "snapshot_id": str(self._snapshot_id) if self._snapshot_id is not None else None
+        }
+
+    def _run(self):
+        while True:
+            with site_context(self.site_id):
+                self._watch()
+            with self._lock:
+                # start() may have cleared the stop request after the watch loop ended
+                if self._stop.is_set():
+                    self._thread = None
+                    return
+
+    def _watch(self):
+        try:
+            latest = get_realtime_collection().find_one(sort=[('timestamp', -1), ('_id', -1)])
+            if latest:
+                self._publish(latest)
+            self._follow_change_stream()
+        except OperationFailure:
+            # Standalone servers have no change streams
+            self._poll()
+        except PyMongoError as e:
+            logger.error("Error following realtime change stream: %s", e)
+            self._poll()
+
+    def _follow_change_stream(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "replace", "update"]}}}]
+        with get_realtime_collection().watch(
+            pipeline,
+            full_document="updateLookup",
+            max_await_time_ms=CHANGE_STREAM_WAIT_MS
+        ) as stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change and change.get("fullDocument"):
+                    self._publish(change["fullDocument"])
+
+    def _poll(self):
+        while not self._stop.wait(POLL_INTERVAL_SECONDS):
+            try:
+                # Only fetch the whole snapshot when it is new or was rewritten with a new timestamp
+                head = get_realtime_collection().find_one({}, {"_id": 1, "timestamp": 1}, sort=[('timestamp', -1), ('_id', -1)])
+                if head and (head["_id"], head.get("timestamp")) != (self._snapshot_id, self._snapshot_timestamp):
+                    latest = get_realtime_collection().find_one({"_id": head["_id"]})
+                    if latest:
+                        self._publish(latest)
+            except PyMongoError as e:
+                logger.error("Error polling realtime data: %s", e)
+
+    def _publish(self, snapshot: dict):
+        """Diff a snapshot against the previous one and fan out changed devices"""
+        raw_data = snapshot.get("raw_data") or {}
+        timestamp = snapshot.get("timestamp")
+        seen = (snapshot.get("_id"), timestamp) == (self._snapshot_id, self._snapshot_timestamp)
+        self._snapshot_id, self._snapshot_timestamp = snapshot.get("_id"), timestamp
+
+        events = {}
+        for device_id, values in raw_data.items():
+            if not isinstance(values, dict):
+                continue
+            previous = self._last_values.get(device_id, {})
+            changes = {point: value for point, value in values.items() if previous.get(point) != value}
+            if changes:
+                events[device_id] = encode_event("update", {
+                    "device_id": device_id,
+                    "changes": changes,
+                    "timestamp": timestamp
+                })
+        if seen and not events:
+            # The change stream redelivered it, or the poller and the stream both saw it
+            return
+        self._last_values = {
+            device_id: values for device_id, values in raw_data.items() if isinstance(values, dict)
+        }
+
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error("Error in realtime listener: %s", e)
+
+        if not events:
+            return
+        with self._lock:
+            deliveries = []
+            for subscription in self._subscriptions.get(None, ()):
+                deliveries.extend((subscription, event) for event in events.values())
+            for device_id, event in events.items():
+                deliveries.extend((subscription, event) for subscription in self._subscriptions.get(device_id, ()))
+
+        self.published += len(events)
+        for subscription, event in deliveries:
+            subscription.loop.call_soon_threadsafe(subscription.offer, event)
+
+
+def is_on(value) -> bool:
+    """Whether a binary point reads as on ("1", "active", 1, True, ...)"""
+    if isinstance(value, str):
+        return value.strip().lower() in RUNNING_VALUES
+    if isinstance(value, (int, float)):
+        return value > 0
+    return False
+
+
+def is_running(values) -> bool:
+    """Whether a device in raw_data is running; devices without a status_read point always count as running"""
+    if not isinstance(values, dict):
+        return False
+    return values.get("status_read") is None or is_on(values["status_read"])
+
+
+def encode_event(event: str, data: dict) -> str:
+    """Encode a server-sent event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class RealtimeFeeds:
+    """One feed per site, created on first use; listeners apply to every site's feed"""
+
+    def __init__(self):
+        self._feeds: Dict[str, RealtimeFeed] = {}
+        self._listeners: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+
+    def get(self, site_id: Optional[str] = None) -> RealtimeFeed:
+        """The feed of a site (the current request's by default)"""
+        site_id = site_id or current_site()
+        feed = self._feeds.get(site_id)
+        if feed is None:
+            with self._lock:
+                feed = self._feeds.setdefault(site_id, RealtimeFeed(site_id, self._listeners))
+        return feed
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """Call `listener(snapshot)` for every new snapshot of every site"""
+        self._listeners.append(listener)
+
+    def start(self, keep_running: bool = False):
+        """Start the feed of every known site"""
+        for site_id in sorted(known_sites()):
+            self.get(site_id).start(keep_running)
+
+    def stop(self):
+        for feed in list(self._feeds.values()):
+            feed.stop()
+
+    def stats(self) -> dict:
+        return {site_id: feed.stats() for site_id, feed in list(self._feeds.items())}
+
+
+def _create_realtime_index():
+    get_realtime_collection().create_index([("timestamp", DESCENDING)], name="timestamp")
+
+
+realtime_feeds = RealtimeFeeds()
+register_warmup("realtime_index", lambda: for_each_site(_create_realtime_index))
+metrics.register("realtime_feed", realtime_feeds.stats)
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+from .realtime import realtime_feeds
+from ..utils.circuit_breaker import is_degraded
+from ..utils.log import get_logger
+from ..utils.metrics import metrics
+from ..utils.site import current_site
+from ..utils.state import StateBackend, state_backend
+from ..utils.tools import READ_ONLY_TOOLS, REALTIME_TOOLS
+
+logger = get_logger(__name__)
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s\?\!\.。,]+$")
+
+
+class ResponseRecording:
+    """Frames and tool calls captured while a response is streamed"""
+
+    def __init__(self):
+        self.frames: List[str] = []
+        self.tool_calls: List[dict] = []
+        self._reusable_tools = True
+        # Token usage reported by Azure at the end of the stream
+        self.usage = None
+
+    @property
+    def cacheable(self) -> bool:
+        """
+        Whether the answer may be replayed
+
+        Only answers built on read-only tool data, which a hit re-checks,
+        qualify. Without tools the answer rests on the system prompt, which
+        carries the current site time and day type.
+        """
+        return self._reusable_tools and bool(self.tool_calls)
+
+    def add_tool_call(self, name: str, arguments: str, result):
+        # Answers built on fallback data must not outlive the outage
+        if name not in READ_ONLY_TOOLS or is_degraded(result):
+            self._reusable_tools = False
+        self.tool_calls.append({"name": name, "arguments": arguments, "result": result})
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of streamed answers on top of the shared state backend
+
+    Entries are keyed on the normalized conversation. Only answers that
+    used read-only tools are stored, with a fingerprint of the tool
+    results; a hit re-runs those tools (cheap database reads) and is only
+    served if the data is unchanged. Replayed finish frames report zero
+    usage, since no model call was made. Entries that depended on realtime data live in a
+    namespace per site, which is cleared as soon as a new realtime snapshot
+    of that site arrives.
+    """
+
+    NAMESPACE = "response_cache"
+    REALTIME_NAMESPACE = "response_cache_realtime"
+
+    def __init__(self, backend: Optional[StateBackend] = None, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.backend = backend or state_backend
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, key: str, available_tools: Dict[str, Callable]) -> Optional[List[str]]:
+        """Return the frames to replay for a key, or None on a miss"""
+        entry, namespace = None, None
+        try:
+            for namespace in (self.realtime_namespace(), self.NAMESPACE):
+                entry = self.backend.get(namespace, key)
+                if entry:
+                    break
+        except Exception as e:
+            logger.error("Error reading response cache: %s", e)
+            entry = None
+
+        # Only answers backed by tool data can be re-checked
+        if entry and (not entry["tool_calls"] or not self._tool_data_unchanged(entry, available_tools)):
+            try:
+                self.backend.delete(namespace, key)
+            except Exception as e:
+                logger.error("Error evicting response cache entry: %s", e)
+            with self._lock:
+                self.invalidations += 1
+            entry = None
+
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry["frames"] if entry else None
+
+    def store(self, key: str, recording: ResponseRecording):
+        if not recording.cacheable or not recording.frames:
+            return
+        uses_realtime = any(call["name"] in REALTIME_TOOLS for call in recording.tool_calls)
+        entry = {
+            "frames": [without_usage(frame) for frame in recording.frames],
+            "tool_calls": [{"name": call["name"], "arguments": call["arguments"]} for call in recording.tool_calls],
+            "fingerprint": tool_data_fingerprint(call["result"] for call in recording.tool_calls)
+        }
+        try:
+            self.backend.set(
+                self.realtime_namespace() if uses_realtime else self.NAMESPACE,
+                key,
+                entry,
+                self.ttl_seconds
+            )
+        except Exception as e:
+            logger.error("Error writing response cache: %s", e)
+
+    def invalidate_realtime(self, snapshot: Optional[dict] = None):
+        """Drop every answer that relied on realtime equipment data"""
+        try:
+            stale = self.backend.count(self.realtime_namespace())
+            self.backend.clear(self.realtime_namespace())
+        except Exception as e:
+            logger.error("Error invalidating response cache: %s", e)
+            return
+        with self._lock:
+            self.invalidations += stale
+
+    def realtime_namespace(self) -> str:
+        return f"{self.REALTIME_NAMESPACE}:{current_site()}"
+
+    def clear(self):
+        self.backend.clear(self.NAMESPACE)
+        self.backend.clear(self.realtime_namespace())
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
+
+    @staticmethod
+    def _tool_data_unchanged(entry: dict, available_tools: Dict[str, Callable]) -> bool:
+        results = []
+        for call in entry["tool_calls"]:
+            tool = available_tools.get(call["name"])
+            if tool is None:
+                return False
+            try:
+                results.append(tool(**json.loads(call["arguments"] or "{}")))
+            except Exception as e:
+                logger.error("Error re-checking cached tool data: %s", e)
+                return False
+        return tool_data_fingerprint(results) == entry["fingerprint"]
+
+
+def normalize_text(text: str) -> str:
+    """Fold case, width and whitespace so trivially different prompts share a key"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def cache_key(messages: List[dict]) -> str:
+    """Hash the site and the normalized conversation sent to the model"""
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts = [content]
+        else:
+            texts = [
+                part.get("text") if part.get("type") == "text" else json.dumps(part, sort_keys=True)
+                for part in content or []
+            ]
+        parts.append({
+            "role": message.get("role"),
+            "content": [normalize_text(text) for text in texts if text],
+            # Tool call ids are random per completion, so only names and arguments count
+            "tool_calls": [
+                [tool_call["function"]["name"], tool_call["function"]["arguments"]]
+                for tool_call in message.get("tool_calls") or []
+            ]
+        })
+    encoded = json.dumps([current_site(), parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def without_usage(frame: str) -> str:
+    """A finish frame reporting zero tokens; other frames unchanged"""
+    if not frame.startswith("e:"):
+        return frame
+    finish = json.loads(frame[2:])
+    finish["usage"] = {"promptTokens": 0, "completionTokens": 0}
+    return "e:" + json.dumps(finish, separators=(",", ":")) + "\n"
+
+
+def tool_data_fingerprint(results) -> str:
+    encoded = json.dumps(list(results), sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+response_cache = ResponseCache()
+realtime_feeds.add_listener(response_cache.invalidate_realtime)
+metrics.register("response_cache", response_cache.stats)
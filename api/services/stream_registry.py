@@ -0,0 +1,241 @@
+"""
+Resumable chat streams.
+
+Each chat generator runs on a producer thread from a bounded pool and
+writes its frames into a ResumableStream, a ring buffer of the last STREAM_RESUME_BUFFER_BYTES
+of frames addressed by frame offset. Responses only read from the buffer,
+so when the operator's tablet drops Wi-Fi the completion and its tools keep
+going, and the client can reconnect to GET /api/chat_streaming/{stream_id}
+with the number of frames it already has instead of POSTing the chat again.
+
+A stream nobody reads is cancelled after STREAM_RESUME_GRACE_SECONDS.
+The default of 0 cancels on disconnect, because the frontend does not
+resume yet; raise it for clients that do. DELETE cancels a stream at once,
+which is what the stop button does. Finished streams stay resumable for
+STREAM_RESUME_TTL_SECONDS, and the oldest finished ones are dropped early
+when all buffers together exceed STREAM_RESUME_MAX_BYTES. Streams live in
+the worker that started them, so resuming needs sticky sessions when
+running several workers.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .admission import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE
+from ..utils.cancellation import CancelToken, StreamCancelled
+from ..utils.compression import CompressibleStreamingResponse
+from ..utils.log import get_logger
+from ..utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+STREAM_RESUME_GRACE_SECONDS = float(os.environ.get("STREAM_RESUME_GRACE_SECONDS", "0"))
+STREAM_RESUME_TTL_SECONDS = float(os.environ.get("STREAM_RESUME_TTL_SECONDS", "120"))
+# Frames kept per stream; a client further behind than this has to start over
+STREAM_RESUME_BUFFER_BYTES = int(os.environ.get("STREAM_RESUME_BUFFER_BYTES", str(1024 * 1024)))
+STREAM_RESUME_MAX_BYTES = int(os.environ.get("STREAM_RESUME_MAX_BYTES", str(64 * 1024 * 1024)))
+# Enough for every chat admission lets run or wait; producers beyond that queue for a thread
+STREAM_PRODUCER_WORKERS = int(os.environ.get("STREAM_PRODUCER_WORKERS", str(LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE)))
+
+_producers = ThreadPoolExecutor(max_workers=STREAM_PRODUCER_WORKERS, thread_name_prefix="stream-producer")
+
+
+class StreamExpiredError(Exception):
+    """Raised when resuming from an offset the ring buffer no longer holds"""
+
+
+class ResumableStream:
+    """Ring buffer of one chat's frames, filled by its producer thread"""
+
+    def __init__(self, stream_id: str, cancel_token: CancelToken):
+        self.stream_id = stream_id
+        self.cancel_token = cancel_token
+        self.done = False
+        self.finished_at = 0.0
+        self.size = 0
+        self._frames: List[str] = []
+        self._start = 0  # Offset of the oldest frame still buffered
+        self._readers = 0
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self._grace_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    @property
+    def end(self) -> int:
+        """Offset the next frame will get"""
+        return self._start + len(self._frames)
+
+    def holds(self, offset: int) -> bool:
+        """Whether resuming from `offset` is possible"""
+        with self._lock:
+            return self._start <= offset <= self.end
+
+    def append(self, frame: str):
+        with self._lock:
+            self._frames.append(frame)
+            self.size += len(frame)
+            if self.size > STREAM_RESUME_BUFFER_BYTES:
+                dropped = 0
+                while self.size > STREAM_RESUME_BUFFER_BYTES and dropped < len(self._frames) - 1:
+                    self.size -= len(self._frames[dropped])
+                    dropped += 1
+                del self._frames[:dropped]
+                self._start += dropped
+            self._wake()
+
+    def finish(self):
+        with self._lock:
+            self.done = True
+            self.finished_at = time.monotonic()
+            if self._grace_timer:
+                self._grace_timer.cancel()
+            self._wake()
+
+    async def frames_from(self, offset: int):
+        """Frames from `offset` on, waiting for new ones until the stream finishes"""
+        while True:
+            with self._lock:
+                if offset < self._start:
+                    raise StreamExpiredError(f"Frames before {self._start} are no longer buffered")
+                frames = self._frames[offset - self._start:]
+                done = self.done
+                if not frames and not done:
+                    waiter = (asyncio.get_running_loop(), asyncio.Event())
+                    self._waiters.append(waiter)
+            if frames:
+                offset += len(frames)
+                for frame in frames:
+                    yield frame
+            elif done:
+                return
+            else:
+                try:
+                    await waiter[1].wait()
+                finally:
+                    # A reader cancelled by its disconnect must not be woken any more
+                    with self._lock:
+                        if waiter in self._waiters:
+                            self._waiters.remove(waiter)
+
+    def attach(self):
+        with self._lock:
+            self._readers += 1
+            if self._grace_timer:
+                self._grace_timer.cancel()
+                self._grace_timer = None
+
+    def detach(self):
+        """A reader went away; cancel the stream if nobody comes back in time"""
+        with self._lock:
+            self._readers -= 1
+            if self._readers or self.done:
+                return
+            if STREAM_RESUME_GRACE_SECONDS <= 0:
+                cancel = True
+            else:
+                cancel = False
+                self._grace_timer = threading.Timer(STREAM_RESUME_GRACE_SECONDS, self._abandon)
+                self._grace_timer.daemon = True
+                self._grace_timer.start()
+        if cancel:
+            self.cancel_token.cancel()
+
+    def _abandon(self):
+        with self._lock:
+            if self._readers or self.done:
+                return
+        if self.cancel_token.cancel():
+            metrics.increment("stream_resume.abandoned")
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+
+class StreamRegistry:
+    """The resumable streams of this worker, by stream id"""
+
+    def __init__(self):
+        self._streams: Dict[str, ResumableStream] = {}
+        self._lock = threading.Lock()
+
+    def start(self, generator: Iterator[str], cancel_token: CancelToken) -> ResumableStream:
+        """Register a stream and start producing its frames in the background"""
+        self.evict()
+        stream = ResumableStream(uuid.uuid4().hex, cancel_token)
+        with self._lock:
+            self._streams[stream.stream_id] = stream
+        # Carry the request id and site into the producer
+        _producers.submit(contextvars.copy_context().run, _produce, generator, stream)
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ResumableStream]:
+        self.evict()
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def evict(self):
+        """Drop finished streams past their TTL, then the oldest finished ones while over budget"""
+        now = time.monotonic()
+        with self._lock:
+            for stream_id, stream in list(self._streams.items()):
+                if stream.done and now - stream.finished_at > STREAM_RESUME_TTL_SECONDS:
+                    del self._streams[stream_id]
+            total = sum(stream.size for stream in self._streams.values())
+            finished = sorted((stream for stream in self._streams.values() if stream.done), key=lambda stream: stream.finished_at)
+            for stream in finished:
+                if total <= STREAM_RESUME_MAX_BYTES:
+                    break
+                del self._streams[stream.stream_id]
+                total -= stream.size
+                metrics.increment("stream_resume.evicted_for_memory")
+
+    def stats(self) -> dict:
+        with self._lock:
+            streams = list(self._streams.values())
+        return {
+            "streams": len(streams),
+            "running": sum(not stream.done for stream in streams),
+            "buffered_bytes": sum(stream.size for stream in streams),
+        }
+
+
+def _produce(generator: Iterator[str], stream: ResumableStream):
+    try:
+        # Cancelled while waiting for a producer thread: never start the completion
+        stream.cancel_token.check()
+        for frame in generator:
+            stream.append(frame)
+    except StreamCancelled:
+        pass
+    except Exception:
+        logger.exception("Chat stream %s failed", stream.stream_id)
+    finally:
+        stream.cancel_token.finish()
+        stream.finish()
+
+
+class ResumableStreamingResponse(CompressibleStreamingResponse):
+    """Streams a ResumableStream from an offset; disconnecting only detaches the reader"""
+
+    def __init__(self, stream: ResumableStream, offset: int = 0, **kwargs):
+        self.stream = stream
+        super().__init__(stream.frames_from(offset), **kwargs)
+        self.headers["x-stream-id"] = stream.stream_id
+
+    async def __call__(self, scope, receive, send):
+        self.stream.attach()
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.stream.detach()
+
+
+stream_registry = StreamRegistry()
+metrics.register("stream_resume", stream_registry.stats)
@@ -0,0 +1,108 @@
+"""
+Start read-only tools while the model is still streaming.
+
+Tool-call arguments arrive a few characters at a time, and the model may
+keep streaming further calls before it finishes with "tool_calls". As
+soon as the arguments of a read-only tool form a complete JSON object,
+the tool starts in the background, overlapping its database read with
+the rest of the stream. When the call is finally executed the
+prefetched result is used if the final arguments are the same, and
+discarded otherwise.
+"""
+import json
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Tuple
+
+from ..utils.cancellation import CancelToken
+from ..utils.metrics import metrics
+from ..utils.tools import READ_ONLY_TOOLS
+
+
+class JSONObjectTracker:
+    """Follows streamed JSON text just far enough to know when the top-level object closes"""
+
+    def __init__(self):
+        self.text = ""
+        self.complete = False
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, fragment: str) -> bool:
+        """Append a fragment; returns True once the object is complete"""
+        self.text += fragment
+        if self.complete:
+            return True
+        for char in fragment:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                self._started = True
+            elif char in "}]":
+                self._depth -= 1
+                if self._started and self._depth == 0:
+                    self.complete = True
+                    return True
+        return False
+
+
+class ToolPrefetcher:
+    """Speculative read-only tool calls for one streamed completion"""
+
+    def __init__(self, available_tools: Dict[str, Callable], cancel_token: CancelToken):
+        self.available_tools = available_tools
+        self.cancel_token = cancel_token
+        self._trackers: Dict[str, JSONObjectTracker] = {}
+        self._prefetched: Dict[str, Tuple[dict, Future, float]] = {}
+        cancel_token.add_callback(self.discard)
+
+    def feed(self, call_id: str, name: str, fragment: str):
+        """Track a streamed argument fragment, starting the tool once its arguments are complete"""
+        if name not in READ_ONLY_TOOLS or name not in self.available_tools or call_id in self._prefetched:
+            return
+        tracker = self._trackers.setdefault(call_id, JSONObjectTracker())
+        if not tracker.feed(fragment):
+            return
+        try:
+            arguments = json.loads(tracker.text)
+        except ValueError:
+            return
+        if not isinstance(arguments, dict):
+            # Not keyword arguments; the tool call itself will report the error
+            return
+        self._prefetched[call_id] = (
+            arguments,
+            self.cancel_token.submit(self.available_tools[name], **arguments),
+            time.monotonic()
+        )
+        metrics.increment("tool_prefetch.started")
+
+    def run(self, call_id: str, name: str, arguments: str):
+        """Result of a tool call, reusing the prefetched result when the final arguments match"""
+        final_arguments = json.loads(arguments)
+        prefetched = self._prefetched.pop(call_id, None)
+        if prefetched:
+            prefetched_arguments, future, started = prefetched
+            if prefetched_arguments == final_arguments:
+                metrics.increment("tool_prefetch.used")
+                metrics.observe("tool_prefetch.head_start_ms", (time.monotonic() - started) * 1000)
+                return self.cancel_token.wait(future)
+            future.cancel()
+            metrics.increment("tool_prefetch.discarded")
+        return self.cancel_token.run(self.available_tools[name], **final_arguments)
+
+    def discard(self):
+        """Drop prefetches nobody will collect"""
+        for _, future, _ in list(self._prefetched.values()):
+            future.cancel()
+        self._prefetched.clear()
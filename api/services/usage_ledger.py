@@ -0,0 +1,267 @@
+"""
+Token usage ledger.
+
+Every chat request writes one entry to analytics.token_usage: which site
+and who asked (x-chat-id / x-operator-id headers), which step of the
+answer it was, the tokens and estimated cost Azure reported, the tools
+it called, and how its prompt tokens split between the system prompt, the
+tool definitions, the conversation and the results of each tool fed back
+into it. Fast-path and cached answers are recorded with zero tokens.
+Model requests are recorded however they end, with the usage received so
+far and a status: completed, cancelled, timed_out (never admitted) or
+error.
+
+record() only appends to an in-memory queue; a writer thread builds the
+entries and inserts them with insert_many every USAGE_LEDGER_FLUSH_SECONDS
+or USAGE_LEDGER_BATCH_SIZE entries, so the stream never waits on MongoDB.
+When MongoDB is down entries are dropped (and counted), never queued
+without bound.
+"""
+import json
+import os
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional
+
+import pendulum
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+from .model_router import Route, completion_cost
+from ..hammy_tools.system import get_site_config
+from ..utils.clients import get_token_usage_collection, register_warmup
+from ..utils.log import get_logger, request_id_var
+from ..utils.metrics import metrics
+from ..utils.site import current_site, site_filter
+
+logger = get_logger(__name__)
+
+USAGE_LEDGER_ENABLED = os.environ.get("USAGE_LEDGER_ENABLED", "1") == "1"
+USAGE_LEDGER_FLUSH_SECONDS = float(os.environ.get("USAGE_LEDGER_FLUSH_SECONDS", "5"))
+USAGE_LEDGER_BATCH_SIZE = int(os.environ.get("USAGE_LEDGER_BATCH_SIZE", "200"))
+USAGE_LEDGER_MAX_PENDING = int(os.environ.get("USAGE_LEDGER_MAX_PENDING", "10000"))
+
+GROUP_FIELDS = {"site": "$site_id", "chat": "$chat_id", "operator": "$operator", "day": "$day", "route": "$route"}
+
+
+class ChatSession(NamedTuple):
+    chat_id: Optional[str] = None
+    operator: Optional[str] = None
+
+
+class UsageLedger:
+    """Batched, fire-and-forget writer of usage entries"""
+
+    def __init__(self):
+        self._pending: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=USAGE_LEDGER_MAX_PENDING)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        session: Optional[ChatSession],
+        source: str,
+        messages: List[dict],
+        route: Optional[Route] = None,
+        recording=None,
+        status: str = "completed"
+    ):
+        """Queue one request's usage; never blocks"""
+        if not USAGE_LEDGER_ENABLED:
+            return
+        self._start()
+        item = (datetime.now(timezone.utc), request_id_var.get(), current_site(), session or ChatSession(), source, messages, route, recording, status)
+        try:
+            self._pending.put_nowait(item)
+        except queue.Full:
+            metrics.increment("usage_ledger.dropped")
+
+    def shutdown(self):
+        """Write whatever is still queued and stop the writer"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer:
+            self._pending.put(None)
+            writer.join(timeout=10)
+
+    def query(
+        self,
+        group_by: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        chat_id: Optional[str] = None,
+        operator: Optional[str] = None,
+        limit: int = 100
+    ) -> List[dict]:
+        """Token and cost totals of the current site per chat, operator, day, route or tool"""
+        match = {"ts": {"$gte": since or datetime.now(timezone.utc) - timedelta(days=7)}, **site_filter()}
+        if until:
+            match["ts"]["$lt"] = until
+        if chat_id:
+            match["chat_id"] = chat_id
+        if operator:
+            match["operator"] = operator
+
+        if group_by == "tool":
+            pipeline = [
+                {"$match": match},
+                {"$unwind": "$prompt_breakdown.tool_results"},
+                {"$group": {
+                    "_id": "$prompt_breakdown.tool_results.tool",
+                    "requests": {"$sum": 1},
+                    "prompt_tokens": {"$sum": "$prompt_breakdown.tool_results.tokens"},
+                }},
+                {"$sort": {"prompt_tokens": DESCENDING}},
+            ]
+        else:
+            pipeline = [
+                {"$match": match},
+                {"$group": {
+                    "_id": GROUP_FIELDS[group_by],
+                    "requests": {"$sum": 1},
+                    "llm_requests": {"$sum": {"$cond": [{"$eq": ["$source", "llm"]}, 1, 0]}},
+                    "incomplete_requests": {"$sum": {"$cond": [{"$in": ["$status", ["cancelled", "timed_out", "error"]]}, 1, 0]}},
+                    "prompt_tokens": {"$sum": "$prompt_tokens"},
+                    "completion_tokens": {"$sum": "$completion_tokens"},
+                    "cost_usd": {"$sum": "$cost_usd"},
+                    "system_prompt_tokens": {"$sum": "$prompt_breakdown.system_prompt"},
+                    "tool_definition_tokens": {"$sum": "$prompt_breakdown.tool_definitions"},
+                    "tool_result_tokens": {"$sum": {"$sum": "$prompt_breakdown.tool_results.tokens"}},
+                }},
+                {"$sort": {"cost_usd": DESCENDING, "prompt_tokens": DESCENDING}},
+            ]
+        pipeline.append({"$limit": limit})
+        return [
+            {group_by: row.pop("_id"), **row}
+            for row in get_token_usage_collection().aggregate(pipeline)
+        ]
+
+    def _start(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_batches, name="usage-ledger", daemon=True)
+                    self._writer.start()
+
+    def _write_batches(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._pending.get(timeout=USAGE_LEDGER_FLUSH_SECONDS)
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= USAGE_LEDGER_BATCH_SIZE:
+                        break
+                    item = self._pending.get_nowait()
+                stopping = item is None
+            except queue.Empty:
+                pass
+            if batch:
+                self._insert(batch)
+
+    def _insert(self, batch: List[tuple]):
+        try:
+            entries = [build_entry(*item) for item in batch]
+            get_token_usage_collection().insert_many(entries, ordered=False)
+            metrics.increment("usage_ledger.written", len(entries))
+        except PyMongoError as e:
+            metrics.increment("usage_ledger.dropped", len(batch))
+            logger.warning("Error writing %s usage entries: %s", len(batch), e)
+        except Exception:
+            metrics.increment("usage_ledger.dropped", len(batch))
+            logger.exception("Error building usage entries")
+
+    def stats(self) -> dict:
+        return {"pending": self._pending.qsize(), "running": self._writer is not None}
+
+
+def build_entry(
+    ts: datetime,
+    request_id,
+    site_id: str,
+    session: ChatSession,
+    source: str,
+    messages: List[dict],
+    route,
+    recording,
+    status: str = "completed"
+) -> dict:
+    usage = recording.usage if recording else None
+    prompt_tokens = usage.prompt_tokens if usage else 0
+    completion_tokens = usage.completion_tokens if usage else 0
+    return {
+        "ts": ts,
+        "day": pendulum.instance(ts).in_tz(get_site_config(site_id)["timezone"]).to_date_string(),
+        "request_id": request_id,
+        "site_id": site_id,
+        "chat_id": session.chat_id,
+        "operator": session.operator,
+        "source": source,
+        "status": status,
+        "route": route.name if route else None,
+        "model": route.model if route else None,
+        "step": _step(messages),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": completion_cost(route, usage) if route and usage else 0.0,
+        "tool_calls": [call["name"] for call in recording.tool_calls] if recording else [],
+        "prompt_breakdown": prompt_breakdown(messages, prompt_tokens, site_id) if usage else None,
+    }
+
+
+def prompt_breakdown(messages: List[dict], prompt_tokens: int, site_id: Optional[str] = None) -> dict:
+    """Split the reported prompt tokens by where the characters came from"""
+    from .openai import OpenAIService
+    from ..hammy_tools.system import build_system_prompt
+
+    tool_names = {
+        call["id"]: call["function"]["name"]
+        for message in messages if message.get("role") == "assistant"
+        for call in message.get("tool_calls") or []
+    }
+    tool_characters = {}
+    conversation = 0
+    for message in messages:
+        size = len(json.dumps(message, ensure_ascii=False, default=str))
+        if message.get("role") == "tool":
+            name = tool_names.get(message.get("tool_call_id"), "unknown")
+            tool_characters[name] = tool_characters.get(name, 0) + size
+        else:
+            conversation += size
+    system_prompt = len(build_system_prompt(site_id))
+    tool_definitions = len(json.dumps(OpenAIService.get_tools_config()))
+
+    total = system_prompt + tool_definitions + conversation + sum(tool_characters.values())
+    share = prompt_tokens / total if total else 0
+    return {
+        "system_prompt": round(system_prompt * share),
+        "tool_definitions": round(tool_definitions * share),
+        "conversation": round(conversation * share),
+        "tool_results": [{"tool": name, "tokens": round(size * share)} for name, size in tool_characters.items()],
+    }
+
+
+def _step(messages: List[dict]) -> int:
+    """1 for the first request of an answer, 2 for the follow-up after its tool results, ..."""
+    step = 1
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            break
+        if message.get("role") == "assistant":
+            step += 1
+    return step
+
+
+def _create_indexes():
+    collection = get_token_usage_collection()
+    collection.create_index([("ts", DESCENDING)])
+    collection.create_index([("site_id", ASCENDING), ("ts", DESCENDING)])
+    collection.create_index([("chat_id", ASCENDING), ("ts", DESCENDING)])
+    collection.create_index([("operator", ASCENDING), ("ts", DESCENDING)])
+
+
+usage_ledger = UsageLedger()
+register_warmup("usage_ledger_indexes", _create_indexes)
+metrics.register("usage_ledger", usage_ledger.stats)
@@ -0,0 +1,97 @@
+"""
+Stop streamed work as soon as nobody will read it.
+
+A chat's generator keeps running while nobody reads its frames: the Azure
+stream it holds and any tool it is running keep going. Cancelling its
+CancelToken (see services.stream_registry for when that happens) fires the
+token's callbacks, which close the upstream stream. Tools run through the
+token, so a cancelled stream stops waiting for the tool in flight and
+skips the ones still pending.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_for_futures
+from typing import Any, Callable, List
+
+from .log import get_logger
+from .metrics import metrics
+
+logger = get_logger(__name__)
+
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+
+class StreamCancelled(Exception):
+    """Raised inside a generator whose client has disconnected"""
+
+
+class CancelToken:
+    """Cancellation flag shared between a response and the generator producing it"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
+        self.finished = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise StreamCancelled()
+
+    def add_callback(self, callback: Callable[[], Any]):
+        """Run `callback` on cancellation, immediately if already cancelled"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self) -> bool:
+        """Cancel unless the work already finished; returns whether it did"""
+        with self._lock:
+            if self.finished or self._event.is_set():
+                return False
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        metrics.increment("cancellation.streams_cancelled")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Error running cancellation callback: %s", e)
+        return True
+
+    def finish(self):
+        with self._lock:
+            self.finished = True
+            self._callbacks = []
+
+    def run(self, func: Callable, *args, **kwargs):
+        """Run a blocking call, giving up on it as soon as the token is cancelled"""
+        return self.wait(self.submit(func, *args, **kwargs))
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Start a blocking call in the background; collect it with wait()"""
+        self.check()
+        # Carry the request id (and other context) into the worker thread
+        return _executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+    def wait(self, future: Future):
+        """Result of a submitted call, unless the token is cancelled first"""
+        while True:
+            done, _ = wait_for_futures([future], timeout=0.05)
+            if done:
+                return future.result()
+            if self._event.is_set():
+                if not future.cancel():
+                    # Already running; it finishes in the background, nobody waits for it
+                    metrics.increment("cancellation.tools_abandoned")
+                raise StreamCancelled()
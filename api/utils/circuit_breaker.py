@@ -0,0 +1,159 @@
+"""
+Circuit breakers around the backends the tools read from.
+
+After CIRCUIT_FAILURE_THRESHOLD consecutive backend errors a breaker opens
+and tool calls fail fast for CIRCUIT_RESET_SECONDS instead of each waiting
+out the driver timeouts. The next call after that is let through as a trial
+(half-open): success closes the breaker, failure opens it again. While a
+backend is unavailable, guarded tools answer with the last good result for
+the same arguments (marked stale) or with a "data unavailable" result.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Tuple, Type
+
+from .log import get_logger
+from .metrics import metrics
+from .site import current_site
+from .state import MemoryStateBackend
+
+logger = get_logger(__name__)
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+# How long a last good tool result may still be served while its backend is down
+STALE_RESULT_MAX_AGE_SECONDS = float(os.environ.get("STALE_RESULT_MAX_AGE_SECONDS", "900"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial call"""
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go to the backend now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self.state != OPEN:
+                    self._transition(OPEN)
+
+    def release_trial(self):
+        """End a call that neither proved nor disproved the backend, freeing the half-open trial"""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "retry_in_seconds": max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at)) if self.state == OPEN else 0.0
+            }
+
+    def _transition(self, state: str):
+        self.state = state
+        metrics.increment(f"circuit_breaker.{self.name}.{state}")
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+_stale_results = MemoryStateBackend()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if name not in breakers:
+        breakers[name] = CircuitBreaker(name)
+    return breakers[name]
+
+
+def guarded(backend: str, errors: Tuple[Type[BaseException], ...]):
+    """
+    Run a tool behind the named backend's breaker
+
+    `errors` are the exceptions that mean the backend itself failed; the
+    tool lets them propagate. Anything else is the tool's own business.
+    """
+    breaker = get_breaker(backend)
+
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = json.dumps([current_site(), args, kwargs], sort_keys=True, default=str)
+            if not breaker.allow():
+                metrics.increment(f"circuit_breaker.{backend}.rejected")
+                return _fallback(backend, func.__name__, key)
+            try:
+                result = func(*args, **kwargs)
+            except errors as e:
+                breaker.record_failure()
+                logger.warning("Error calling %s for %s: %s", backend, func.__name__, e)
+                return _fallback(backend, func.__name__, key)
+            except BaseException:
+                # The tool's own error says nothing about the backend; let the next call be the trial
+                breaker.release_trial()
+                raise
+            breaker.record_success()
+            _stale_results.set(func.__name__, key, (result, datetime.now(timezone.utc).isoformat()), STALE_RESULT_MAX_AGE_SECONDS)
+            return result
+        return wrapper
+    return decorator
+
+
+def is_degraded(result) -> bool:
+    """Whether a tool result is a stale or unavailable fallback"""
+    return isinstance(result, dict) and (result.get("stale") is True or result.get("available") is False)
+
+
+def _fallback(backend: str, tool_name: str, key: str) -> dict:
+    cached = _stale_results.get(tool_name, key)
+    if cached is not None:
+        metrics.increment(f"circuit_breaker.{backend}.stale_served")
+        result, as_of = cached
+        return {"stale": True, "as_of": as_of, "data": result}
+    return {
+        "available": False,
+        "message": f"The {backend} data source is temporarily unavailable. Please try again shortly."
+    }
+
+
+metrics.register("circuit_breakers", lambda: {name: breaker.stats() for name, breaker in breakers.items()})
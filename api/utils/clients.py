@@ -0,0 +1,159 @@
+"""
+Process-wide backend clients.
+
+Clients are created lazily per worker process, on first use, never at
+import time. Importing the package therefore needs no network, and forked
+workers never share a MongoClient or HTTP connection pool with their
+parent. The app lifespan runs the registered warm-up hooks in the
+background so the first request does not pay for connection setup, and
+closes the clients on shutdown.
+
+Each site's plant data lives in the MongoDB given by MONGODB_URI_<SITE_ID>
+(MONGODB_URI when unset). There is one client, and so one connection pool,
+per distinct URI, so sites on the same deployment share a pool. Sites on
+one MongoDB also share the automation and maintenance collections; their
+documents are kept apart by site id.
+"""
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from pymongo import MongoClient
+from pymongo.collection import Collection
+
+from .log import get_logger
+from .metrics import metrics
+from .site import DEFAULT_SITE_ID, current_site, known_sites
+
+if TYPE_CHECKING:
+    from openai import AzureOpenAI
+
+logger = get_logger(__name__)
+
+MONGODB_URI = os.environ.get("MONGODB_URI", "mongodb://10.10.20.104:27017/")
+# Fail within seconds when MongoDB is unreachable instead of pymongo's 30s default
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "2000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", "2000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGODB_SOCKET_TIMEOUT_MS", "5000"))
+OPENAI_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_TIMEOUT_SECONDS", "60"))
+SCHEDULE_SETTINGS_ID = "chiller_plant_schedule_setting"
+
+_lock = threading.Lock()
+_mongodb_clients: Dict[str, MongoClient] = {}
+_openai_client: Optional["AzureOpenAI"] = None
+_warmup_hooks: List[Tuple[str, Callable[[], None]]] = []
+
+
+def get_mongodb_client(uri: str = MONGODB_URI) -> MongoClient:
+    client = _mongodb_clients.get(uri)
+    if client is None:
+        with _lock:
+            client = _mongodb_clients.get(uri)
+            if client is None:
+                # connect=False defers even the background monitor threads to first use
+                client = _mongodb_clients[uri] = MongoClient(
+                    uri,
+                    connect=False,
+                    serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+                )
+    return client
+
+
+def site_mongodb_uri(site_id: Optional[str] = None) -> str:
+    return os.environ.get(f"MONGODB_URI_{(site_id or current_site()).upper()}", MONGODB_URI)
+
+
+def get_site_mongodb_client(site_id: Optional[str] = None) -> MongoClient:
+    """The client holding a site's plant data (the current request's site by default)"""
+    return get_mongodb_client(site_mongodb_uri(site_id))
+
+
+def get_openai_client() -> "AzureOpenAI":
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                # The openai package is a large import; only pay for it when a completion is needed
+                from openai import AzureOpenAI
+
+                _openai_client = AzureOpenAI(
+                    api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
+                    api_version=os.environ.get("AZURE_OPENAI_API_VERSION"),
+                    azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
+                    timeout=OPENAI_TIMEOUT_SECONDS,
+                )
+    return _openai_client
+
+
+def get_realtime_collection(site_id: Optional[str] = None) -> Collection:
+    site_id = site_id or current_site()
+    return get_site_mongodb_client(site_id)['realtime_data'][site_id]
+
+
+def schedule_settings_id(site_id: Optional[str] = None) -> str:
+    """
+    _id of a site's schedule settings document in the automation collection
+
+    The default site keeps the original document, which the plant's
+    schedule controller reads.
+    """
+    site_id = site_id or current_site()
+    return SCHEDULE_SETTINGS_ID if site_id == DEFAULT_SITE_ID else f"{SCHEDULE_SETTINGS_ID}:{site_id}"
+
+
+def get_automation_collection() -> Collection:
+    return get_site_mongodb_client()['automation_settings']['chiller_plant_schedule_setting']
+
+
+def get_schedule_change_requests_collection() -> Collection:
+    return get_site_mongodb_client()['automation_settings']['schedule_change_requests']
+
+
+def get_maintenance_collection() -> Collection:
+    return get_site_mongodb_client()['maintenance']['equipment_maintenance']
+
+
+def get_token_usage_collection() -> Collection:
+    return get_mongodb_client()['analytics']['token_usage']
+
+
+def register_warmup(name: str, hook: Callable[[], None]):
+    """Add a hook that prepares a client or cache ahead of the first request"""
+    _warmup_hooks.append((name, hook))
+
+
+def warm_up():
+    """Run every warm-up hook; failures are reported and never fatal"""
+    for name, hook in _warmup_hooks:
+        started = time.perf_counter()
+        try:
+            hook()
+            metrics.increment(f"warmup.{name}.ok")
+        except Exception as e:
+            metrics.increment(f"warmup.{name}.failed")
+            logger.warning("Warm-up %s failed: %s", name, e)
+        metrics.observe(f"warmup.{name}_ms", (time.perf_counter() - started) * 1000)
+
+
+def shutdown():
+    """Close the clients and their connection pools"""
+    global _openai_client
+    with _lock:
+        for client in _mongodb_clients.values():
+            client.close()
+        _mongodb_clients.clear()
+        if _openai_client is not None:
+            _openai_client.close()
+            _openai_client = None
+
+
+def _ping_mongodb():
+    for uri in {MONGODB_URI, *(site_mongodb_uri(site_id) for site_id in known_sites())}:
+        get_mongodb_client(uri).admin.command("ping")
+
+
+register_warmup("mongodb", _ping_mongodb)
+register_warmup("openai", get_openai_client)
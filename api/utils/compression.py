@@ -0,0 +1,134 @@
+"""
+Compress streamed chat responses without holding frames back.
+
+Tool results (chiller raw_data, maintenance histories, chart options) make
+up most of a chat's bytes and compress well. A negotiated stream is
+compressed as a whole, so later frames reuse the history of earlier ones,
+but it is flushed after every group of frames: whatever is ready when the
+socket is free goes out at once, optionally after waiting
+STREAM_COMPRESSION_FLUSH_MS for more frames so single tokens do not each
+pay the flush overhead. Brotli is used when the `brotli` package is
+installed and the client accepts it, gzip otherwise.
+"""
+import math
+import os
+import zlib
+from typing import Optional
+
+import anyio
+from fastapi.responses import StreamingResponse
+
+from .metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+STREAM_COMPRESSION = os.environ.get("STREAM_COMPRESSION", "1") == "1"
+# How long to keep collecting frames into one flush; 0 flushes whatever is ready
+STREAM_COMPRESSION_FLUSH_MS = float(os.environ.get("STREAM_COMPRESSION_FLUSH_MS", "20"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The content coding to stream with for an Accept-Encoding header, or None"""
+    if not STREAM_COMPRESSION or not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class StreamCompressor:
+    """Incremental gzip/brotli encoder whose output can be decoded after every flush"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress data and flush it so the client can decode it now"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+async def stream_compressed(response, send, encoding: str):
+    """StreamingResponse.stream_response, compressing and flushing per group of ready frames"""
+    compressor = StreamCompressor(encoding)
+    await send({"type": "http.response.start", "status": response.status_code, "headers": response.raw_headers})
+
+    frames_send, frames_receive = anyio.create_memory_object_stream(math.inf)
+
+    async def pull_frames():
+        async with frames_send:
+            async for chunk in response.body_iterator:
+                await frames_send.send(chunk if isinstance(chunk, bytes) else chunk.encode(response.charset))
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(pull_frames)
+        async with frames_receive:
+            finished = False
+            while not finished:
+                try:
+                    group = [await frames_receive.receive()]
+                except anyio.EndOfStream:
+                    break
+                try:
+                    if STREAM_COMPRESSION_FLUSH_MS > 0:
+                        with anyio.move_on_after(STREAM_COMPRESSION_FLUSH_MS / 1000):
+                            while True:
+                                group.append(await frames_receive.receive())
+                    while True:
+                        group.append(frames_receive.receive_nowait())
+                except anyio.WouldBlock:
+                    pass
+                except anyio.EndOfStream:
+                    finished = True
+
+                data = b"".join(group)
+                body = compressor.compress(data)
+                metrics.increment(f"stream_compression.{encoding}.bytes_in", len(data))
+                metrics.increment(f"stream_compression.{encoding}.bytes_out", len(body))
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    await send({"type": "http.response.body", "body": compressor.finish(), "more_body": False})
+
+
+class CompressibleStreamingResponse(StreamingResponse):
+    """StreamingResponse that compresses with the negotiated encoding, if any"""
+
+    def __init__(self, content, encoding: Optional[str] = None, **kwargs):
+        self.encoding = encoding
+        super().__init__(content, **kwargs)
+        if encoding:
+            self.headers["content-encoding"] = encoding
+            self.headers["vary"] = "Accept-Encoding"
+
+    async def stream_response(self, send):
+        if self.encoding:
+            await stream_compressed(self, send, self.encoding)
+        else:
+            await super().stream_response(send)
@@ -0,0 +1,171 @@
+"""
+Resolve what people call a piece of equipment to its device id.
+
+Users (and the model) write "CH1", "ชิลเลอร์ 1", "chiller1" or "CT-1-2" where
+raw_data and the tools use chiller_1 and ct_1_2. Every device in a site's
+read_devices is indexed under a normalized key: its words joined, with
+known prefix aliases mapped to the prefix used in device ids, and its
+numbers without leading zeros. A name resolves by exact id, then by
+normalized key, then by edit distance over the words only, among the
+devices with exactly the same numbers, so "chilller 1" finds chiller_1
+but never chiller_2. Extra names per device can be listed under
+`equipment_aliases` in the site config. Resolved names are memoized, so
+repeated lookups are a dict hit.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from .site import current_site
+from ..hammy_tools.system import get_site_config
+
+# Spellings of equipment prefixes, mapped to the prefix used in device ids
+PREFIX_ALIASES = {
+    "chiller": "chiller", "ch": "chiller", "ชิลเลอร์": "chiller", "ชิลเลอ": "chiller",
+    "pchp": "pchp",
+    "cdp": "cdp",
+    "ct": "ct", "คูลลิ่งทาวเวอร์": "ct", "คูลลิ่ง": "ct",
+}
+# Words shorter than this are only matched exactly ("ct" is one edit from "ch")
+MIN_FUZZY_LENGTH = 3
+RESOLVED_CACHE_SIZE = 4096
+
+_TOKEN = re.compile(r"\d+|[^\d\s_\-.,:;/#()]+")
+
+Key = Tuple[str, Tuple[str, ...]]
+
+
+def normalize(name: str) -> Optional[Key]:
+    """(words, numbers) of an equipment name, e.g. "CH-01" -> ("chiller", ("1",))"""
+    tokens = _TOKEN.findall(name.lower())
+    words = "".join(token for token in tokens if not token.isdigit())
+    if not words:
+        return None
+    numbers = tuple(str(int(token)) for token in tokens if token.isdigit())
+    return PREFIX_ALIASES.get(words, words), numbers
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or limit + 1 as soon as it must exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_edits(word: str) -> int:
+    return 0 if len(word) < MIN_FUZZY_LENGTH else max(1, len(word) // 4)
+
+
+class EquipmentIndex:
+    """Normalized names of one site's devices"""
+
+    def __init__(self, device_ids: List[str], aliases: Optional[Dict[str, List[str]]] = None):
+        self.device_ids = frozenset(device_ids)
+        self._by_key: Dict[Key, str] = {}
+        # numbers -> every word (device word or alias) naming a device with those numbers
+        self._words: Dict[Tuple[str, ...], Dict[str, str]] = {}
+        self._resolve = lru_cache(maxsize=RESOLVED_CACHE_SIZE)(self._lookup)
+
+        for device_id in sorted(self.device_ids):
+            self._add(normalize(device_id), device_id)
+        for device_id, names in (aliases or {}).items():
+            if device_id in self.device_ids:
+                for name in names or []:
+                    self._add(normalize(str(name)), device_id)
+        # Prefix aliases take part in the fuzzy match too ("ชิลเลอร" is one edit from "ชิลเลอร์")
+        for numbers, words in self._words.items():
+            for alias, prefix in PREFIX_ALIASES.items():
+                if prefix in words:
+                    words.setdefault(alias, words[prefix])
+
+    def resolve(self, name) -> Optional[str]:
+        """The device id a name refers to, or None when it is unknown or ambiguous"""
+        if not isinstance(name, str):
+            return None
+        if name in self.device_ids:
+            return name
+        return self._resolve(name.strip())
+
+    def suggestions(self, name, limit: int = 5) -> List[str]:
+        """Known device ids that look closest to an unresolved name"""
+        key = normalize(name) if isinstance(name, str) else None
+        if key is None:
+            return []
+        word, numbers = key
+        scored = sorted(
+            (edit_distance(word, candidate, len(word)), numbers != candidate_numbers, device_id)
+            for candidate_numbers, words in self._words.items()
+            for candidate, device_id in words.items()
+        )
+        if not scored or scored[0][0] > len(word) // 2:
+            return []
+        best, close = scored[0][0], []
+        for distance, _, device_id in scored:
+            if distance > best or len(close) >= limit:
+                break
+            if device_id not in close:
+                close.append(device_id)
+        return close
+
+    def _add(self, key: Optional[Key], device_id: str):
+        if key is None:
+            return
+        # The first device to claim a name keeps it
+        self._by_key.setdefault(key, device_id)
+        self._words.setdefault(key[1], {}).setdefault(key[0], device_id)
+
+    def _lookup(self, name: str) -> Optional[str]:
+        key = normalize(name)
+        if key is None:
+            return None
+        if key in self._by_key:
+            return self._by_key[key]
+
+        word, numbers = key
+        limit = max_edits(word)
+        if not limit:
+            return None
+        best, matches = limit + 1, set()
+        for candidate, device_id in self._words.get(numbers, {}).items():
+            distance = edit_distance(word, candidate, limit)
+            if distance < best:
+                best, matches = distance, {device_id}
+            elif distance == best:
+                matches.add(device_id)
+        return matches.pop() if best <= limit and len(matches) == 1 else None
+
+
+def get_equipment_index(site_id: Optional[str] = None) -> EquipmentIndex:
+    """The equipment index of a site (the current request's by default)"""
+    return _equipment_index(site_id or current_site())
+
+
+@lru_cache(maxsize=None)
+def _equipment_index(site_id: str) -> EquipmentIndex:
+    site_config = get_site_config(site_id)
+    return EquipmentIndex(
+        list(site_config["volttron_agents"]["bacnet"]["read_devices"]),
+        site_config.get("equipment_aliases")
+    )
+
+
+def resolve_device_id(name) -> Optional[str]:
+    """The current site's device id for a name like "CH1" or "ชิลเลอร์ 1", or None"""
+    return get_equipment_index().resolve(name)
+
+
+def unknown_device(name) -> dict:
+    """Tool result for a name that matches no device, with the closest ids so the model can retry once"""
+    return {
+        "exists": False,
+        "error": f"Equipment {name} does not exist",
+        "did_you_mean": get_equipment_index().suggestions(name),
+    }
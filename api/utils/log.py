@@ -0,0 +1,151 @@
+"""
+Structured logging for the API.
+
+Loggers under "api" hand records to a QueueHandler, so the request and
+tool threads never wait on stdout; a QueueListener thread formats them as
+JSON lines. Every line carries the id of the request it belongs to.
+
+LOG_LEVEL sets the threshold (OFF disables logging entirely, and hot
+paths check isEnabledFor before building their fields). LOG_SAMPLE_RATE
+keeps that fraction of requests' INFO/DEBUG records, whole requests at
+a time; warnings and errors are always kept.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from .site import site_id_var
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_root = logging.getLogger("api")
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_EXCEPTION_FORMATTER = logging.Formatter()
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "site_id"}
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a module, e.g. get_logger(__name__)"""
+    return logging.getLogger(name if name.startswith("api") else f"api.{name}")
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the request and site ids and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "site_id": getattr(record, "site_id", None),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if exc:
+            entry["exc"] = exc
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _RequestContextFilter(logging.Filter):
+    """Stamp the request and site ids and apply per-request sampling, on the calling thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.site_id = site_id_var.get()
+        if record.levelno >= logging.WARNING or LOG_SAMPLE_RATE >= 1.0:
+            return True
+        if record.request_id:
+            # Keep or drop a request's records together
+            return zlib.crc32(record.request_id.encode()) / 0xFFFFFFFF < LOG_SAMPLE_RATE
+        return random.random() < LOG_SAMPLE_RATE
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Render the message and traceback before queueing, keeping them in separate fields"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare folds the traceback into msg and drops exc_info
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Route the api loggers through a background queue listener"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    if LOG_LEVEL == "OFF":
+        # A handler keeps records from falling through to logging.lastResort
+        _root.setLevel(logging.CRITICAL + 1)
+        _root.addHandler(logging.NullHandler())
+        _root.propagate = False
+        return
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(records)
+    _queue_handler.addFilter(_RequestContextFilter())
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JSONFormatter())
+
+    _root.setLevel(LOG_LEVEL)
+    _root.addHandler(_queue_handler)
+    _root.propagate = False
+    _listener = logging.handlers.QueueListener(records, stream_handler)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _root.removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
+
+
+class RequestContextMiddleware:
+    """Give every request an id (x-request-id, taken from the caller when present)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
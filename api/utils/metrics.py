@@ -0,0 +1,51 @@
+"""
+In-process counters and timings exposed at /api/metrics.
+"""
+import threading
+from typing import Callable, Dict
+
+
+class Metrics:
+    """Thread-safe counters, simple timing summaries and pluggable gauges"""
+
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, dict] = {}
+        self._gauges: Dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        """Record one measurement (e.g. a latency in ms) under a name"""
+        with self._lock:
+            timing = self._timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += value
+            timing["max"] = max(timing["max"], value)
+
+    def register(self, name: str, gauge: Callable[[], dict]):
+        """Add a callable whose result is included in every snapshot"""
+        self._gauges[name] = gauge
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {
+                name: {**timing, "avg": timing["total"] / timing["count"] if timing["count"] else 0.0}
+                for name, timing in self._timings.items()
+            }
+
+        gauges = {}
+        for name, gauge in self._gauges.items():
+            try:
+                gauges[name] = gauge()
+            except Exception as e:
+                gauges[name] = {"error": str(e)}
+
+        return {"counters": counters, "timings": timings, **gauges}
+
+
+metrics = Metrics()
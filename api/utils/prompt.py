@@ -1,17 +1,20 @@
-import json
 from enum import Enum
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 from pydantic import BaseModel
+from pydantic_core import to_json
 import base64
-from typing import List, Optional, Any
+from typing import TYPE_CHECKING, List, Optional, Any
 from .attachment import ClientAttachment
 
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
 class ToolInvocationState(str, Enum):
     CALL = 'call'
     PARTIAL_CALL = 'partial-call'
     RESULT = 'result'
 
 class ToolInvocation(BaseModel):
+    # args and result are passed through to the model untouched, so they are not validated further
     state: ToolInvocationState
     toolCallId: str
     toolName: str
@@ -25,7 +28,7 @@ class ClientMessage(BaseModel):
     experimental_attachments: Optional[List[ClientAttachment]] = None
     toolInvocations: Optional[List[ToolInvocation]] = None
 
-def convert_to_openai_messages(messages: List[ClientMessage]) -> List[ChatCompletionMessageParam]:
+def convert_to_openai_messages(messages: List[ClientMessage]) -> List['ChatCompletionMessageParam']:
     openai_messages = []
 
     for message in messages:
@@ -60,7 +63,7 @@ def convert_to_openai_messages(messages: List[ClientMessage]) -> List[ChatComple
                     "type": "function",
                     "function": {
                         "name": toolInvocation.toolName,
-                        "arguments": json.dumps(toolInvocation.args)
+                        "arguments": to_json(toolInvocation.args).decode()
                     }
                 })
 
@@ -77,7 +80,7 @@ def convert_to_openai_messages(messages: List[ClientMessage]) -> List[ChatComple
                 tool_message = {
                     "role": "tool",
                     "tool_call_id": toolInvocation.toolCallId,
-                    "content": json.dumps(toolInvocation.result),
+                    "content": to_json(toolInvocation.result).decode(),
                 }
 
                 openai_messages.append(tool_message)
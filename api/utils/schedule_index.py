@@ -0,0 +1,222 @@
+"""
+Compiled chiller schedules for constant-time "who runs now" lookups.
+
+Stored schedules are lists of {"start": "HH:MM", "stop": "HH:MM"} strings.
+Each chiller's list is compiled once into a minute-of-day bitmask (bit m set
+means the chiller is scheduled during minute m), and every profile keeps a
+1440-slot table of which chillers are on. Lookups index that table, while
+overlaps and gaps are plain bitmask AND/OR operations.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .site import current_site
+
+MINUTES_PER_DAY = 24 * 60
+FULL_DAY_MASK = (1 << MINUTES_PER_DAY) - 1
+# Normal chillers share one schedule list, compiled under this key
+NORMAL_CHILLER_KEY = "normal"
+# Safety net for edits made outside this API (e.g. directly in Mongo)
+REFRESH_INTERVAL_SECONDS = 300
+
+
+def parse_time(value: str) -> int:
+    """Convert HH:MM to minute of day"""
+    hour, minute = value.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+def format_minute(minute: int) -> str:
+    """Convert minute of day to HH:MM"""
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def compile_entries(entries: Optional[List[dict]]) -> int:
+    """
+    Compile schedule entries into a minute-of-day bitmask
+
+    The stop minute is exclusive. A stop earlier than the start wraps past
+    midnight within the same profile, and equal start and stop means all day.
+    """
+    mask = 0
+    for entry in entries or []:
+        if not isinstance(entry, dict) or not entry.get("start") or not entry.get("stop"):
+            continue
+        start, stop = parse_time(entry["start"]), parse_time(entry["stop"])
+        if start < stop:
+            mask |= ((1 << (stop - start)) - 1) << start
+        elif start > stop:
+            mask |= (FULL_DAY_MASK >> start << start) | ((1 << stop) - 1)
+        else:
+            mask |= FULL_DAY_MASK
+    return mask
+
+
+def mask_to_intervals(mask: int) -> List[dict]:
+    """Convert a minute-of-day bitmask back to start/stop intervals"""
+    intervals = []
+    minute = 0
+    while mask:
+        # Skip to the next set bit, then measure the run of set bits
+        skip = (mask & -mask).bit_length() - 1
+        mask >>= skip
+        minute += skip
+        run = (~mask & (mask + 1)).bit_length() - 1
+        intervals.append({
+            "start": format_minute(minute),
+            "stop": format_minute((minute + run) % MINUTES_PER_DAY)
+        })
+        mask >>= run
+        minute += run
+
+    # Join a run that ends at midnight with the one starting at midnight
+    if len(intervals) > 1 and intervals[0]["start"] == "00:00" and intervals[-1]["stop"] == "00:00":
+        last = intervals.pop()
+        intervals[0] = {"start": last["start"], "stop": intervals[0]["stop"]}
+    return intervals
+
+
+class CompiledProfile:
+    """Bitmasks and a per-minute lookup table for one schedule profile"""
+
+    def __init__(self):
+        self.masks: Dict[str, int] = {}
+        self.running: List[Tuple[str, ...]] = [()] * MINUTES_PER_DAY
+        self.overlaps: Dict[Tuple[str, str], int] = {}
+        self.coverage = 0
+
+    def set_chiller(self, chiller_id: str, entries: Optional[List[dict]]):
+        """Recompile one chiller and patch only the minutes whose state changed"""
+        old_mask = self.masks.get(chiller_id, 0)
+        new_mask = compile_entries(entries)
+        if new_mask:
+            self.masks[chiller_id] = new_mask
+        else:
+            self.masks.pop(chiller_id, None)
+
+        changed = old_mask ^ new_mask
+        for minute in _set_bits(changed):
+            self.running[minute] = tuple(
+                chiller for chiller in sorted(self.masks) if self.masks[chiller] >> minute & 1
+            )
+
+        self._refresh_derived(chiller_id)
+
+    def _refresh_derived(self, chiller_id: str):
+        """Update the pairwise overlaps touching one chiller and the total coverage"""
+        self.overlaps = {pair: mask for pair, mask in self.overlaps.items() if chiller_id not in pair}
+        mask = self.masks.get(chiller_id, 0)
+        for other, other_mask in self.masks.items():
+            if other == chiller_id or not mask & other_mask:
+                continue
+            self.overlaps[tuple(sorted((chiller_id, other)))] = mask & other_mask
+
+        coverage = 0
+        for chiller_mask in self.masks.values():
+            coverage |= chiller_mask
+        self.coverage = coverage
+
+    def running_at(self, minute: int) -> Tuple[str, ...]:
+        return self.running[minute]
+
+    def gaps(self) -> List[dict]:
+        """Intervals where no chiller in this profile is scheduled"""
+        return mask_to_intervals(FULL_DAY_MASK & ~self.coverage)
+
+    def overlap_intervals(self) -> List[dict]:
+        return [
+            {"chillers": list(pair), "intervals": mask_to_intervals(mask)}
+            for pair, mask in sorted(self.overlaps.items())
+        ]
+
+
+class ScheduleIndex:
+    """Compiled view of the chiller_plant_schedule_setting document"""
+
+    def __init__(self):
+        self._profiles: Dict[str, CompiledProfile] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def load(self, settings: Optional[dict]):
+        """Rebuild every profile from a settings document"""
+        profiles = {}
+        for profile_type, profile in ((settings or {}).get("profile") or {}).items():
+            compiled = CompiledProfile()
+            for chiller_id, entries in (profile.get("excluded_chiller") or {}).items():
+                compiled.set_chiller(chiller_id, entries)
+            normal_entries = [entry for entry in profile.get("normal_chiller") or [] if isinstance(entry, dict)]
+            if normal_entries:
+                compiled.set_chiller(NORMAL_CHILLER_KEY, normal_entries)
+            profiles[profile_type] = compiled
+
+        with self._lock:
+            self._profiles = profiles
+            self._loaded_at = time.monotonic()
+
+    def update(self, profile_type: str, chiller_id: str, entries: Optional[List[dict]]):
+        """Recompile a single chiller of a single profile after a schedule write"""
+        with self._lock:
+            if self._loaded_at is None:
+                # Nothing compiled yet; the next lookup loads everything
+                return
+            self._profiles.setdefault(profile_type, CompiledProfile()).set_chiller(chiller_id, entries)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > REFRESH_INTERVAL_SECONDS
+
+    def profile(self, profile_type: str) -> Optional[CompiledProfile]:
+        return self._profiles.get(profile_type)
+
+    def who_runs(self, at: datetime, profile_type: Optional[str] = None) -> dict:
+        """Describe which chillers are scheduled at a point in time"""
+        profile_type = profile_type or profile_type_for(at)
+        compiled = self.profile(profile_type)
+        minute = at.hour * 60 + at.minute
+        if compiled is None:
+            return {
+                "profile_type": profile_type,
+                "time": format_minute(minute),
+                "chillers": [],
+                "overlaps": [],
+                "gaps": [{"start": "00:00", "stop": "00:00"}]
+            }
+
+        return {
+            "profile_type": profile_type,
+            "time": format_minute(minute),
+            "chillers": list(compiled.running_at(minute)),
+            "overlaps": compiled.overlap_intervals(),
+            "gaps": compiled.gaps()
+        }
+
+
+def profile_type_for(at: datetime) -> str:
+    """Pick the profile for a date; holidays must be requested explicitly"""
+    return "weekend_profile" if at.weekday() >= 5 else "weekday_profile"
+
+
+def _set_bits(mask: int):
+    """Yield the positions of set bits, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+_schedule_indexes: Dict[str, ScheduleIndex] = {}
+
+
+def get_schedule_index(site_id: Optional[str] = None) -> ScheduleIndex:
+    """The compiled schedules of a site (the current request's by default)"""
+    site_id = site_id or current_site()
+    index = _schedule_indexes.get(site_id)
+    if index is None:
+        index = _schedule_indexes.setdefault(site_id, ScheduleIndex())
+    return index
@@ -0,0 +1,84 @@
+"""
+Coalesce identical concurrent calls into one backend query.
+
+When an alarm goes off, many operators ask about the same chiller at the
+same moment. Calls that arrive while an identical call (same site, same
+name, same arguments once defaults are bound) is still running wait for that call
+and share its result instead of querying MongoDB again. Only read-only
+tools may go through here; nothing is cached once the call returns.
+"""
+import copy
+import functools
+import inspect
+import json
+import threading
+from typing import Any, Callable, Dict
+
+from .metrics import metrics
+from .site import current_site
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Tracks in-flight calls by key"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func: Callable, *args, **kwargs):
+        """Run func, or wait for the identical call already running and share its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            metrics.increment("singleflight.executed")
+            try:
+                call.result = func(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            metrics.increment("singleflight.deduplicated")
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        # Followers get their own copy so nobody can change another caller's result
+        return call.result if leader else copy.deepcopy(call.result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+single_flight = SingleFlight()
+
+
+@functools.lru_cache(maxsize=None)
+def coalesced(name: str, func: Callable) -> Callable:
+    """Wrap a read-only tool so identical concurrent calls share one execution"""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = current_site() + ":" + name + ":" + json.dumps(bound.arguments, sort_keys=True, default=str)
+        return single_flight.do(key, func, *args, **kwargs)
+    return wrapper
+
+
+metrics.register("singleflight", lambda: {"in_flight": single_flight.in_flight()})
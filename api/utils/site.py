@@ -0,0 +1,119 @@
+"""
+Which plant a request is about.
+
+One deployment serves every site with a config in SITE_CONFIG_DIR
+(`<site_id>.yaml`). A request picks its site with the x-site-id header or
+the site_id query parameter; DEFAULT_SITE_ID is used when neither is
+given. SiteContextMiddleware puts the site in a context variable, which
+follows the request into worker threads, tool calls and background
+streams. Site config, realtime collection, system prompt and caches all
+resolve through current_site(). Collections that sites on one MongoDB
+share (schedule settings, idempotency keys, maintenance records) are
+scoped by site id in every query.
+"""
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, FrozenSet, Optional
+from urllib.parse import parse_qs
+
+# One or more directories, separated by os.pathsep; the first holding a site's config wins
+SITE_CONFIG_DIR = os.environ.get(
+    "SITE_CONFIG_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "hammy_tools")
+)
+SITE_CONFIG_DIRS = [directory for directory in SITE_CONFIG_DIR.split(os.pathsep) if directory]
+DEFAULT_SITE_ID = os.environ.get("DEFAULT_SITE_ID", "cp10")
+
+site_id_var: ContextVar[str] = ContextVar("site_id", default=DEFAULT_SITE_ID)
+
+
+def current_site() -> str:
+    return site_id_var.get()
+
+
+@lru_cache(maxsize=1)
+def known_sites() -> FrozenSet[str]:
+    """Site ids with a config file"""
+    return frozenset(
+        name[:-len(".yaml")]
+        for directory in SITE_CONFIG_DIRS
+        for name in os.listdir(directory)
+        if name.endswith(".yaml")
+    )
+
+
+def site_config_path(site_id: str) -> str:
+    for directory in SITE_CONFIG_DIRS:
+        path = os.path.join(directory, f"{site_id}.yaml")
+        if os.path.exists(path):
+            return path
+    return os.path.join(SITE_CONFIG_DIRS[0], f"{site_id}.yaml")
+
+
+@contextmanager
+def site_context(site_id: str):
+    """Run a block (a background thread, a replay) as if it were a request for site_id"""
+    token = site_id_var.set(site_id)
+    try:
+        yield
+    finally:
+        site_id_var.reset(token)
+
+
+def site_filter(site_id: Optional[str] = None) -> dict:
+    """
+    Query filter for a site's documents in collections that several sites share
+
+    Documents written before multi-site support have no site_id and belong
+    to DEFAULT_SITE_ID.
+    """
+    site_id = site_id or current_site()
+    if site_id == DEFAULT_SITE_ID:
+        return {"site_id": {"$in": [site_id, None]}}
+    return {"site_id": site_id}
+
+
+def for_each_site(func: Callable[[], None]):
+    """Call func once in the context of every known site (e.g. to warm up per-site caches)"""
+    for site_id in sorted(known_sites()):
+        with site_context(site_id):
+            func()
+
+
+class SiteContextMiddleware:
+    """Select the request's site from x-site-id or ?site_id=, answering 404 for unknown sites"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        site_id = headers.get(b"x-site-id", b"").decode("latin-1")
+        if not site_id:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            site_id = (query.get("site_id") or [DEFAULT_SITE_ID])[0]
+
+        if site_id not in known_sites():
+            body = json.dumps({"detail": f"Unknown site: {site_id}"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 404,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_site_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-site-id", site_id.encode("latin-1"))]
+            await send(message)
+
+        with site_context(site_id):
+            await self.app(scope, receive, send_with_site_id)
@@ -0,0 +1,150 @@
+"""
+Pluggable key/value store for state that several workers may need to share.
+
+STATE_BACKEND=memory (default) keeps everything in the worker process.
+STATE_BACKEND=mongo stores entries in MongoDB, so every worker and host
+behind the load balancer sees the same entries.
+
+Conversations are not kept here: the client sends the whole history with
+every chat request, so any worker can answer any turn. Only caches and
+other derived state go through this backend.
+"""
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import ASCENDING
+
+from .clients import get_mongodb_client
+
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")
+STATE_MONGO_DB = os.environ.get("STATE_MONGO_DB", "ai_sdk_api")
+# Per-namespace cap for the in-memory backend
+STATE_MEMORY_MAX_ENTRIES = int(os.environ.get("STATE_MEMORY_MAX_ENTRIES", "1024"))
+
+
+class StateBackend(ABC):
+    """Interface for namespaced entries with a time to live"""
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """The live value of a key, or None"""
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: float):
+        """Store a value that expires after ttl_seconds"""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        """Remove one key"""
+
+    @abstractmethod
+    def clear(self, namespace: str):
+        """Remove every key of a namespace"""
+
+    @abstractmethod
+    def count(self, namespace: str) -> int:
+        """Number of keys stored in a namespace, expired ones included until they are evicted"""
+
+
+class MemoryStateBackend(StateBackend):
+    """LRU dicts per namespace, local to this worker"""
+
+    def __init__(self, max_entries: int = STATE_MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._namespaces: Dict[str, "OrderedDict[str, tuple]"] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            item = entries.get(key) if entries else None
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: float):
+        with self._lock:
+            entries = self._namespaces.setdefault(namespace, OrderedDict())
+            entries[key] = (value, time.monotonic() + ttl_seconds)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._namespaces.get(namespace, {}).pop(key, None)
+
+    def clear(self, namespace: str):
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return len(self._namespaces.get(namespace, ()))
+
+
+class MongoStateBackend(StateBackend):
+    """Entries in one MongoDB collection, expired by a TTL index"""
+
+    def __init__(self, database: str = STATE_MONGO_DB, collection: str = "shared_state"):
+        self.database = database
+        self.collection_name = collection
+        self._indexes_ready = False
+
+    @property
+    def collection(self):
+        collection = get_mongodb_client()[self.database][self.collection_name]
+        if not self._indexes_ready:
+            collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+            collection.create_index([("namespace", ASCENDING)])
+            self._indexes_ready = True
+        return collection
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        # The TTL monitor only runs once a minute, so check expiry here too
+        document = self.collection.find_one({
+            "_id": f"{namespace}:{key}",
+            "expires_at": {"$gt": datetime.now(timezone.utc)}
+        })
+        return document["value"] if document else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: float):
+        self.collection.replace_one(
+            {"_id": f"{namespace}:{key}"},
+            {
+                "namespace": namespace,
+                "value": value,
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+            },
+            upsert=True
+        )
+
+    def delete(self, namespace: str, key: str):
+        self.collection.delete_one({"_id": f"{namespace}:{key}"})
+
+    def clear(self, namespace: str):
+        self.collection.delete_many({"namespace": namespace})
+
+    def count(self, namespace: str) -> int:
+        return self.collection.count_documents({"namespace": namespace})
+
+
+def create_state_backend(name: str = STATE_BACKEND) -> StateBackend:
+    if name == "memory":
+        return MemoryStateBackend()
+    if name == "mongo":
+        return MongoStateBackend()
+    raise ValueError(f"Unknown STATE_BACKEND: {name}")
+
+
+state_backend = create_state_backend()
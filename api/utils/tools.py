@@ -1,23 +1,64 @@
+import os
 import requests
-from pymongo import MongoClient
+import pendulum
 from datetime import datetime
-
-mongodb_client = MongoClient('mongodb://10.10.20.104:27017/')
-realtime_db = mongodb_client['realtime_data']
-realtime_collection = realtime_db['cp10']
-
-# Connect to MongoDB for automation settings
-automation_db = mongodb_client['automation_settings']
-automation_collection = automation_db['chiller_plant_schedule_setting']
-
-# Connect to MongoDB for maintenance data
-maintenance_db = mongodb_client['maintenance']
-maintenance_collection = maintenance_db['equipment_maintenance']
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+from .circuit_breaker import guarded, is_degraded
+from .clients import (
+    get_automation_collection,
+    get_maintenance_collection,
+    get_realtime_collection,
+    register_warmup,
+    schedule_settings_id,
+)
+from .equipment_index import get_equipment_index, resolve_device_id, unknown_device
+from .log import get_logger
+from .schedule_index import get_schedule_index, parse_time
+from .singleflight import coalesced
+from .site import current_site, for_each_site, site_filter
+from .state import state_backend
+from ..services.anomaly import anomaly_detector
+from ..services.plant_digest import plant_digest
+from ..hammy_tools.system import get_site_config
+
+logger = get_logger(__name__)
+
+WEATHER_TIMEOUT_SECONDS = float(os.environ.get("WEATHER_TIMEOUT_SECONDS", "5"))
+# How long the bulk "under maintenance" view is served before it is re-read
+MAINTENANCE_CACHE_TTL_SECONDS = float(os.environ.get("MAINTENANCE_CACHE_TTL_SECONDS", "60"))
+MAINTENANCE_CACHE_NAMESPACE = "maintenance_status"
+
+# Tools that only read data; their results can be cached, shared or fetched early
+READ_ONLY_TOOLS = {
+    "get_current_weather",
+    "generate_mock_chart",
+    "get_chiller_status",
+    "get_equipment_status",
+    "get_all_chillers",
+    "get_plant_digest",
+    "get_anomalies",
+    "get_maintenance_status",
+    "get_maintenance_history",
+    "get_schedule",
+    "get_scheduled_chillers",
+    "check_schedule_availability",
+}
+
+# Tools whose answers change with every realtime snapshot
+REALTIME_TOOLS = {
+    "get_chiller_status",
+    "get_equipment_status",
+    "get_all_chillers",
+    "get_plant_digest",
+    "get_anomalies",
+}
 
 
 def get_tools():
-    """Get all available tools"""
-    return {
+    """Get all available tools; identical concurrent read-only calls share one query"""
+    tools = {
         "get_current_weather": get_current_weather,
         "generate_mock_chart": generate_mock_chart,
         # "get_current_chiller_schedule": get_current_chiller_schedule,
@@ -25,21 +66,29 @@ def get_tools():
         "get_chiller_status": get_chiller_status,
         "get_equipment_status": get_equipment_status,
         "get_all_chillers": get_all_chillers,
+        "get_plant_digest": get_plant_digest,
+        "get_anomalies": get_anomalies,
         "get_maintenance_status": get_maintenance_status,
         "get_maintenance_history": get_maintenance_history,
         "get_schedule": get_schedule,
+        "get_scheduled_chillers": get_scheduled_chillers,
         "check_schedule_availability": check_schedule_availability,
         "add_schedule": add_schedule,
         "requests_to_set_maintenance_status": requests_to_set_maintenance_status,
     }
+    return {
+        name: coalesced(name, tool) if name in READ_ONLY_TOOLS else tool
+        for name, tool in tools.items()
+    }
 
+@guarded("weather", (requests.ConnectionError, requests.Timeout))
 def get_current_weather(latitude, longitude):
     # Format the URL with proper parameter substitution
     url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m&hourly=temperature_2m&daily=sunrise,sunset&timezone=auto"
 
     try:
         # Make the API call
-        response = requests.get(url)
+        response = requests.get(url, timeout=WEATHER_TIMEOUT_SECONDS)
 
         # Raise an exception for bad status codes
         response.raise_for_status()
@@ -47,9 +96,11 @@ def get_current_weather(latitude, longitude):
         # Return the JSON response
         return response.json()
 
+    except (requests.ConnectionError, requests.Timeout):
+        raise
     except requests.RequestException as e:
         # Handle any errors that occur during the request
-        print(f"Error fetching weather data: {e}")
+        logger.error("Error fetching weather data: %s", e)
         return None
 
 def generate_mock_chart():
@@ -111,38 +162,53 @@ def request_to_set_chiller_sequence_schedule(chiller_id: str, profile_type: str,
 
 
 
+@guarded("mongodb", PyMongoError)
 def get_chiller_status(chiller_id):
     """Get status of a specific chiller with all relevant metrics"""
+    resolved = resolve_device_id(chiller_id)
+    if resolved is None:
+        return unknown_device(chiller_id)
+    chiller_id = resolved
     try:
-        latest_data = realtime_collection.find_one(
+        latest_data = get_realtime_collection().find_one(
             {"raw_data." + chiller_id: {"$exists": True}},
             sort=[('_id', -1)]
         )
         if latest_data and chiller_id in latest_data["raw_data"]:
             return latest_data["raw_data"][chiller_id]
         return None
+    except PyMongoError:
+        raise
     except Exception as e:
-        print(f"Error getting chiller status: {str(e)}")
+        logger.error("Error getting chiller status: %s", e)
         return None
 
+@guarded("mongodb", PyMongoError)
 def get_equipment_status(equipment_id):
     """Get status of any equipment (pumps, cooling towers, etc.)"""
+    resolved = resolve_device_id(equipment_id)
+    if resolved is None:
+        return unknown_device(equipment_id)
+    equipment_id = resolved
     try:
-        latest_data = realtime_collection.find_one(
+        latest_data = get_realtime_collection().find_one(
             {"raw_data." + equipment_id: {"$exists": True}},
             sort=[('_id', -1)]
         )
         if latest_data and equipment_id in latest_data["raw_data"]:
             return latest_data["raw_data"][equipment_id]
         return None
+    except PyMongoError:
+        raise
     except Exception as e:
-        print(f"Error getting equipment status: {str(e)}")
+        logger.error("Error getting equipment status: %s", e)
         return None
 
+@guarded("mongodb", PyMongoError)
 def get_all_chillers():
     """Get status of all chillers"""
     try:
-        latest_data = realtime_collection.find_one(sort=[('_id', -1)])
+        latest_data = get_realtime_collection().find_one(sort=[('_id', -1)])
         if latest_data:
             chiller_data = {}
             for key in latest_data["raw_data"]:
@@ -150,39 +216,94 @@ def get_all_chillers():
                     chiller_data[key] = latest_data["raw_data"][key]
             return chiller_data
         return {}
+    except PyMongoError:
+        raise
     except Exception as e:
-        print(f"Error getting all chillers: {str(e)}")
+        logger.error("Error getting all chillers: %s", e)
         return {}
 
 
+@guarded("mongodb", PyMongoError)
+def get_plant_digest():
+    """Plant-wide summary of the latest realtime snapshot"""
+    digest = plant_digest.current()
+    if digest is not None:
+        return digest
+    # Nothing has arrived through the realtime feed yet
+    latest_data = get_realtime_collection().find_one(sort=[('_id', -1)])
+    return plant_digest.update(latest_data) if latest_data else None
+
+
+def get_anomalies(device_id=None):
+    """Points behaving unusually on the latest realtime snapshot, for all equipment or one device"""
+    if not device_id:
+        return anomaly_detector.current()
+    resolved = resolve_device_id(device_id)
+    if resolved is None:
+        return unknown_device(device_id)
+    return anomaly_detector.current(resolved)
+
+
+@guarded("mongodb", PyMongoError)
 def get_maintenance_history(equipment_id, start_date=None, end_date=None):
     """Get maintenance history for specific equipment within date range"""
+    resolved = resolve_device_id(equipment_id)
+    if resolved is None:
+        return unknown_device(equipment_id)
+    equipment_id = resolved
     try:
-        query = {"equipment_id": equipment_id}
+        query = {"equipment_id": equipment_id, **site_filter()}
         if start_date and end_date:
             query["timestamp"] = {
                 "$gte": start_date,
                 "$lte": end_date
             }
         
-        history = list(maintenance_collection.find(
+        history = list(get_maintenance_collection().find(
             query,
             sort=[('timestamp', -1)]
         ))
         return history
+    except PyMongoError:
+        raise
     except Exception as e:
-        print(f"Error getting maintenance history: {str(e)}")
+        logger.error("Error getting maintenance history: %s", e)
         return None
 
+@guarded("mongodb", PyMongoError)
 def get_schedule(profile_type):
     """Get schedule for a specific profile type with excluded chillers"""
     try:
-        settings = automation_collection.find_one({"_id": "chiller_plant_schedule_setting"})
+        settings = get_automation_collection().find_one({"_id": schedule_settings_id()})
         if settings and "profile" in settings and profile_type in settings["profile"]:
             return settings["profile"][profile_type]
         return None
+    except PyMongoError:
+        raise
     except Exception as e:
-        print(f"Error getting schedule: {str(e)}")
+        logger.error("Error getting schedule: %s", e)
+        return None
+
+def get_compiled_schedules():
+    """Return the compiled schedule index, loading it from MongoDB when stale"""
+    schedule_index = get_schedule_index()
+    if schedule_index.is_stale():
+        schedule_index.load(get_automation_collection().find_one({"_id": schedule_settings_id()}))
+    return schedule_index
+
+@guarded("mongodb", PyMongoError)
+def get_scheduled_chillers(time=None, profile_type=None):
+    """Get which chillers are scheduled to run at a time (HH:MM, default now), plus overlaps and gaps"""
+    try:
+        at = pendulum.now(tz=get_site_config()['timezone'])
+        if time:
+            minute = parse_time(time)
+            at = at.replace(hour=minute // 60, minute=minute % 60)
+        return get_compiled_schedules().who_runs(at, profile_type)
+    except PyMongoError:
+        raise
+    except Exception as e:
+        logger.error("Error getting scheduled chillers: %s", e)
         return None
 
 def check_schedule_availability(chiller_id, profile_type, start_time, stop_time):
@@ -190,6 +311,8 @@ def check_schedule_availability(chiller_id, profile_type, start_time, stop_time)
     try:
         # Get current schedule
         schedule = get_schedule(profile_type)
+        if is_degraded(schedule):
+            return False, "Schedule data is temporarily unavailable"
         if not schedule:
             return False, "Schedule not found"
 
@@ -211,39 +334,43 @@ def add_schedule(profile_type, chiller_type, schedule_entry):
                 "message": "Cannot modify schedule for normal chillers. Only excluded chillers can be rescheduled."
             }
 
-        settings = automation_collection.find_one({"_id": "chiller_plant_schedule_setting"})
+        settings = get_automation_collection().find_one({"_id": schedule_settings_id()})
         if not settings:
             return {
                 "success": False,
                 "message": "No schedule settings found"
             }
 
-        # Get current schedules
-        current_schedules = []
-        if profile_type in settings.get("profile", {}) and \
-            "excluded_chiller" in settings["profile"][profile_type] and \
-            chiller_type in settings["profile"][profile_type]["excluded_chiller"]:
-            current_schedules = settings["profile"][profile_type]["excluded_chiller"][chiller_type]
-
-        # Format the response to match frontend expectations
-        return {
-            "success": True,
-            "message": f"Schedule preview for {chiller_type}",
-            "data": {
-                "chiller_id": chiller_type,
-                "profile_type": profile_type,
-                "old_schedule": [{"start": entry.get("start"), "stop": entry.get("stop")} for entry in current_schedules] if current_schedules else [{"start": None, "stop": None}],
-                "new_schedule": [{"start": entry["start"], "stop": entry["stop"]} for entry in schedule_entry]
-            }
-        }
+        return preview_schedule(settings, profile_type, chiller_type, schedule_entry)
 
     except Exception as e:
-        print(f"Error checking schedule: {str(e)}")
+        logger.error("Error checking schedule: %s", e)
         return {
             "success": False,
             "message": f"Failed to check schedule: {str(e)}"
         }
 
+def preview_schedule(settings, profile_type, chiller_type, schedule_entry):
+    """Build the old/new schedule preview for a chiller from already loaded settings"""
+    # Get current schedules
+    current_schedules = []
+    if profile_type in settings.get("profile", {}) and \
+        "excluded_chiller" in settings["profile"][profile_type] and \
+        chiller_type in settings["profile"][profile_type]["excluded_chiller"]:
+        current_schedules = settings["profile"][profile_type]["excluded_chiller"][chiller_type]
+
+    # Format the response to match frontend expectations
+    return {
+        "success": True,
+        "message": f"Schedule preview for {chiller_type}",
+        "data": {
+            "chiller_id": chiller_type,
+            "profile_type": profile_type,
+            "old_schedule": [{"start": entry.get("start"), "stop": entry.get("stop")} for entry in current_schedules] if current_schedules else [{"start": None, "stop": None}],
+            "new_schedule": [{"start": entry["start"], "stop": entry["stop"]} for entry in schedule_entry]
+        }
+    }
+
 def confirm_schedule(profile_type, chiller_type, schedule_entries):
     """Confirm and apply schedule changes to MongoDB"""
     try:
@@ -262,10 +389,10 @@ def confirm_schedule(profile_type, chiller_type, schedule_entries):
                 }
 
         # Get current settings or create new if not exists
-        settings = automation_collection.find_one({"_id": "chiller_plant_schedule_setting"})
+        settings = get_automation_collection().find_one({"_id": schedule_settings_id()})
         if not settings:
             settings = {
-                "_id": "chiller_plant_schedule_setting",
+                "_id": schedule_settings_id(),
                 "profile": {},
                 "enable_schedule_control": True
             }
@@ -283,13 +410,14 @@ def confirm_schedule(profile_type, chiller_type, schedule_entries):
         settings["profile"][profile_type]["excluded_chiller"][chiller_type] = schedule_entries
 
         # Update MongoDB with the new settings
-        result = automation_collection.replace_one(
-            {"_id": "chiller_plant_schedule_setting"},
+        result = get_automation_collection().replace_one(
+            {"_id": schedule_settings_id()},
             settings,
             upsert=True
         )
 
         if result.modified_count > 0 or result.upserted_id:
+            get_schedule_index().update(profile_type, chiller_type, schedule_entries)
             return {
                 "success": True,
                 "message": "Schedules updated successfully in MongoDB",
@@ -307,7 +435,7 @@ def confirm_schedule(profile_type, chiller_type, schedule_entries):
             }
 
     except Exception as e:
-        print(f"Error confirming schedule: {str(e)}")
+        logger.error("Error confirming schedule: %s", e)
         return {
             "success": False,
             "message": f"Failed to update schedule: {str(e)}"
@@ -317,38 +445,107 @@ def confirm_schedule(profile_type, chiller_type, schedule_entries):
 
 
 
+@guarded("mongodb", PyMongoError)
 def get_maintenance_status(device_id=None):
-    """Get maintenance status for specific equipment or all equipment"""
+    """Get maintenance status for specific equipment, or every device currently under maintenance"""
     try:
-        if device_id:
-            maintenance_data = maintenance_collection.find_one(
-                {"device_id": device_id},
-                sort=[('timestamp', -1)]
-            )
-            status_ = maintenance_data.get('status')
-            maintenance_history = maintenance_data.get('maintenance_history')
-            return {
-                "device_id": device_id, 
-                "under_maintenance": status_['under_maintenance'],
-                "ticket_started_by": maintenance_history[0]["ticket_started_by"] if maintenance_history else None,
-                "ticked_closed_by": maintenance_history[0]["ticket_closed_by"] if maintenance_history else None,
-                "technician": maintenance_history[0]["technician"] if maintenance_history else None,
-                "resolved_at": maintenance_history[0]["resolved_at"] if maintenance_history else None,
-                "reported_at": maintenance_history[0]["reported_at"] if maintenance_history else None,
-                }
-            
-        return {}
-            
+        if not device_id:
+            return get_devices_under_maintenance()
+        resolved = resolve_device_id(device_id)
+        if resolved is None:
+            return unknown_device(device_id)
+        device_id = resolved
+
+        maintenance_data = get_maintenance_collection().find_one(
+            {"device_id": device_id, **site_filter()},
+            sort=[('timestamp', -1)]
+        )
+        if not maintenance_data:
+            return None
+        history = maintenance_data.get('maintenance_history')
+        return _maintenance_summary(device_id, maintenance_data.get('status'), history[0] if history else None)
+
+    except PyMongoError:
+        raise
     except Exception as e:
-        print(f"Error getting maintenance status: {str(e)}")
+        logger.error("Error getting maintenance status: %s", e)
         return None
+
+
+def get_devices_under_maintenance():
+    """Every device of the site whose latest maintenance record is open, from one aggregation over the device_id/timestamp index"""
+    cached = _cached_maintenance_view()
+    if cached is not None:
+        return cached
+
+    latest = get_maintenance_collection().aggregate([
+        {"$match": site_filter()},
+        {"$sort": {"device_id": ASCENDING, "timestamp": DESCENDING}},
+        {"$group": {
+            "_id": "$device_id",
+            "status": {"$first": "$status"},
+            "ticket": {"$first": {"$arrayElemAt": ["$maintenance_history", 0]}},
+        }},
+        {"$match": {"status.under_maintenance": True}},
+        {"$sort": {"_id": ASCENDING}},
+    ])
+    devices = [_maintenance_summary(row["_id"], row.get("status"), row.get("ticket")) for row in latest]
+    result = {"devices": devices, "count": len(devices)}
+    try:
+        state_backend.set(MAINTENANCE_CACHE_NAMESPACE, current_site(), result, MAINTENANCE_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.error("Error caching maintenance view: %s", e)
+    return result
+
+
+def invalidate_maintenance_view():
+    """Drop the cached bulk view so the next read sees the latest maintenance records"""
+    try:
+        state_backend.delete(MAINTENANCE_CACHE_NAMESPACE, current_site())
+    except Exception as e:
+        logger.error("Error invalidating maintenance view: %s", e)
+
+
+def _cached_maintenance_view():
+    try:
+        return state_backend.get(MAINTENANCE_CACHE_NAMESPACE, current_site())
+    except Exception as e:
+        logger.error("Error reading maintenance view: %s", e)
+        return None
+
+
+def _maintenance_summary(device_id, status, ticket):
+    ticket = ticket or {}
+    return {
+        "device_id": device_id,
+        "under_maintenance": bool((status or {}).get('under_maintenance')),
+        "ticket_started_by": ticket.get("ticket_started_by"),
+        "ticked_closed_by": ticket.get("ticket_closed_by"),
+        "technician": ticket.get("technician"),
+        "resolved_at": ticket.get("resolved_at"),
+        "reported_at": ticket.get("reported_at"),
+    }
+
+
+def _create_maintenance_index():
+    get_maintenance_collection().create_index(
+        [("device_id", ASCENDING), ("timestamp", DESCENDING)],
+        name="device_id_timestamp"
+    )
     
 
 def requests_to_set_maintenance_status(device_id: str, ticked_started_by: str, technician: str, description: str):
     """Requests to update maintenance status from individual equipment by device_id"""
     try:
+        device_id = resolve_device_id(device_id) or device_id
         check_device_maintenance = get_maintenance_status(device_id)
-        if not check_device_maintenance:
+        if is_degraded(check_device_maintenance):
+            return {
+                "success": False,
+                "message": "Maintenance data is temporarily unavailable. Please try again shortly.",
+                "data": None
+            }
+        if not check_device_maintenance or check_device_maintenance.get("exists") is False:
             return {
                 "success": False,
                 "message": f"Device {device_id} not found",
@@ -369,7 +566,7 @@ def requests_to_set_maintenance_status(device_id: str, ticked_started_by: str, t
             }
         
     except Exception as e:
-        print(f"Error BRO Requesting maintenance status: {str(e)}")
+        logger.error("Error requesting maintenance status: %s", e)
         return {
             "success": False,
             "message": str(e),
@@ -377,3 +574,7 @@ def requests_to_set_maintenance_status(device_id: str, ticked_started_by: str, t
         }
 
 
+register_warmup("site_config", lambda: for_each_site(get_site_config))
+register_warmup("schedule_index", lambda: for_each_site(get_compiled_schedules))
+register_warmup("equipment_index", lambda: for_each_site(get_equipment_index))
+register_warmup("maintenance_index", lambda: for_each_site(_create_maintenance_index))
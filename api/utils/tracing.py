@@ -0,0 +1,69 @@
+"""
+Record chat completions as replayable traces.
+
+With TRACE_RECORD_DIR set, every chat request answered by the LLM is
+written to that directory as one JSON file: the messages it was asked
+with, the raw chunks of the Azure stream, the tool calls with their
+arguments and results, the token usage and the frames sent to the client.
+`python -m evals` groups these into scenarios and replays them (see
+evals/__init__.py). Recording is off by default; chunks are only
+serialized while it is on.
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+from .log import get_logger, request_id_var
+from .site import current_site
+
+logger = get_logger(__name__)
+
+TRACE_RECORD_DIR = os.environ.get("TRACE_RECORD_DIR")
+
+
+class Trace:
+    """Everything needed to replay one chat request"""
+
+    def __init__(self, messages: List[dict]):
+        self.messages = messages
+        self.completions: List[dict] = []
+        self.started = time.monotonic()
+
+    def record_stream(self, stream, model: str, request_chars: int) -> Iterator:
+        """Pass an Azure stream through, keeping a copy of every chunk"""
+        completion = {"model": model, "request_chars": request_chars, "chunks": []}
+        self.completions.append(completion)
+        for chunk in stream:
+            completion["chunks"].append(chunk.model_dump(mode="json"))
+            yield chunk
+
+    def save(self, recording):
+        """Write the trace of a finished request"""
+        recorded_at = datetime.now(timezone.utc)
+        trace_id = request_id_var.get() or uuid.uuid4().hex
+        entry = {
+            "trace_id": trace_id,
+            "site_id": current_site(),
+            "recorded_at": recorded_at.isoformat(),
+            "wall_ms": round((time.monotonic() - self.started) * 1000, 1),
+            "messages": self.messages,
+            "completions": self.completions,
+            "tool_calls": recording.tool_calls,
+            "usage": recording.usage.model_dump(mode="json") if recording.usage else None,
+            "frames": recording.frames,
+        }
+        path = os.path.join(TRACE_RECORD_DIR, f"{recorded_at:%Y%m%dT%H%M%S%f}-{trace_id}.json")
+        try:
+            os.makedirs(TRACE_RECORD_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(entry, file, ensure_ascii=False, default=str)
+        except OSError as e:
+            logger.error("Error writing trace %s: %s", path, e)
+
+
+def start_trace(messages: List[dict]) -> Optional[Trace]:
+    """A Trace for this request when recording is on, else None"""
+    return Trace(messages) if TRACE_RECORD_DIR else None
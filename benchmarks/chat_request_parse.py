@@ -0,0 +1,109 @@
+"""
+Measure parse time and peak memory of /api/chat_streaming request bodies.
+
+Compares FastAPI's default body handling plus json.dumps of the tool
+args/results for the model with the lean path: parse_chat_body on the raw
+body plus pydantic_core.to_json, as convert_to_openai_messages does. The
+body is a long chat with large tool results and a data-URL image.
+
+    python benchmarks/chat_request_parse.py --size-mb 1 --runs 20
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic_core import to_json  # noqa: E402
+
+from api.routers.chat import ChatRequest, parse_chat_body  # noqa: E402
+
+
+def build_body(size_bytes: int) -> bytes:
+    """A chat history of roughly size_bytes: tool results with trend rows plus one image"""
+    image = "data:image/png;base64," + base64.b64encode(os.urandom(size_bytes // 4)).decode()
+    messages = [{
+        "role": "user",
+        "content": "ช่วยดูกราฟนี้หน่อย",
+        "experimental_attachments": [{"name": "trend.png", "contentType": "image/png", "url": image}],
+    }]
+    turn = 0
+    while len(json.dumps(messages)) < size_bytes:
+        rows = [
+            {"timestamp": f"2024-01-01T{hour:02d}:{minute:02d}:00Z", "power": 312.4 + minute, "chw_supply": 6.8, "status_read": "1"}
+            for hour in range(24) for minute in range(0, 60, 5)
+        ]
+        messages.append({"role": "user", "content": f"trend of chiller_{turn % 4 + 1}"})
+        messages.append({
+            "role": "assistant",
+            "content": "",
+            "toolInvocations": [{
+                "state": "result",
+                "toolCallId": f"call_{turn}",
+                "toolName": "get_chiller_trend",
+                "args": {"chiller_id": f"chiller_{turn % 4 + 1}", "hours": 24},
+                "result": {"rows": rows},
+            }],
+        })
+        turn += 1
+    return json.dumps({"messages": messages}).encode()
+
+
+def default_path(body: bytes):
+    request = ChatRequest.model_validate(json.loads(body))
+    return request, [
+        (json.dumps(invocation.args), json.dumps(invocation.result))
+        for message in request.messages for invocation in message.toolInvocations or []
+    ]
+
+
+def lean_path(body: bytes):
+    request = parse_chat_body(body)
+    return request, [
+        (to_json(invocation.args).decode(), to_json(invocation.result).decode())
+        for message in request.messages for invocation in message.toolInvocations or []
+    ]
+
+
+def measure(path, body: bytes, runs: int) -> dict:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        path(body)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    result = path(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=1.0)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    body = build_body(int(args.size_mb * 1024 * 1024))
+    report = {
+        "body_mb": round(len(body) / 1024 / 1024, 2),
+        "runs": args.runs,
+        "default": measure(default_path, body, args.runs),
+        "lean": measure(lean_path, body, args.runs),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Measure how long `import api` and app startup take with no backend reachable.
+
+Each run happens in a fresh interpreter, so module caches do not hide
+import costs. MongoDB points at a closed local port and the Azure OpenAI
+settings are cleared, which is what a test runner or CLI tool sees.
+
+    python benchmarks/import_time.py --runs 10 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import api
+imported = time.perf_counter()
+
+async def start_and_stop():
+    async with api.app.router.lifespan_context(api.app):
+        ready = time.perf_counter()
+    return ready
+
+ready = asyncio.run(start_and_stop())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+}))
+"""
+
+
+def run_once() -> dict:
+    env = {
+        key: value for key, value in os.environ.items()
+        if not key.startswith("AZURE_OPENAI_")
+    }
+    env["MONGODB_URI"] = "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=200"
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(values):
+    return {
+        "median": round(statistics.median(values), 1),
+        "min": round(min(values), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if median import + startup exceeds this")
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    imports = [result["import_ms"] for result in results]
+    startups = [result["startup_ms"] for result in results]
+    report = {"runs": args.runs, "import_ms": summarize(imports), "startup_ms": summarize(startups)}
+    print(json.dumps(report, indent=2))
+
+    total = statistics.median(imports) + statistics.median(startups)
+    if args.budget_ms is not None and total > args.budget_ms:
+        print(f"Import + startup median {total:.1f} ms exceeds budget {args.budget_ms:.1f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Mixed-site load test against a running API.
+
+Sends a random mix of site-scoped requests (the site description,
+fast-path chat status questions, the maintenance view, anomalies and the
+schedule lookup) for several sites at once, each site picked per request
+through x-site-id. Reports latency percentiles and errors per site and
+endpoint, and counts responses whose body belongs to another site: the
+site description must name the requested site, and every device in the
+maintenance view and the anomalies must be one of that site's devices.
+Chat and schedule answers are timed but not checked.
+
+tests/fixtures/sites/cp11.yaml is a second plant next to cp10, with one
+device (chiller_9) that cp10 does not have:
+
+    SITE_CONFIG_DIR=api/hammy_tools:tests/fixtures/sites python -m api.main &
+    python benchmarks/multi_site_load.py --url http://localhost:8000 --sites cp10 cp11 --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+ENDPOINTS = {
+    "site": ("GET", "/api/chiller_plant/site"),
+    "chat": ("POST", "/api/chat_streaming"),
+    "maintenance": ("GET", "/api/chiller_plant/maintenance"),
+    "anomalies": ("GET", "/api/chiller_plant/anomalies"),
+    "scheduled_chillers": ("GET", "/api/chiller_plant/scheduled_chillers"),
+}
+
+
+def chat_body(devices: List[str]) -> dict:
+    device = random.choice([device for device in devices if device.startswith("chiller_")] or devices)
+    return {"messages": [{"role": "user", "content": f"status of {device}"}]}
+
+
+def belongs_to_other_site(endpoint: str, site: str, body, devices: Set[str]) -> bool:
+    """Whether a 200 response body carries another site's data"""
+    if endpoint == "site":
+        return body.get("site_id") != site
+    if endpoint == "maintenance":
+        return any(device["device_id"] not in devices for device in body.get("devices", []))
+    if endpoint == "anomalies":
+        return any(anomaly["device_id"] not in devices for anomaly in body.get("anomalies", []))
+    return False
+
+
+async def site_devices(client: httpx.AsyncClient, site: str) -> Optional[Set[str]]:
+    response = await client.get(ENDPOINTS["site"][1], headers={"x-site-id": site})
+    if response.status_code != 200 or response.json().get("site_id") != site:
+        return None
+    return {device for devices in response.json()["equipment"].values() for device in devices}
+
+
+async def one_request(client: httpx.AsyncClient, site: str, endpoint: str, devices: Set[str], results: dict):
+    method, path = ENDPOINTS[endpoint]
+    started = time.perf_counter()
+    wrong_site = False
+    try:
+        if method == "POST":
+            response = await client.post(path, json=chat_body(sorted(devices)), headers={"x-site-id": site})
+        else:
+            response = await client.get(path, headers={"x-site-id": site})
+        status = response.status_code
+        if status == 200 and endpoint != "chat":
+            wrong_site = belongs_to_other_site(endpoint, site, response.json(), devices)
+    except httpx.HTTPError:
+        status = "error"
+    results[(site, endpoint)].append((time.perf_counter() - started) * 1000)
+    if status != 200:
+        results[("errors", site, endpoint)].append(status)
+    if wrong_site:
+        results[("wrong_site", site, endpoint)].append(1)
+
+
+async def run(url: str, sites, total: int, concurrency: int, endpoints) -> dict:
+    results = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        devices: Dict[str, Set[str]] = {}
+        for site in sites:
+            devices[site] = await site_devices(client, site)
+            if devices[site] is None:
+                sys.exit(f"Site {site} is not served by {url}; check SITE_CONFIG_DIR")
+
+        async def bounded():
+            async with semaphore:
+                site = random.choice(sites)
+                await one_request(client, site, random.choice(endpoints), devices[site], results)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(bounded() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        metrics = (await client.get("/api/metrics")).json()
+    return {"results": results, "elapsed": elapsed, "metrics": metrics}
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--sites", nargs="+", default=["cp10"])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    run_result = asyncio.run(run(args.url, args.sites, args.requests, args.concurrency, args.endpoints))
+    results = run_result["results"]
+
+    print(f"{args.requests} requests in {run_result['elapsed']:.1f}s ({args.requests / run_result['elapsed']:.0f} req/s), concurrency {args.concurrency}")
+    print(f"{'site':<8} {'endpoint':<20} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'errors':>7} {'wrong site':>10}")
+    for site in args.sites:
+        for endpoint in args.endpoints:
+            latencies = results.get((site, endpoint))
+            if not latencies:
+                continue
+            print(
+                f"{site:<8} {endpoint:<20} {len(latencies):>6} {statistics.median(latencies):>8.1f} "
+                f"{percentile(latencies, 0.95):>8.1f} {max(latencies):>8.1f} "
+                f"{len(results.get(('errors', site, endpoint), [])):>7} {len(results.get(('wrong_site', site, endpoint), [])):>10}"
+            )
+    statuses = Counter(status for key, values in results.items() if key[0] == "errors" for status in values)
+    if statuses:
+        print("error statuses:", dict(statuses))
+    print("realtime feeds:", json.dumps({site: feed.get("running") for site, feed in run_result["metrics"].get("realtime_feed", {}).items()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Measure bytes on the wire for a tool-heavy chat stream, with and without compression.
+
+Replays a synthetic but typically shaped data stream (answer tokens, a
+get_all_chillers result with every chiller's raw_data, a maintenance
+history and an ECharts option) through StreamCompressor. Frames are
+grouped into flushes the way stream_compressed groups them, for the
+given STREAM_COMPRESSION_FLUSH_MS windows and token inter-arrival time.
+
+    python benchmarks/stream_compression.py --token-ms 30 --windows 0 20 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.utils import compression  # noqa: E402
+from api.utils.compression import StreamCompressor  # noqa: E402
+
+
+def text_frames(words: int):
+    return [(f'0:{json.dumps(("ชิลเลอร์ " if i % 3 == 0 else "chiller ") + str(i))}\n', "token") for i in range(words)]
+
+
+def tool_frames(call_id: str, name: str, args: dict, result) -> list:
+    args = json.dumps(args)
+    return [
+        (f'9:{{"toolCallId":"{call_id}","toolName":"{name}","args":{args}}}\n', "tool"),
+        (f'a:{{"toolCallId":"{call_id}","toolName":"{name}","args":{args},"result":{json.dumps(result)}}}\n', "tool"),
+    ]
+
+
+def conversation() -> list:
+    """(frame, kind) pairs for one tool-heavy turn sequence"""
+    random.seed(7)
+    chillers = {
+        f"chiller_{n}": {
+            "status_read": "1" if n % 2 else "0",
+            "power": round(random.uniform(250, 420), 2),
+            "percentage_rla": round(random.uniform(40, 95), 1),
+            "evap_leaving_water_temperature": round(random.uniform(6.2, 7.4), 2),
+            "evap_entering_water_temperature": round(random.uniform(11.5, 13.0), 2),
+            "cond_leaving_water_temperature": round(random.uniform(33, 36), 2),
+            "cond_entering_water_temperature": round(random.uniform(29, 31), 2),
+            "alarm": "0",
+            "timestamp": f"2024-06-01T10:{n:02d}:00Z",
+        }
+        for n in range(1, 9)
+    }
+    history = [
+        {
+            "device_id": f"cdp_{n % 4 + 1}",
+            "timestamp": f"2024-0{n % 9 + 1}-1{n % 9}T08:00:00Z",
+            "under_maintenance": n % 2 == 0,
+            "ticket_started_by": "somchai",
+            "technician": "ช่างวิชัย",
+            "note": "เปลี่ยนซีลปั๊มและตรวจสอบแบริ่ง",
+        }
+        for n in range(60)
+    ]
+    chart = {
+        "title": {"text": "Chiller power (kW)"},
+        "xAxis": {"type": "category", "data": [f"{hour:02d}:00" for hour in range(24)]},
+        "yAxis": {"type": "value"},
+        "series": [
+            {"name": name, "type": "line", "data": [round(random.uniform(250, 420), 1) for _ in range(24)]}
+            for name in chillers
+        ],
+    }
+    return [
+        *tool_frames("call_1", "get_all_chillers", {}, chillers),
+        *text_frames(120),
+        *tool_frames("call_2", "get_maintenance_history", {"device_id": "cdp_1"}, history),
+        *text_frames(80),
+        *tool_frames("call_3", "generate_mock_chart", {}, chart),
+        *text_frames(40),
+        ('e:{"finishReason":"stop","usage":{"promptTokens":0,"completionTokens":0},"isContinued":false}\n', "finish"),
+    ]
+
+
+def flush_groups(frames: list, token_ms: float, window_ms: float) -> list:
+    """Group frames into flushes: tokens arrive token_ms apart, tool frames arrive after a pause"""
+    groups, current, group_started, clock = [], [], None, 0.0
+    for frame, kind in frames:
+        clock += token_ms if kind == "token" else 500
+        if current and clock - group_started > window_ms:
+            groups.append("".join(current))
+            current = []
+        if not current:
+            group_started = clock
+        current.append(frame)
+    groups.append("".join(current))
+    return groups
+
+
+def wire_bytes(groups: list, encoding: str) -> int:
+    compressor = StreamCompressor(encoding)
+    return sum(len(compressor.compress(group.encode())) for group in groups) + len(compressor.finish())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token-ms", type=float, default=30.0, help="Time between streamed tokens")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0.0, 20.0, 50.0], help="Flush windows to compare (ms)")
+    args = parser.parse_args()
+
+    frames = conversation()
+    body = "".join(frame for frame, _ in frames).encode()
+    encodings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    report = {
+        "frames": len(frames),
+        "identity_bytes": len(body),
+        "gzip_whole_body_bytes": len(zlib.compress(body, compression.GZIP_LEVEL)),
+        "streamed": {},
+    }
+    for window in args.windows:
+        groups = flush_groups(frames, args.token_ms, window)
+        report["streamed"][f"{window:g}ms"] = {
+            "flushes": len(groups),
+            **{f"{encoding}_bytes": wire_bytes(groups, encoding) for encoding in encodings},
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,16 +10,26 @@ import { toast } from "sonner";
 import { InitMessageList } from "./test_init_message";
 import { PlusCircle, Command, X } from "lucide-react";
 import { Button } from "./ui/button";
-import { useEffect } from "react";
+import { useEffect, useRef, useState } from "react";
 
 const STORAGE_KEY = "chat_messages";
+const CHAT_ID_KEY = "chat_id";
 
 interface ChatProps {
   onClose?: () => void;
 }
 
+// One id per conversation, kept with its messages so a reload continues the same chat
+const loadChatId = (): string => {
+  const stored = typeof window === "undefined" ? null : localStorage.getItem(CHAT_ID_KEY);
+  if (stored) return stored;
+  const id = crypto.randomUUID();
+  if (typeof window !== "undefined") localStorage.setItem(CHAT_ID_KEY, id);
+  return id;
+};
+
 export function Chat({ onClose }: ChatProps) {
-  const chatId = "001";
+  const [chatId, setChatId] = useState<string>(loadChatId);
 
   // Load initial messages from localStorage or use InitMessageList
   const loadInitialMessages = (): Message[] => {
@@ -28,6 +38,9 @@ export function Chat({ onClose }: ChatProps) {
     return stored ? JSON.parse(stored) : InitMessageList;
   };
 
+  // Id of the response being streamed, so stopping also stops the server-side completion
+  const streamIdRef = useRef<string | null>(null);
+
   const {
     messages,
     setMessages,
@@ -38,10 +51,16 @@ export function Chat({ onClose }: ChatProps) {
     isLoading,
     stop,
     reload,
+    data,
   } = useChat({
     api: "/api/chat_streaming",
+    // Lets the API attribute token usage to this conversation; x-operator-id comes from the auth proxy
+    headers: { "x-chat-id": chatId },
     maxSteps: 4,
     initialMessages: loadInitialMessages(),
+    onResponse: (response: Response) => {
+      streamIdRef.current = response.headers.get("x-stream-id");
+    },
     onError: (error: Error) => {
       if (error.message.includes("Too many requests")) {
         toast.error(
@@ -58,12 +77,30 @@ export function Chat({ onClose }: ChatProps) {
     }
   }, [messages]);
 
+  // The completion keeps running for a reconnect after a dropped connection; an explicit stop ends it
+  const stopStreaming = () => {
+    stop();
+    if (streamIdRef.current) {
+      fetch(`/api/chat_streaming/${streamIdRef.current}`, { method: "DELETE" });
+      streamIdRef.current = null;
+    }
+  };
+
   const handleNewChat = () => {
     setMessages([]);
     setInput("");
     localStorage.removeItem(STORAGE_KEY);
+    const id = crypto.randomUUID();
+    localStorage.setItem(CHAT_ID_KEY, id);
+    setChatId(id);
   };
 
+  // The API reports the chat's place in the LLM queue as { type: "queue", position } data parts
+  const queuePosition = (data ?? [])
+    .filter((item: any) => item?.type === "queue")
+    .map((item: any) => item.position as number)
+    .pop();
+
   const [messagesContainerRef, messagesEndRef] =
     useScrollToBottom<HTMLDivElement>();
 
@@ -113,7 +150,9 @@ export function Chat({ onClose }: ChatProps) {
 
         {isLoading &&
           messages.length > 0 &&
-          messages[messages.length - 1].role === "user" && <ThinkingMessage />}
+          messages[messages.length - 1].role === "user" && (
+            <ThinkingMessage queuePosition={queuePosition} />
+          )}
 
         <div
           ref={messagesEndRef}
@@ -128,7 +167,7 @@ export function Chat({ onClose }: ChatProps) {
           setInput={setInput}
           handleSubmit={handleSubmit}
           isLoading={isLoading}
-          stop={stop}
+          stop={stopStreaming}
           messages={messages}
           setMessages={setMessages}
           append={append}
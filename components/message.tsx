@@ -129,7 +129,11 @@ export const PreviewMessage = ({
   );
 };
 
-export const ThinkingMessage = () => {
+export const ThinkingMessage = ({
+  queuePosition,
+}: {
+  queuePosition?: number;
+}) => {
   const role = "assistant";
 
   return (
@@ -153,7 +157,9 @@ export const ThinkingMessage = () => {
 
         <div className="flex flex-col gap-2 w-full">
           <div className="flex flex-col gap-4 text-muted-foreground">
-            Thinking...
+            {queuePosition
+              ? `Waiting in queue (position ${queuePosition})...`
+              : "Thinking..."}
           </div>
         </div>
       </div>
@@ -40,6 +40,8 @@ export function ChillerSequenceScheduleRequestCard({
   const [status, setStatus] = useState<ScheduleStatus>('pending');
   const [error, setError] = useState<string | null>(null);
   const [message, setMessage] = useState<string | null>(null);
+  // One key per card so retried confirmations are applied only once
+  const [idempotencyKey] = useState(() => crypto.randomUUID());
 
   const formatTime = (timeStr: string | null) => {
     return timeStr || '--:--';
@@ -62,6 +64,7 @@ export function ChillerSequenceScheduleRequestCard({
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey,
         },
         body: JSON.stringify({
           chiller_id,
@@ -0,0 +1,23 @@
+"""
+Offline evaluation of the tool-calling flow from recorded traces.
+
+1. Record: run the API with TRACE_RECORD_DIR=traces and chat as usual.
+   Every LLM-answered request is saved with its Azure stream and tool I/O.
+2. Build scenarios: `python -m evals build traces --out evals/scenarios`
+   groups the requests of one question (the first POST and the frontend's
+   follow-up POSTs after tool results) into a scenario file, with the
+   recorded steps, tool calls and tokens as its baseline.
+3. Replay: `python -m evals run evals/scenarios --workers 8` replays each
+   scenario in a process pool, emulating the frontend's maxSteps loop, and
+   reports tokens, tool calls and wall time per answer against the
+   baseline.
+
+By default both the LLM and the tools are replayed from the recording, so
+a run is deterministic and needs no backend: it checks the stream and
+tool-call plumbing, and prompt tokens are rescaled to the current size of
+SYSTEM_PROMPT, get_tools_config() and the messages. `--live` sends the
+recorded conversations to Azure OpenAI instead, to see whether prompt or
+tool-definition changes alter tool selection, step counts or token usage;
+`--live-tools` runs the real tool implementations instead of the recorded
+results.
+"""
@@ -0,0 +1,88 @@
+"""
+    python -m evals build TRACE_DIR [--out evals/scenarios]
+    python -m evals run [SCENARIOS] [--workers N] [--live] [--live-tools] [--report report.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from . import __doc__ as DESCRIPTION
+from .replay import init_worker, run_scenario
+from .scenarios import build, scenario_paths
+
+DEFAULT_SCENARIOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+
+
+def summarize(results: list) -> dict:
+    answered = [result for result in results if not result["error"]] or results
+    walls = sorted(result["wall_ms"] for result in results)
+    return {
+        "scenarios": len(results),
+        "regressed": sum(bool(result["regressions"]) for result in results),
+        "tokens_per_answer": round(statistics.mean(r["prompt_tokens"] + r["completion_tokens"] for r in answered), 1),
+        "tool_calls_per_answer": round(statistics.mean(len(r["tool_calls"]) for r in answered), 2),
+        "steps_per_answer": round(statistics.mean(r["steps"] for r in answered), 2),
+        "wall_ms_p50": walls[len(walls) // 2],
+        "wall_ms_max": walls[-1],
+    }
+
+
+def run(args) -> int:
+    paths = scenario_paths(args.scenarios)
+    if not paths:
+        print(f"No scenarios in {args.scenarios}", file=sys.stderr)
+        return 1
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+        results = list(pool.map(
+            run_scenario, paths,
+            [args.live] * len(paths), [args.live_tools] * len(paths), [args.token_tolerance] * len(paths)
+        ))
+
+    for result in results:
+        status = "REGRESSED" if result["regressions"] else "ok"
+        print(
+            f"{status:9} {result['scenario']:34} steps={result['steps']} tools={len(result['tool_calls'])} "
+            f"tokens={result['prompt_tokens']}+{result['completion_tokens']} wall={result['wall_ms']:.0f}ms"
+        )
+        for regression in result["regressions"]:
+            print(f"          - {regression}")
+    summary = summarize(results)
+    print(json.dumps(summary, indent=2))
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump({"summary": summary, "results": results}, file, ensure_ascii=False, indent=1)
+    return 1 if args.strict and summary["regressed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m evals", description=DESCRIPTION, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Group recorded traces into scenario files")
+    build_parser.add_argument("trace_dir")
+    build_parser.add_argument("--out", default=DEFAULT_SCENARIOS)
+
+    run_parser = commands.add_parser("run", help="Replay scenarios and compare them with their recording")
+    run_parser.add_argument("scenarios", nargs="?", default=DEFAULT_SCENARIOS, help="Scenario directory or file")
+    run_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    run_parser.add_argument("--live", action="store_true", help="Ask Azure OpenAI instead of replaying its answers")
+    run_parser.add_argument("--live-tools", action="store_true", help="Run the real tools instead of replaying their results")
+    run_parser.add_argument("--token-tolerance", type=float, default=0.1, help="Allowed token growth before flagging (0.1 = 10%%)")
+    run_parser.add_argument("--report", help="Write per-scenario results as JSON")
+    run_parser.add_argument("--strict", action="store_true", help="Exit 1 if any scenario regressed")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        paths = build(args.trace_dir, args.out)
+        print(f"Wrote {len(paths)} scenarios to {args.out}")
+    else:
+        sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Replay one scenario through OpenAIService.stream_text.
+
+Runs inside a worker process: the API modules are patched for the
+lifetime of the process, so each worker replays one scenario at a time.
+"""
+import copy
+import json
+import os
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+# The frontend's useChat({ maxSteps }) in components/chat.tsx
+MAX_STEPS = 4
+
+
+def init_worker():
+    """Process-pool initializer: keep every request on the (replayed) LLM path"""
+    os.environ["FAST_PATH_ENABLED"] = "0"
+    os.environ["USAGE_LEDGER_ENABLED"] = "0"
+    os.environ.pop("TRACE_RECORD_DIR", None)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("AZURE_OPENAI_MINI_MODEL", "replay")
+    # Pay imports and the site config load here rather than in the first scenario's wall time
+    import openai.types.chat  # noqa: F401
+    from api.services.openai import _prompt_overhead_characters
+    _prompt_overhead_characters()
+
+
+class ReplayStream:
+    """A recorded Azure stream, chunk by chunk"""
+
+    def __init__(self, chunks: List[dict]):
+        from openai.types.chat import ChatCompletionChunk
+        self._chunks = [ChatCompletionChunk.model_validate(chunk) for chunk in chunks]
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self.closed:
+                return
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class ReplayClient:
+    """Stands in for AzureOpenAI, answering each completion with the next recorded one"""
+
+    def __init__(self, scenario: dict):
+        self.completions = [completion for step in scenario["steps"] for completion in step["completions"]]
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages: List[dict], **kwargs):
+        from api.services.openai import _prompt_overhead_characters
+
+        if self.calls >= len(self.completions):
+            raise RuntimeError(f"Replay diverged: completion {self.calls + 1} was never recorded")
+        recorded = self.completions[self.calls]
+        self.calls += 1
+
+        # Rescale prompt tokens to today's system prompt, tool definitions and messages
+        request_chars = len(json.dumps(messages[1:], ensure_ascii=False, default=str)) + _prompt_overhead_characters()
+        scale = request_chars / recorded["request_chars"] if recorded.get("request_chars") else 1.0
+        chunks = copy.deepcopy(recorded["chunks"])
+        for chunk in chunks:
+            if chunk.get("usage"):
+                chunk["usage"]["prompt_tokens"] = round(chunk["usage"]["prompt_tokens"] * scale)
+                chunk["usage"]["total_tokens"] = chunk["usage"]["prompt_tokens"] + chunk["usage"]["completion_tokens"]
+        return ReplayStream(chunks)
+
+
+def replay_tools(scenario: dict, live_tools: bool, unrecorded: List[str]) -> Dict[str, Callable]:
+    """The tools, answering with the recorded result for the same name and arguments"""
+    from api.utils.tools import get_tools
+
+    live = get_tools()
+    recorded: Dict[str, object] = {}
+    for step in scenario["steps"]:
+        for call in step["tool_calls"]:
+            recorded[_call_key(call["name"], json.loads(call["arguments"] or "{}"))] = call["result"]
+
+    def replayed(name: str):
+        def tool(**kwargs):
+            key = _call_key(name, kwargs)
+            if key in recorded:
+                return copy.deepcopy(recorded[key])
+            unrecorded.append(key)
+            if live_tools:
+                return live[name](**kwargs)
+            return {"available": False, "message": "This tool call was not part of the recording."}
+        return tool
+
+    return {name: replayed(name) for name in live}
+
+
+def run_scenario(path: str, live: bool = False, live_tools: bool = False, token_tolerance: float = 0.1) -> dict:
+    """Replay a scenario file, emulating the frontend's follow-up requests after tool results"""
+    import api.services.openai as service
+    from api.utils.prompt import ClientMessage, convert_to_openai_messages
+    from api.utils.site import DEFAULT_SITE_ID, site_id_var
+
+    with open(path, encoding="utf-8") as file:
+        scenario = json.load(file)
+
+    unrecorded: List[str] = []
+    client = ReplayClient(scenario)
+    if not live:
+        service.get_openai_client = lambda: client
+    service.get_tools = lambda: replay_tools(scenario, live_tools, unrecorded)
+    service.response_cache = _NoCache()
+    # Traces recorded before multi-site support have no site_id
+    site_id_var.set(scenario.get("site_id") or DEFAULT_SITE_ID)
+
+    result = {
+        "scenario": scenario["name"],
+        "steps": 0,
+        "tool_calls": [],
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "error": None,
+    }
+    messages = scenario["messages"]
+    started = time.perf_counter()
+    try:
+        for _ in range(MAX_STEPS):
+            text, invocations, usage, error = parse_frames(list(service.OpenAIService.stream_text(messages)))
+            result["steps"] += 1
+            result["tool_calls"] += [invocation["toolName"] for invocation in invocations]
+            result["prompt_tokens"] += usage.get("promptTokens", 0)
+            result["completion_tokens"] += usage.get("completionTokens", 0)
+            if error:
+                result["error"] = error
+                break
+            if not invocations:
+                break
+            # What useChat POSTs next: the assistant turn with its tool results
+            follow_up = ClientMessage(role="assistant", content=text, toolInvocations=[
+                {**invocation, "state": "result"} for invocation in invocations
+            ])
+            messages = messages + convert_to_openai_messages([follow_up])
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["wall_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    result["unrecorded_tool_calls"] = len(unrecorded)
+    result["regressions"] = compare(result, scenario["baseline"], token_tolerance)
+    return result
+
+
+def parse_frames(frames: List[str]):
+    """(text, tool invocations, usage, error) from data-stream frames"""
+    text, invocations, usage, error = "", [], {}, None
+    for frame in frames:
+        kind, _, payload = frame.partition(":")
+        if kind == "0":
+            text += json.loads(payload)
+        elif kind == "a":
+            invocations.append(json.loads(payload))
+        elif kind == "e":
+            usage = json.loads(payload).get("usage") or {}
+        elif kind == "3":
+            error = json.loads(payload)
+    return text, invocations, usage, error
+
+
+def compare(result: dict, baseline: dict, token_tolerance: float) -> List[str]:
+    """What changed for the worse compared to the recording"""
+    regressions = []
+    if result["error"]:
+        regressions.append(f"error: {result['error']}")
+    if result["tool_calls"] != baseline["tool_calls"]:
+        regressions.append(f"tool calls {baseline['tool_calls']} -> {result['tool_calls']}")
+    if result["steps"] != baseline["steps"]:
+        regressions.append(f"steps {baseline['steps']} -> {result['steps']}")
+    for field in ("prompt_tokens", "completion_tokens"):
+        if baseline[field] and result[field] > baseline[field] * (1 + token_tolerance):
+            regressions.append(f"{field} {baseline[field]} -> {result[field]}")
+    return regressions
+
+
+def _call_key(name: str, arguments: dict) -> str:
+    return name + ":" + json.dumps(arguments, sort_keys=True, ensure_ascii=False)
+
+
+class _NoCache:
+    """Every request has to go through the (replayed) LLM"""
+
+    def lookup(self, key, available_tools) -> Optional[List[str]]:
+        return None
+
+    def store(self, key, recording):
+        pass
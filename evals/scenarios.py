@@ -0,0 +1,78 @@
+"""
+Group recorded traces (api/utils/tracing.py) into replayable scenarios.
+"""
+import glob
+import json
+import os
+from typing import List
+
+
+def load_traces(trace_dir: str) -> List[dict]:
+    traces = []
+    for path in sorted(glob.glob(os.path.join(trace_dir, "*.json"))):
+        with open(path, encoding="utf-8") as file:
+            traces.append(json.load(file))
+    return sorted(traces, key=lambda trace: trace["recorded_at"])
+
+
+def question_key(messages: List[dict]) -> str:
+    """The conversation up to its last user message; follow-up POSTs after tool results share it"""
+    last_user = max((index for index, message in enumerate(messages) if message.get("role") == "user"), default=-1)
+    return json.dumps(messages[:last_user + 1], sort_keys=True, ensure_ascii=False)
+
+
+def group_traces(traces: List[dict]) -> List[List[dict]]:
+    """Consecutive requests answering the same question, in recording order"""
+    open_groups = {}
+    groups = []
+    for trace in traces:
+        key = question_key(trace["messages"])
+        group = open_groups.get(key)
+        # A follow-up extends the previous request's messages; anything else starts over
+        if group is None or len(trace["messages"]) <= len(group[-1]["messages"]):
+            group = open_groups[key] = []
+            groups.append(group)
+        group.append(trace)
+    return groups
+
+
+def build_scenario(steps: List[dict]) -> dict:
+    tool_calls = [call["name"] for step in steps for call in step["tool_calls"]]
+    usages = [step["usage"] or {} for step in steps]
+    return {
+        "name": steps[0]["trace_id"],
+        "site_id": steps[0].get("site_id"),
+        "recorded_at": steps[0]["recorded_at"],
+        "messages": steps[0]["messages"],
+        "steps": [
+            {"completions": step["completions"], "tool_calls": step["tool_calls"], "wall_ms": step["wall_ms"]}
+            for step in steps
+        ],
+        "baseline": {
+            "steps": len(steps),
+            "tool_calls": tool_calls,
+            "prompt_tokens": sum(usage.get("prompt_tokens", 0) for usage in usages),
+            "completion_tokens": sum(usage.get("completion_tokens", 0) for usage in usages),
+            "wall_ms": round(sum(step["wall_ms"] for step in steps), 1),
+        },
+    }
+
+
+def build(trace_dir: str, out_dir: str) -> List[str]:
+    """Write one scenario file per recorded question; returns their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for steps in group_traces(load_traces(trace_dir)):
+        scenario = build_scenario(steps)
+        path = os.path.join(out_dir, f"{scenario['name']}.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(scenario, file, ensure_ascii=False, indent=1)
+        paths.append(path)
+    return paths
+
+
+def scenario_paths(path: str) -> List[str]:
+    """Scenario files in a directory, or the single file given; none when the path does not exist"""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.json")))
+    return [path] if os.path.isfile(path) else []
@@ -0,0 +1,215 @@
+"""
+Shared fixtures.
+
+Tests run against cp10 plus the smaller cp11 in tests/fixtures/sites, and
+against an in-memory stand-in for the few MongoDB operations the API uses,
+so no database or Azure deployment is needed:
+
+    python -m pytest -q
+"""
+import copy
+import os
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SITE_CONFIG_DIR", os.pathsep.join([
+    os.path.join(ROOT, "api", "hammy_tools"),
+    os.path.join(ROOT, "tests", "fixtures", "sites"),
+]))
+os.environ.setdefault("LOG_LEVEL", "OFF")
+os.environ.setdefault("USAGE_LEDGER_ENABLED", "0")
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+
+def _get(document, path):
+    """(value, found) for a dotted path"""
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None, False
+        value = value[part]
+    return value, True
+
+
+def _matches(document, query) -> bool:
+    for path, condition in query.items():
+        value, found = _get(document, path)
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            for op, argument in condition.items():
+                if op == "$exists" and found != argument:
+                    return False
+                if op == "$in" and value not in argument:
+                    return False
+                if op == "$gt" and not (found and value > argument):
+                    return False
+                if op == "$gte" and not (found and value >= argument):
+                    return False
+                if op == "$lt" and not (found and value < argument):
+                    return False
+                if op == "$lte" and not (found and value <= argument):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _sorted(documents, sort):
+    for path, direction in reversed(list(sort)):
+        # None sorts first ascending, as in MongoDB
+        documents.sort(key=lambda document: (_get(document, path)[0] is not None, _get(document, path)[0]), reverse=direction < 0)
+    return documents
+
+
+def _evaluate(document, expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        path, value = expression[1:].split("."), document
+        # Paths through arrays collect the field of every element, as in MongoDB
+        for part in path:
+            if isinstance(value, list):
+                value = [item.get(part) for item in value if isinstance(item, dict)]
+            elif isinstance(value, dict):
+                value = value.get(part)
+            else:
+                return None
+        return value
+    if isinstance(expression, dict) and "$arrayElemAt" in expression:
+        array, index = expression["$arrayElemAt"]
+        values = _evaluate(document, array) or []
+        return values[index] if -len(values) <= index < len(values) else None
+    if isinstance(expression, dict) and "$cond" in expression:
+        condition, then, otherwise = expression["$cond"]
+        return _evaluate(document, then if _evaluate(document, condition) else otherwise)
+    if isinstance(expression, dict) and "$eq" in expression:
+        left, right = expression["$eq"]
+        return _evaluate(document, left) == _evaluate(document, right)
+    if isinstance(expression, dict) and "$in" in expression:
+        value, array = expression["$in"]
+        return _evaluate(document, value) in _evaluate(document, array)
+    if isinstance(expression, dict) and "$sum" in expression:
+        value = _evaluate(document, expression["$sum"])
+        return sum(item for item in value if isinstance(item, (int, float))) if isinstance(value, list) else value
+    return expression
+
+
+def _accumulate(group, field, accumulator, document):
+    (operator, expression), = accumulator.items()
+    value = _evaluate(document, expression)
+    if operator == "$first":
+        group.setdefault(field, value)
+    elif operator == "$sum":
+        group[field] = group.get(field, 0) + (value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0)
+    else:
+        raise NotImplementedError(operator)
+
+
+class FakeCollection:
+    """The subset of pymongo's Collection used by the API, kept in a list"""
+
+    def __init__(self):
+        self.documents = []
+        self.indexes = []
+
+    def find(self, query=None, projection=None, sort=None, limit=0):
+        found = _sorted([copy.deepcopy(document) for document in self.documents if _matches(document, query or {})], sort or [])
+        return found[:limit] if limit else found
+
+    def find_one(self, query=None, projection=None, sort=None):
+        found = self.find(query, sort=sort, limit=1)
+        return found[0] if found else None
+
+    def insert_one(self, document):
+        document = copy.deepcopy(document)
+        document.setdefault("_id", len(self.documents) + 1)
+        if any(existing["_id"] == document["_id"] for existing in self.documents):
+            raise DuplicateKeyError(f"duplicate _id {document['_id']}")
+        self.documents.append(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        for document in self.documents:
+            if _matches(document, query):
+                for path, value in update.get("$set", {}).items():
+                    *parents, leaf = path.split(".")
+                    target = document
+                    for part in parents:
+                        target = target.setdefault(part, {})
+                    target[leaf] = copy.deepcopy(value)
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    def replace_one(self, query, replacement, upsert=False):
+        for index, document in enumerate(self.documents):
+            if _matches(document, query):
+                self.documents[index] = {"_id": document["_id"], **copy.deepcopy(replacement)}
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if not upsert:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+        inserted = self.insert_one({**{k: v for k, v in query.items() if not k.startswith("$")}, **replacement})
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=inserted.inserted_id)
+
+    def delete_one(self, query):
+        for document in self.documents:
+            if _matches(document, query):
+                self.documents.remove(document)
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+        return kwargs.get("name", "index")
+
+    def aggregate(self, pipeline):
+        documents = [copy.deepcopy(document) for document in self.documents]
+        for stage in pipeline:
+            (operator, argument), = stage.items()
+            if operator == "$match":
+                documents = [document for document in documents if _matches(document, argument)]
+            elif operator == "$sort":
+                documents = _sorted(documents, argument.items())
+            elif operator == "$group":
+                groups = {}
+                for document in documents:
+                    key = _evaluate(document, argument["_id"])
+                    group = groups.setdefault(key, {"_id": key})
+                    for field, accumulator in argument.items():
+                        if field != "_id":
+                            _accumulate(group, field, accumulator, document)
+                documents = list(groups.values())
+            elif operator == "$limit":
+                documents = documents[:argument]
+            else:
+                raise NotImplementedError(operator)
+        return iter(documents)
+
+
+class FakeMongoClient:
+    def __init__(self):
+        self.databases = {}
+
+    def __getitem__(self, database):
+        return self.databases.setdefault(database, _FakeDatabase())
+
+
+class _FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """One in-memory MongoDB behind every client, as when all sites share MONGODB_URI"""
+    from api.utils import clients, schedule_index
+    from api.utils.state import state_backend
+    from api.utils.tools import MAINTENANCE_CACHE_NAMESPACE
+
+    client = FakeMongoClient()
+    monkeypatch.setattr(clients, "get_mongodb_client", lambda uri=None: client)
+    monkeypatch.setattr(clients, "get_site_mongodb_client", lambda site_id=None: client)
+    monkeypatch.setattr(schedule_index, "_schedule_indexes", {})
+    state_backend.clear(MAINTENANCE_CACHE_NAMESPACE)
+    yield client
+    state_backend.clear(MAINTENANCE_CACHE_NAMESPACE)
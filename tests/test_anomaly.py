@@ -0,0 +1,66 @@
+"""Rolling z-score and rate-of-change checks over realtime snapshots"""
+from datetime import datetime, timedelta, timezone
+
+from api.services.anomaly import ANOMALY_MIN_SAMPLES, AnomalyDetector
+from api.utils.clients import get_realtime_collection
+
+START = datetime(2024, 6, 10, 9, 0, tzinfo=timezone.utc)
+
+
+def snapshot(tick, leaving=None, energy=None, status=1):
+    chiller = {
+        "status_read": status,
+        "evap_leaving_water_temperature": leaving if leaving is not None else (6.9 if tick % 2 else 7.1),
+        "cumulative_energy": energy if energy is not None else 1000 + 10 * tick,
+    }
+    return {"_id": tick, "timestamp": START + timedelta(seconds=15 * tick), "raw_data": {"chiller_1": chiller}}
+
+
+def warmed_up(mongo):
+    detector = AnomalyDetector("cp10")
+    for tick in range(30):
+        detector.update(snapshot(tick))
+    assert detector.current()["anomalies"] == []
+    return detector
+
+
+def flags(detector):
+    return {entry["point"]: entry["flags"] for entry in detector.current("chiller_1")["anomalies"]}
+
+
+def test_jump_is_flagged_by_z_score_and_rate_of_change(mongo):
+    detector = warmed_up(mongo)
+    detector.update(snapshot(30, leaving=12.0))
+    assert flags(detector) == {"evap_leaving_water_temperature": ["z_score", "rate_of_change"]}
+    entry, = detector.current("chiller_1")["anomalies"]
+    assert entry["value"] == 12.0 and entry["z_score"] > 3.5
+
+
+def test_unusual_step_within_the_range_is_a_rate_of_change(mongo):
+    detector = warmed_up(mongo)
+    # The counter usually grows by 10 per snapshot; a step of 100 stays inside the window's spread
+    detector.update(snapshot(30, energy=1000 + 10 * 29 + 100))
+    assert flags(detector) == {"cumulative_energy": ["rate_of_change"]}
+
+
+def test_starts_and_stops_are_not_anomalies(mongo):
+    detector = warmed_up(mongo)
+    detector.update(snapshot(30, leaving=25.0, status=0))
+    detector.update(snapshot(31, leaving=12.0, status=1))
+    assert flags(detector) == {}
+
+
+def test_rewritten_snapshot_with_a_new_timestamp_is_a_new_sample(mongo):
+    detector = AnomalyDetector("cp10")
+    detector.update(snapshot(0))
+    detector.update({**snapshot(1), "_id": 0})
+    detector.update({**snapshot(1), "_id": 0})
+    assert detector.current()["samples"] == 2
+
+
+def test_first_read_backfills_from_recent_snapshots(mongo):
+    for tick in range(ANOMALY_MIN_SAMPLES + 5):
+        get_realtime_collection("cp10").insert_one(snapshot(tick))
+    current = AnomalyDetector("cp10").current()
+    assert current["samples"] == ANOMALY_MIN_SAMPLES + 5
+    assert current["warming_up"] is False
@@ -0,0 +1,75 @@
+"""Breaker state around a flaky backend"""
+import pytest
+
+from api.utils import circuit_breaker
+from api.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, guarded
+
+
+class BackendDown(Exception):
+    pass
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("test_backend", failure_threshold=2, reset_seconds=0)
+    monkeypatch.setitem(circuit_breaker.breakers, "test_backend", breaker)
+    return breaker
+
+
+def open_breaker(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_unrelated_error_in_half_open_trial_frees_the_trial(breaker):
+    @guarded("test_backend", (BackendDown,))
+    def tool(fail):
+        if fail:
+            raise ValueError("bad arguments")
+        return {"ok": True}
+
+    open_breaker(breaker)
+    with pytest.raises(ValueError):
+        tool(True)
+    assert breaker.state == HALF_OPEN
+    assert tool(False) == {"ok": True}
+    assert breaker.state == CLOSED
+
+
+def test_opens_after_consecutive_failures_and_serves_the_last_good_result(breaker):
+    backend = {"down": False, "calls": 0}
+
+    @guarded("test_backend", (BackendDown,))
+    def read(device_id):
+        backend["calls"] += 1
+        if backend["down"]:
+            raise BackendDown()
+        return {"device_id": device_id, "value": 1}
+
+    assert read("chiller_1") == {"device_id": "chiller_1", "value": 1}
+    backend["down"] = True
+    breaker.reset_seconds = 60
+    stale = read("chiller_1")
+    assert stale["stale"] is True and stale["data"] == {"device_id": "chiller_1", "value": 1}
+    assert read("chiller_2")["available"] is False
+    assert breaker.state == OPEN
+
+    calls = backend["calls"]
+    assert read("chiller_1")["stale"] is True
+    assert backend["calls"] == calls
+
+
+def test_half_open_trial_closes_or_reopens(breaker):
+    open_breaker(breaker)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one trial at a time
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
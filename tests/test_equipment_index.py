@@ -0,0 +1,44 @@
+"""What people call a device, resolved to its id"""
+import pytest
+
+from api.utils.equipment_index import EquipmentIndex, get_equipment_index, unknown_device
+from api.utils.site import site_context
+
+
+@pytest.fixture
+def index():
+    return get_equipment_index("cp10")
+
+
+@pytest.mark.parametrize("name", ["chiller_1", "CH1", "ch-01", "Chiller 1", "ชิลเลอร์ 1", "ชิลเลอร 1", "chilller 1"])
+def test_names_of_chiller_1(index, name):
+    assert index.resolve(name) == "chiller_1"
+
+
+def test_fuzzy_match_never_changes_the_number(index):
+    assert index.resolve("chilller 2") == "chiller_2"
+    assert index.resolve("chiller 5") is None
+
+
+def test_ambiguous_name_is_unresolved(index):
+    # cp10 has ct_1_1 and ct_1_2, so "ct1" names neither
+    assert index.resolve("ct1") is None
+    assert index.resolve("ct 1 2") == "ct_1_2"
+
+
+def test_short_words_are_not_fuzzy_matched():
+    index = EquipmentIndex(["ct_1", "chiller_1"])
+    assert index.resolve("cx1") is None
+
+
+def test_aliases_from_the_site_config():
+    index = EquipmentIndex(["chiller_1"], {"chiller_1": ["York north"], "chiller_99": ["ghost"]})
+    assert index.resolve("York north") == "chiller_1"
+    assert index.resolve("ghost") is None
+
+
+def test_unknown_device_suggests_close_ids():
+    with site_context("cp10"):
+        result = unknown_device("chiler_1")
+    assert result["exists"] is False
+    assert "chiller_1" in result["did_you_mean"]
@@ -0,0 +1,26 @@
+"""The committed scenarios replay cleanly against the current prompts and tools"""
+import contextvars
+import os
+
+import pytest
+
+import api.services.openai as service
+from evals.__main__ import DEFAULT_SCENARIOS
+from evals.replay import run_scenario
+from evals.scenarios import scenario_paths
+
+
+def test_missing_path_has_no_scenarios():
+    assert scenario_paths(os.path.join(DEFAULT_SCENARIOS, "missing")) == []
+
+
+@pytest.mark.parametrize("path", scenario_paths(DEFAULT_SCENARIOS), ids=os.path.basename)
+def test_scenario_replays_without_regressions(monkeypatch, path):
+    # run_scenario patches these for a worker process's lifetime; restore them afterwards
+    for name in ("get_openai_client", "get_tools", "response_cache"):
+        monkeypatch.setattr(service, name, getattr(service, name))
+    monkeypatch.setattr(service.fast_path, "answer", lambda messages, tools: None)
+
+    result = contextvars.copy_context().run(run_scenario, path)
+    assert result["regressions"] == []
+    assert result["unrecorded_tool_calls"] == 0
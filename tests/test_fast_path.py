@@ -0,0 +1,42 @@
+"""Which chat messages the fast path answers without the LLM"""
+import pytest
+
+from api.services.fast_path import _maintenance_answer, _status_answer, match_intent
+
+STALE = {"stale": True, "as_of": "2024-01-01T03:00:00+00:00"}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("status of chiller_1", ("status", "chiller_1")),
+    ("is chiller 1 on?", ("status", "chiller_1")),
+    ("chiller 1 เปิดอยู่ไหม", ("status", "chiller_1")),
+    ("ชิลเลอร์ 1 ทำงานไหม", ("status", "chiller_1")),
+    ("CDP-2 อยู่ระหว่างซ่อมไหม", ("maintenance", "cdp_2")),
+    ("CH1 ปิดซ่อมอยู่ไหม", ("maintenance", "chiller_1")),
+])
+def test_questions_are_answered(text, expected):
+    assert match_intent(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "turn off chiller 1",
+    "switch on chiller 2",
+    "stop chiller 1",
+    "ปิด chiller 1",
+    "เปิด CH1",
+    "สั่งปิด chiller 1",
+])
+def test_commands_go_to_the_llm(text):
+    assert match_intent(text) == (None, None)
+
+
+@pytest.mark.parametrize("text", ["status of chiller_1 and chiller_2", "chiller 5 status"])
+def test_unknown_or_several_devices_go_to_the_llm(text):
+    assert match_intent(text) == (None, None)
+
+
+def test_stale_answers_say_when_the_data_is_from():
+    status = _status_answer("chiller_1", {**STALE, "data": {"status_read": 0}})
+    maintenance = _maintenance_answer("chiller_1", {**STALE, "data": {"under_maintenance": False}})
+    assert status.startswith("(ข้อมูลล่าสุด ณ เวลา 10:00 น.)")
+    assert maintenance.startswith("(ข้อมูลล่าสุด ณ เวลา 10:00 น.)")
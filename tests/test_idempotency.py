@@ -0,0 +1,94 @@
+"""Idempotency keys on schedule changes"""
+import asyncio
+
+import pytest
+
+from api.schemas.chiller import ScheduleChangeRequest, ScheduleChangeResponse
+from api.services.chiller import ChillerService
+from api.utils.clients import get_automation_collection, get_schedule_change_requests_collection, schedule_settings_id
+
+WEEKDAY = [{"start": "08:00", "stop": "18:00"}]
+EVENING = [{"start": "18:00", "stop": "22:00"}]
+
+
+@pytest.fixture
+def settings(mongo):
+    get_automation_collection().insert_one({
+        "_id": schedule_settings_id(),
+        "enable_schedule_control": True,
+        "profile": {"weekday_profile": {"normal_chiller": [], "excluded_chiller": {"chiller_1": WEEKDAY}}},
+    })
+    return mongo
+
+
+def change(old, new):
+    return ScheduleChangeRequest(chiller_id="chiller_1", profile_type="weekday_profile", old_schedule=old, new_schedule=new)
+
+
+def test_unexpected_error_releases_the_key(settings, monkeypatch):
+    apply = ChillerService._apply_schedule_change
+
+    def fail(request):
+        raise RuntimeError("bug in apply")
+    monkeypatch.setattr(ChillerService, "_apply_schedule_change", staticmethod(fail))
+    with pytest.raises(RuntimeError):
+        asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING), "key-1"))
+    assert get_schedule_change_requests_collection().documents == []
+
+    monkeypatch.setattr(ChillerService, "_apply_schedule_change", apply)
+    response, status_code = asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING), "key-1"))
+    assert status_code == 200, response
+
+
+def stored_schedule():
+    return get_automation_collection().find_one({"_id": schedule_settings_id()})["profile"]["weekday_profile"]["excluded_chiller"]["chiller_1"]
+
+
+def test_stale_old_schedule_is_a_conflict(settings):
+    response, status_code = asyncio.run(ChillerService.update_schedule(change(EVENING, [{"start": "06:00", "stop": "07:00"}])))
+    assert status_code == 409
+    assert response.data["current_schedule"] == WEEKDAY
+
+
+def test_write_between_validation_and_update_is_a_conflict(settings, monkeypatch):
+    validate = ChillerService._validate_schedule_change
+
+    def validate_then_interleave(request, loaded):
+        outcome = validate(request, loaded)
+        # Another writer lands after this request read the settings
+        get_automation_collection().update_one(
+            {"_id": schedule_settings_id()},
+            {"$set": {"profile.weekday_profile.excluded_chiller.chiller_1": [{"start": "06:00", "stop": "07:00"}]}}
+        )
+        return outcome
+    monkeypatch.setattr(ChillerService, "_validate_schedule_change", staticmethod(validate_then_interleave))
+
+    response, status_code = asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING)))
+    assert status_code == 409, response
+    assert stored_schedule() == [{"start": "06:00", "stop": "07:00"}]
+
+
+def test_retry_replays_the_first_outcome(settings):
+    first = asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING), "key-1"))
+    assert first[1] == 200
+    # Someone else changes it back; a retry must not write again
+    get_automation_collection().update_one(
+        {"_id": schedule_settings_id()},
+        {"$set": {"profile.weekday_profile.excluded_chiller.chiller_1": WEEKDAY}}
+    )
+    assert asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING), "key-1")) == first
+    assert stored_schedule() == WEEKDAY
+
+
+def test_key_reused_for_another_change_is_rejected(settings):
+    asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING), "key-1"))
+    response, status_code = asyncio.run(ChillerService.update_schedule(change(EVENING, WEEKDAY), "key-1"))
+    assert status_code == 422, response
+
+
+def test_key_in_progress_is_a_conflict(settings):
+    ChillerService._claim_idempotency_key("key-1", change(WEEKDAY, EVENING), ScheduleChangeResponse)
+    response, status_code = asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING), "key-1"))
+    assert status_code == 409
+    assert "still in progress" in response.message
+    assert stored_schedule() == WEEKDAY
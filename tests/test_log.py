@@ -0,0 +1,21 @@
+"""Records keep their traceback on the way through the logging queue"""
+import json
+import logging
+import queue
+import sys
+
+from api.utils.log import JSONFormatter, _QueueHandler
+
+
+def test_exception_reaches_the_json_line():
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.LogRecord("api.test", logging.ERROR, __file__, 1, "failed %s", ("tool",), sys.exc_info())
+    handler.emit(record)
+
+    entry = json.loads(JSONFormatter().format(records.get_nowait()))
+    assert entry["msg"] == "failed tool"
+    assert "ZeroDivisionError" in entry["exc"]
@@ -0,0 +1,48 @@
+"""Confirmed maintenance flags are written and show up in the cached maintenance view"""
+import asyncio
+
+from api.schemas.chiller import MaintenanceFlagRequest
+from api.services.chiller import ChillerService
+from api.utils.clients import get_maintenance_collection
+from api.utils.site import site_context
+from api.utils.tools import get_devices_under_maintenance, requests_to_set_maintenance_status
+
+
+def flag(device_id, maintenance_flag=True):
+    return MaintenanceFlagRequest(
+        device_id=device_id,
+        maintenance_flag=maintenance_flag,
+        reporter_name="somchai",
+        technician_name="niran",
+        time="2024-01-01T09:00:00",
+        reason="vibration",
+    )
+
+
+def test_preview_writes_nothing(mongo):
+    get_maintenance_collection().insert_one({"device_id": "chiller_1", "status": {"under_maintenance": False}})
+    assert requests_to_set_maintenance_status("chiller_1", "somchai", "niran", "vibration")["success"] is True
+    assert len(get_maintenance_collection().documents) == 1
+
+
+def test_flag_is_written_and_invalidates_the_cached_view(mongo):
+    with site_context("cp11"):
+        assert get_devices_under_maintenance()["devices"] == []
+
+        response, status_code = asyncio.run(ChillerService.set_maintenance_flag(flag("CH1")))
+        assert status_code == 200, response
+        record, = get_maintenance_collection().documents
+        assert record["site_id"] == "cp11"
+        assert record["device_id"] == "chiller_1"
+        assert record["maintenance_history"][0]["ticket_started_by"] == "somchai"
+        assert [device["device_id"] for device in get_devices_under_maintenance()["devices"]] == ["chiller_1"]
+
+        asyncio.run(ChillerService.set_maintenance_flag(flag("chiller_1", maintenance_flag=False)))
+        assert get_devices_under_maintenance()["devices"] == []
+
+
+def test_unknown_device_writes_nothing(mongo):
+    response, status_code = asyncio.run(ChillerService.set_maintenance_flag(flag(["chiller_1", "chiller_99"])))
+    assert status_code == 404
+    assert "chiller_99" in response.message
+    assert get_maintenance_collection().documents == []
@@ -0,0 +1,71 @@
+"""Plant digest totals and operating-limit checks for one realtime snapshot"""
+from datetime import datetime, timezone
+
+from api.services.plant_digest import build_digest
+from api.utils.site import site_context
+
+TIMESTAMP = datetime(2024, 6, 10, 9, 0, tzinfo=timezone.utc)
+
+
+def chiller(power, load, entering=12.0, leaving=7.0, rla=80.0, **points):
+    return {
+        "power": power,
+        "cooling_rate": load,
+        "evap_entering_water_temperature": entering,
+        "evap_leaving_water_temperature": leaving,
+        "percentage_rla": rla,
+        **points,
+    }
+
+
+def digest(raw_data):
+    with site_context("cp10"):
+        return build_digest({"timestamp": TIMESTAMP, "raw_data": raw_data})
+
+
+def test_totals_cover_running_chillers_only():
+    result = digest({
+        "chiller_1": chiller(300.0, 500.0, status_read=1),
+        "chiller_2": chiller(200.0, 400.0, status_read="active"),
+        "chiller_3": chiller(250.0, 450.0, status_read=0),
+    })
+    assert result["running"]["chiller"] == {"running": 2, "reporting": 3}
+    assert result["total_load_tons"] == 900.0
+    assert result["total_chiller_power_kw"] == 500.0
+    assert result["plant_kw_per_ton"] == 0.56
+    assert set(result["running_chillers"]) == {"chiller_1", "chiller_2"}
+    assert result["running_chillers"]["chiller_1"] == {
+        "load_tons": 500.0, "power_kw": 300.0, "delta_t": 5.0, "kw_per_ton": 0.6, "percentage_rla": 80.0,
+    }
+
+
+def test_devices_without_a_status_point_count_as_running():
+    result = digest({"chiller_1": chiller(300.0, 500.0), "pchp_1": {"frequency_read": 40.0}})
+    assert result["running"]["chiller"] == {"running": 1, "reporting": 1}
+    assert result["running"]["pchp"] == {"running": 1, "reporting": 1}
+    assert result["total_load_tons"] == 500.0
+
+
+def test_zero_load_has_no_kw_per_ton():
+    result = digest({"chiller_1": chiller(15.0, 0.0, status_read=1)})
+    assert result["total_load_tons"] == 0.0
+    assert result["plant_kw_per_ton"] is None
+    assert result["running_chillers"]["chiller_1"]["kw_per_ton"] is None
+
+
+def test_out_of_range_follows_operating_limits():
+    result = digest({
+        "chiller_1": chiller(300.0, 500.0, leaving=10.0, entering=13.0, status_read=1),
+        "chiller_2": chiller(200.0, 400.0, leaving=10.0, entering=13.0, status_read=0),
+        "pchp_1": {"frequency_read": 55.0},
+    })
+    findings = {(entry["device_id"], entry["point"]): entry for entry in result["out_of_range"]}
+    # chiller_2 is stopped, so its readings are not held to the limits
+    assert set(findings) == {("chiller_1", "evap_leaving_water_temperature"), ("pchp_1", "frequency_read")}
+    assert findings[("chiller_1", "evap_leaving_water_temperature")]["value"] == 10.0
+    assert findings[("pchp_1", "frequency_read")]["value"] == 55.0
+
+
+def test_alarms_are_listed():
+    result = digest({"chiller_1": chiller(300.0, 500.0, status_read=1, alarm="on"), "chiller_2": chiller(0.0, 0.0, alarm=0)})
+    assert result["alarms"] == ["chiller_1"]
@@ -0,0 +1,58 @@
+"""The shared realtime feed: what counts as a new snapshot, and staying alive"""
+import threading
+
+from api.services.realtime import RealtimeFeed
+
+
+def snapshot(timestamp, load, snapshot_id=1):
+    return {"_id": snapshot_id, "timestamp": timestamp, "raw_data": {"chiller_1": {"load": load}}}
+
+
+def test_snapshot_rewritten_in_place_is_published():
+    seen = []
+    feed = RealtimeFeed("cp10", [seen.append])
+    feed._publish(snapshot("09:00", 50))
+    feed._publish(snapshot("09:01", 55))
+    assert [entry["timestamp"] for entry in seen] == ["09:00", "09:01"]
+    assert feed.current(["chiller_1"]) == {"chiller_1": {"load": 55}}
+
+
+def test_values_rewritten_without_a_new_timestamp_are_published():
+    seen = []
+    feed = RealtimeFeed("cp10", [seen.append])
+    feed._publish(snapshot("09:00", 50))
+    feed._publish(snapshot("09:00", 60))
+    assert len(seen) == 2
+    assert feed.published == 2
+
+
+def test_redelivered_snapshot_is_skipped():
+    seen = []
+    feed = RealtimeFeed("cp10", [seen.append])
+    feed._publish(snapshot("09:00", 50))
+    feed._publish(snapshot("09:00", 50))
+    assert len(seen) == 1
+
+
+def test_start_after_the_watch_loop_ended_keeps_the_thread(monkeypatch):
+    feed = RealtimeFeed("cp10")
+    watches = []
+    restarted = threading.Event()
+
+    def watch():
+        watches.append(1)
+        if len(watches) == 1:
+            # Asked to stop, and started again before this thread got to exit
+            feed.stop()
+            feed.start(keep_running=True)
+            restarted.set()
+        else:
+            feed.stop()
+    monkeypatch.setattr(feed, "_watch", watch)
+
+    feed.start()
+    thread = feed._thread
+    assert restarted.wait(5)
+    thread.join(5)
+    assert len(watches) == 2
+    assert feed._thread is None
@@ -0,0 +1,39 @@
+"""Which answers are replayed, and what a replay reports"""
+import json
+
+from api.services.response_cache import ResponseCache, ResponseRecording
+from api.utils.state import MemoryStateBackend
+
+FINISH = 'e:{"finishReason":"stop","usage":{"promptTokens":2318,"completionTokens":58},"isContinued":false}\n'
+STATUS = {"chiller_id": "chiller_1", "status": "running"}
+
+
+def recording(tool_calls=()):
+    recorded = ResponseRecording()
+    for name, result in tool_calls:
+        recorded.add_tool_call(name, '{"chiller_id": "chiller_1"}', result)
+    recorded.frames = ['0:"running"\n', FINISH]
+    return recorded
+
+
+def test_replay_reports_zero_usage():
+    cache = ResponseCache(MemoryStateBackend())
+    cache.store("key", recording([("get_chiller_status", STATUS)]))
+    frames = cache.lookup("key", {"get_chiller_status": lambda chiller_id: dict(STATUS)})
+    assert frames[0] == '0:"running"\n'
+    finish = json.loads(frames[1][2:])
+    assert finish["usage"] == {"promptTokens": 0, "completionTokens": 0}
+    assert finish["finishReason"] == "stop"
+
+
+def test_answers_without_tools_are_not_cached():
+    cache = ResponseCache(MemoryStateBackend())
+    assert not recording().cacheable
+    cache.store("key", recording())
+    assert cache.lookup("key", {}) is None
+
+
+def test_changed_tool_data_is_a_miss():
+    cache = ResponseCache(MemoryStateBackend())
+    cache.store("key", recording([("get_chiller_status", STATUS)]))
+    assert cache.lookup("key", {"get_chiller_status": lambda chiller_id: {**STATUS, "status": "off"}}) is None
@@ -0,0 +1,93 @@
+"""Minute-of-day bitmask schedules"""
+from datetime import datetime
+
+import pytest
+
+from api.utils.schedule_index import (
+    FULL_DAY_MASK,
+    MINUTES_PER_DAY,
+    CompiledProfile,
+    ScheduleIndex,
+    compile_entries,
+    mask_to_intervals,
+    parse_time,
+)
+
+SETTINGS = {
+    "profile": {
+        "weekday_profile": {
+            "normal_chiller": [{"start": "00:00", "stop": "06:00"}],
+            "excluded_chiller": {
+                "chiller_1": [{"start": "08:00", "stop": "18:00"}],
+                "chiller_2": [{"start": "17:00", "stop": "22:00"}],
+            },
+        },
+    },
+}
+
+
+def scheduled(entries, minute):
+    """Brute-force reference: whether any entry covers the minute"""
+    for entry in entries:
+        start, stop = parse_time(entry["start"]), parse_time(entry["stop"])
+        if start == stop or (start < stop and start <= minute < stop) or (start > stop and (minute >= start or minute < stop)):
+            return True
+    return False
+
+
+@pytest.mark.parametrize("entries", [
+    [{"start": "08:00", "stop": "18:00"}],
+    [{"start": "22:00", "stop": "06:00"}],
+    [{"start": "00:00", "stop": "00:00"}],
+    [{"start": "08:00", "stop": "09:30"}, {"start": "09:00", "stop": "12:15"}, {"start": "23:59", "stop": "00:01"}],
+])
+def test_mask_matches_the_entries_minute_by_minute(entries):
+    mask = compile_entries(entries)
+    assert [bool(mask >> minute & 1) for minute in range(MINUTES_PER_DAY)] == [scheduled(entries, minute) for minute in range(MINUTES_PER_DAY)]
+    assert compile_entries(mask_to_intervals(mask)) == mask
+
+
+def test_intervals_join_across_midnight():
+    assert mask_to_intervals(compile_entries([{"start": "22:00", "stop": "06:00"}])) == [{"start": "22:00", "stop": "06:00"}]
+    assert mask_to_intervals(FULL_DAY_MASK) == [{"start": "00:00", "stop": "00:00"}]
+
+
+def test_placeholders_compile_to_nothing():
+    assert compile_entries([{"start": None, "stop": None}, "08:00", None]) == 0
+
+
+def test_who_runs_with_overlaps_and_gaps():
+    index = ScheduleIndex()
+    index.load(SETTINGS)
+    result = index.who_runs(datetime(2024, 6, 10, 17, 30))  # a Monday
+    assert result["profile_type"] == "weekday_profile"
+    assert result["chillers"] == ["chiller_1", "chiller_2"]
+    assert result["overlaps"] == [{"chillers": ["chiller_1", "chiller_2"], "intervals": [{"start": "17:00", "stop": "18:00"}]}]
+    assert result["gaps"] == [{"start": "06:00", "stop": "08:00"}, {"start": "22:00", "stop": "00:00"}]
+    assert index.who_runs(datetime(2024, 6, 10, 3, 0))["chillers"] == ["normal"]
+
+
+def test_update_patches_the_lookup_table():
+    index = ScheduleIndex()
+    index.load(SETTINGS)
+    index.update("weekday_profile", "chiller_2", [{"start": "05:00", "stop": "09:00"}])
+    profile = index.profile("weekday_profile")
+
+    reference = CompiledProfile()
+    for chiller_id, entries in {
+        "chiller_1": [{"start": "08:00", "stop": "18:00"}],
+        "chiller_2": [{"start": "05:00", "stop": "09:00"}],
+        "normal": [{"start": "00:00", "stop": "06:00"}],
+    }.items():
+        reference.set_chiller(chiller_id, entries)
+    assert profile.running == reference.running
+    assert profile.overlap_intervals() == reference.overlap_intervals()
+    assert profile.gaps() == [{"start": "18:00", "stop": "00:00"}]
+
+
+def test_unknown_profile_is_one_gap():
+    index = ScheduleIndex()
+    index.load(SETTINGS)
+    result = index.who_runs(datetime(2024, 6, 10, 12, 0), "holiday_profile")
+    assert result["chillers"] == []
+    assert result["gaps"] == [{"start": "00:00", "stop": "00:00"}]
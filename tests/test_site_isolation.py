@@ -0,0 +1,124 @@
+"""Two sites on one MongoDB must never read or write each other's plant data"""
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import app
+from api.schemas.chiller import ScheduleChangeRequest
+from api.services.chiller import ChillerService
+from api.services.usage_ledger import ChatSession, build_entry
+from api.utils.clients import get_automation_collection, get_maintenance_collection, get_token_usage_collection, schedule_settings_id
+from api.utils.site import site_context
+from api.utils.tools import get_devices_under_maintenance, get_maintenance_status, get_schedule
+
+WEEKDAY = [{"start": "08:00", "stop": "18:00"}]
+EVENING = [{"start": "18:00", "stop": "22:00"}]
+
+
+def settings(site_id, schedule):
+    return {
+        "_id": schedule_settings_id(site_id),
+        "enable_schedule_control": True,
+        "profile": {"weekday_profile": {"normal_chiller": [], "excluded_chiller": {"chiller_1": schedule}}},
+    }
+
+
+def maintenance(device_id, under_maintenance, technician, site_id=None):
+    record = {
+        "device_id": device_id,
+        "timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "status": {"under_maintenance": under_maintenance},
+        "maintenance_history": [{"technician": technician}],
+    }
+    if site_id:
+        record["site_id"] = site_id
+    return record
+
+
+@pytest.fixture
+def two_sites(mongo):
+    automation = get_automation_collection()
+    automation.insert_one(settings("cp10", WEEKDAY))
+    automation.insert_one(settings("cp11", WEEKDAY))
+    records = get_maintenance_collection()
+    # Written before multi-site support, so it belongs to the default site
+    records.insert_one(maintenance("chiller_1", True, "cp10 technician"))
+    records.insert_one(maintenance("chiller_1", False, "cp11 technician", site_id="cp11"))
+    return mongo
+
+
+def change(old, new):
+    return ScheduleChangeRequest(chiller_id="chiller_1", profile_type="weekday_profile", old_schedule=old, new_schedule=new)
+
+
+def test_default_site_keeps_the_original_schedule_document():
+    assert schedule_settings_id("cp10") == "chiller_plant_schedule_setting"
+    assert schedule_settings_id("cp11") == "chiller_plant_schedule_setting:cp11"
+
+
+def test_schedule_change_only_touches_its_own_site(two_sites):
+    with site_context("cp11"):
+        response, status_code = asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING)))
+        assert status_code == 200, response
+        assert get_schedule("weekday_profile")["excluded_chiller"]["chiller_1"] == EVENING
+
+    with site_context("cp10"):
+        assert get_schedule("weekday_profile")["excluded_chiller"]["chiller_1"] == WEEKDAY
+
+
+def test_idempotency_keys_are_per_site(two_sites):
+    with site_context("cp10"):
+        _, status_code = asyncio.run(ChillerService.update_schedule(change(WEEKDAY, EVENING), "key-1"))
+        assert status_code == 200
+    with site_context("cp11"):
+        # Same key, different request body: a different change at another site, not a reuse
+        response, status_code = asyncio.run(ChillerService.update_schedule(change(WEEKDAY, WEEKDAY), "key-1"))
+        assert status_code == 200, response
+        assert "already up to date" in response.message
+
+
+def test_maintenance_status_is_per_site(two_sites):
+    with site_context("cp10"):
+        status = get_maintenance_status("chiller_1")
+        assert status["under_maintenance"] is True
+        assert status["technician"] == "cp10 technician"
+    with site_context("cp11"):
+        status = get_maintenance_status("chiller_1")
+        assert status["under_maintenance"] is False
+        assert status["technician"] == "cp11 technician"
+
+
+def test_bulk_maintenance_view_is_per_site(two_sites):
+    with site_context("cp10"):
+        assert [device["device_id"] for device in get_devices_under_maintenance()["devices"]] == ["chiller_1"]
+    with site_context("cp11"):
+        assert get_devices_under_maintenance()["devices"] == []
+
+
+def test_site_only_devices_are_unknown_elsewhere(two_sites):
+    with site_context("cp11"):
+        assert get_maintenance_status("chiller_9") is None
+    with site_context("cp10"):
+        assert get_maintenance_status("chiller_9")["exists"] is False
+
+
+def test_usage_ledger_is_per_site(mongo):
+    usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=50, total_tokens=1050)
+    recording = SimpleNamespace(usage=usage, tool_calls=[{"name": "get_chiller_status"}])
+    for site_id, chat_id, operator in (("cp10", "chat-a", "somchai"), ("cp11", "chat-b", "tanaka")):
+        get_token_usage_collection().insert_one(build_entry(
+            datetime.now(timezone.utc), None, site_id, ChatSession(chat_id, operator), "llm", [], None, recording
+        ))
+
+    client = TestClient(app)
+    for site_id, chat_id, operator in (("cp10", "chat-a", "somchai"), ("cp11", "chat-b", "tanaka")):
+        headers = {"x-site-id": site_id}
+        chats = client.get("/api/usage", params={"group_by": "chat"}, headers=headers).json()
+        assert [(row["chat"], row["prompt_tokens"]) for row in chats] == [(chat_id, 1000)]
+        operators = client.get("/api/usage", params={"group_by": "operator"}, headers=headers).json()
+        assert [row["operator"] for row in operators] == [operator]
+        other_chat = "chat-b" if chat_id == "chat-a" else "chat-a"
+        assert client.get("/api/usage", params={"group_by": "day", "chat_id": other_chat}, headers=headers).json() == []
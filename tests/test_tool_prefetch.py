@@ -0,0 +1,22 @@
+"""Read-only tools start once their streamed arguments are complete"""
+from api.services.tool_prefetch import ToolPrefetcher
+from api.utils.cancellation import CancelToken
+
+
+def prefetcher(calls):
+    return ToolPrefetcher({"get_chiller_status": lambda **kwargs: calls.append(kwargs) or kwargs}, CancelToken())
+
+
+def test_complete_object_is_prefetched_and_reused():
+    calls = []
+    tools = prefetcher(calls)
+    for fragment in ('{"chiller_', 'id": "chiller_1"', '}'):
+        tools.feed("call_1", "get_chiller_status", fragment)
+    assert tools.run("call_1", "get_chiller_status", '{"chiller_id": "chiller_1"}') == {"chiller_id": "chiller_1"}
+    assert calls == [{"chiller_id": "chiller_1"}]
+
+
+def test_non_object_arguments_are_not_prefetched():
+    tools = prefetcher([])
+    tools.feed("call_1", "get_chiller_status", '["chiller_1"]')
+    assert tools._prefetched == {}
@@ -0,0 +1,65 @@
+"""Model answers reach the usage ledger however they end"""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from api.services import openai as openai_service
+from api.services.openai import OpenAIService
+from api.services.usage_ledger import ChatSession, build_entry
+from api.utils.cancellation import CancelToken
+
+QUESTION = [{"role": "user", "content": "explain the plant kW/ton trend this week"}]
+USAGE = SimpleNamespace(prompt_tokens=1200, completion_tokens=40, total_tokens=1240)
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    entries = []
+    monkeypatch.setattr(openai_service.response_cache, "lookup", lambda key, tools: None)
+    monkeypatch.setattr(openai_service.response_cache, "store", lambda key, recording: None)
+    monkeypatch.setattr(
+        openai_service.usage_ledger, "record",
+        lambda session, source, messages, route=None, recording=None, status="completed": entries.append((source, recording, status))
+    )
+    return entries
+
+
+def completion(monkeypatch, fail=None):
+    def stream(messages, protocol, tools, recording, cancel_token, route, trace):
+        recording.usage = USAGE
+        yield '0:"ok"\n'
+        if fail:
+            raise fail
+        yield '0:"done"\n'
+    monkeypatch.setattr(OpenAIService, "_stream_completion", staticmethod(stream))
+
+
+def test_completed_answer(monkeypatch, ledger):
+    completion(monkeypatch)
+    list(OpenAIService.stream_text(QUESTION))
+    (source, recording, status), = ledger
+    assert (source, status, recording.usage) == ("llm", "completed", USAGE)
+
+
+def test_failed_answer_keeps_its_usage(monkeypatch, ledger):
+    completion(monkeypatch, fail=RuntimeError("upstream reset"))
+    with pytest.raises(RuntimeError):
+        list(OpenAIService.stream_text(QUESTION))
+    (_, recording, status), = ledger
+    assert (status, recording.usage) == ("error", USAGE)
+
+
+def test_closed_stream_is_cancelled(monkeypatch, ledger):
+    completion(monkeypatch)
+    frames = OpenAIService.stream_text(QUESTION, cancel_token=CancelToken())
+    next(frames)
+    frames.close()
+    (_, recording, status), = ledger
+    assert (status, recording.usage) == ("cancelled", USAGE)
+
+
+def test_entry_carries_the_status():
+    entry = build_entry(datetime(2024, 1, 1, tzinfo=timezone.utc), None, "cp10", ChatSession(), "llm", QUESTION, None, None, "cancelled")
+    assert entry["status"] == "cancelled"
+    assert entry["prompt_tokens"] == 0